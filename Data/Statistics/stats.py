@@ -1,4 +1,5 @@
-from Data.Clean.Major_Tunes import tunes
+from src.Generation.Cleaning import TuneStore
+tunes = TuneStore.read_dict('Data/Clean/Major_Tunes' + TuneStore.EXTENSION, columns=['abc'])
 import matplotlib.pyplot as plt
 
 frequency = {}
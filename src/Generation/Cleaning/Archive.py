@@ -0,0 +1,165 @@
+"""
+Archive packs a directory of small files, such as the cleaned abc data set, into a single file with an
+index of where each file starts. Reading it back memory maps the archive, so any file can be had by its
+name or tune id without opening anything else, and reading every file is one pass over the archive.
+
+    python -m src.Generation.Cleaning.Archive pack ../../Data/Clean/cleaned_data_abc
+    python -m src.Generation.Cleaning.Archive list ../../Data/Clean/cleaned_data_abc.pack
+    python -m src.Generation.Cleaning.Archive extract ../../Data/Clean/cleaned_data_abc.pack out_folder
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+from src.Generation.Cleaning import TuneStore
+
+EXTENSION = '.pack'
+MAGIC = b'GNRPACK1'
+# The magic bytes, then the offset and length of the index, which is written after the files
+HEADER = struct.Struct('<8sQQ')
+
+NUMBER_RE = re.compile(r'(\d+)')
+
+
+def sort_key(name):
+    # Numbered files in numerical order, as Reader.abc_files lists them
+    return [int(p) if p.isdigit() else p for p in NUMBER_RE.split(name)]
+
+
+def tune_id(name):
+    return os.path.splitext(name)[0]
+
+
+# region PACKING
+def pack(folder, fname=None):
+    """
+    Packs every file in a directory into an archive. The archive is written to a temporary file and
+    renamed into place once complete.
+    :param folder: The directory to pack
+    :param fname: The path of the archive, the directory's path with EXTENSION by default
+    :return: The path of the archive
+    """
+    fname = fname or os.path.normpath(folder) + EXTENSION
+    names = sorted([n for n in os.listdir(folder) if os.path.isfile(os.path.join(folder, n))], key=sort_key)
+    temp = fname + '.tmp'
+    try:
+        with open(temp, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, 0, 0))
+            files = []
+            for name in names:
+                with open(os.path.join(folder, name), 'rb') as f:
+                    data = f.read()
+                files.append([name, out.tell(), len(data)])
+                out.write(data)
+
+            index = json.dumps({'files': files}).encode('utf-8')
+            start = out.tell()
+            out.write(index)
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, start, len(index)))
+        TuneStore.fsync(temp)
+        os.replace(temp, fname)
+    finally:
+        if os.path.exists(temp): os.remove(temp)
+    return fname
+# endregion PACKING
+
+
+# region READING
+class PackedArchive:
+    """
+    An archive opened for reading. The files are slices of a memory map of the archive, so only the
+    pages which are read are loaded.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size or self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError('"{}" is not a packed archive'.format(fname))
+        _, start, length = HEADER.unpack_from(self.map, 0)
+
+        self.files = dict()
+        self.ids = dict()
+        for name, offset, size in json.loads(self.map[start:start + length].decode('utf-8'))['files']:
+            self.files[name] = (offset, size)
+            self.ids.setdefault(tune_id(name), []).append(name)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, name):
+        return name in self.files
+
+    def names(self):
+        """
+        :return: The names of the files, in the order they were packed
+        """
+        return list(self.files)
+
+    def read(self, name):
+        """
+        :return: The bytes of a file
+        """
+        offset, size = self.files[name]
+        return self.map[offset:offset + size]
+
+    def text(self, name):
+        return self.read(name).decode('utf-8', errors='replace')
+
+    def tune(self, number, extension='.abc'):
+        """
+        :param number: The tune id, the name of its files without the extension
+        :param extension: Which of the tune's files to read
+        :return: The text of the file
+        """
+        for name in self.ids.get(str(number), []):
+            if name.endswith(extension): return self.text(name)
+        raise KeyError('No "{}" file for tune {} in "{}"'.format(extension, number, self.fname))
+
+    def items(self, extensions=None):
+        """
+        Reads every file in the order they sit in the archive, which is a single sequential read.
+        :param extensions: Only read the files with one of these extensions, such as ('.abc', '.txt')
+        :return: A generator of (name, bytes) tuples
+        """
+        for name in self.files:
+            if extensions and not name.lower().endswith(tuple(extensions)): continue
+            yield name, self.read(name)
+
+    def extract(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        for name, data in self.items():
+            with open(os.path.join(folder, name), 'wb') as f: f.write(data)
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+# endregion READING
+
+
+if __name__ == '__main__':
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'pack':
+        out = pack(path, sys.argv[3] if len(sys.argv) > 3 else None)
+        with PackedArchive(out) as archive:
+            print('Packed {} files into "{}"'.format(len(archive), out))
+    elif command == 'list':
+        with PackedArchive(path) as archive:
+            for name in archive.names(): print('{:<20}{:>10}'.format(name, archive.files[name][1]))
+    elif command == 'extract':
+        with PackedArchive(path) as archive:
+            archive.extract(sys.argv[3])
+    else:
+        print('Unknown command "{}", expected "pack", "list" or "extract"'.format(command))
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from src.Generation.Cleaning import Archive, Reader
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.data = os.path.join(self.folder.name, 'data')
+        os.mkdir(self.data)
+        self.files = {'10.abc': 'T: Cleaned\nK: G\nABcd|\n\nT: Cleaned\nK: Em\nEFGA|\n', '10.txt': '',
+                      '2.abc': 'X:1\nT: Ríl\nK:D\nDEFG|\n', '2.txt': 'X:1\nK:D\nDEFG|\n', 'notes.md': 'K:D\nDEFG|\n'}
+        for name, text in self.files.items():
+            with open(os.path.join(self.data, name), 'w', encoding='utf-8') as f: f.write(text)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_pack(self):
+        fname = Archive.pack(self.data)
+        self.assertEqual(self.data + Archive.EXTENSION, fname)
+        with Archive.PackedArchive(fname) as archive:
+            self.assertEqual(['2.abc', '2.txt', '10.abc', '10.txt', 'notes.md'], archive.names())
+            self.assertEqual(self.files['2.abc'], archive.tune(2))
+            self.assertEqual('', archive.tune('10', '.txt'))
+            self.assertEqual(self.files['notes.md'].encode('utf-8'), archive.read('notes.md'))
+            self.assertEqual(['2.txt', '10.txt'], [name for name, _ in archive.items(['.txt'])])
+            with self.assertRaises(KeyError):
+                archive.tune(3)
+
+            out = os.path.join(self.folder.name, 'out')
+            archive.extract(out)
+        self.assertEqual(sorted(self.files), sorted(os.listdir(out)))
+        self.assertEqual(['data', 'data.pack', 'out'], sorted(os.listdir(self.folder.name)))
+
+    def test_reader(self):
+        # An archive reads as the same tunes as the directory it was packed from
+        packed = list(Reader.read_tunes(Archive.pack(self.data)))
+        tunes = list(Reader.read_tunes(self.data))
+        self.assertEqual(['2.abc:1', '2.txt:1', '10.abc:0', '10.abc:1'], [t['setting'] for t in packed])
+        self.assertEqual([{k: v for k, v in t.items() if k != 'source'} for t in tunes],
+                         [{k: v for k, v in t.items() if k != 'source'} for t in packed])
+
+    def test_not_archive(self):
+        fname = os.path.join(self.folder.name, 'data', '2.abc')
+        with self.assertRaises(ValueError):
+            Archive.PackedArchive(fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,307 @@
+"""
+Benchmark times each stage of the cleaner separately, over the cleaned Session tunes, the raw Session tunes
+when they have been downloaded, and a larger synthetic corpus of raw looking tunes built from the cleaned ones.
+The results are written as JSON, so the numbers of two commits can be compared.
+With --workers, clean_many is also timed over each corpus with each number of processes, to show how it scales.
+
+    python -m src.Generation.Cleaning.Benchmark --out new.json --compare old.json
+    python -m src.Generation.Cleaning.Benchmark --corpora synthetic --workers 1 2 4 8
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from src.Generation.Cleaning import Cleaner, Duration, Ingest, Lexer, TuneStore
+
+DATA_FOLDER = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'Data'))
+CLEAN_FILE = os.path.join(DATA_FOLDER, 'Clean', 'Major_Tunes' + TuneStore.EXTENSION)
+OUT_FILE = os.path.join(DATA_FOLDER, 'Statistics', 'Cleaner_Benchmark.json')
+
+CORPORA = ['clean', 'raw', 'synthetic']
+WARMUP = 1
+REPEAT = 5
+# How many times larger the synthetic corpus is than the cleaned one
+SYNTHETIC_COPIES = 4
+SEED = 0
+# A stage is flagged when its median time grows by more than this fraction
+THRESHOLD = 0.10
+PERCENTILES = [50, 90, 99]
+
+# The memoised helpers, which are emptied before every repetition so each one starts cold
+CACHES = [Lexer.note_length, Cleaner.lex_bar, Cleaner.clean_barline, Duration.parse, Duration.to_length,
+          Duration.bar_length]
+
+NOTE_RE = re.compile(r"([_=^]*[a-gzA-G][,']*)(\d*/?\d*)")
+
+
+# region CORPORA
+def load_tunes(fname):
+    """
+    :return: A list of the tune dictionaries in a tune store, or None if the file doesn't exist
+    """
+    if not os.path.exists(fname): return None
+    return TuneStore.read(fname)
+
+
+def humanize_bar(bar, rng):
+    """
+    Adds the ornaments, triplets, swing, ties and spacing which the cleaner strips out to a cleaned bar
+    """
+    notes = NOTE_RE.findall(bar)
+    out = []
+    x = 0
+    while x < len(notes):
+        note, length = notes[x]
+        r = rng.random()
+        if r < 0.04 and length == '2':
+            out.append('(3' + note * 3)
+        elif r < 0.08 and length == '' and x + 1 < len(notes) and notes[x + 1][1] == '':
+            out.append(note + rng.choice('><') + notes[x + 1][0])
+            x += 1
+        elif r < 0.10 and length == '4':
+            out.append(note + '2-' + note + '2')
+        elif r < 0.12:
+            out.append('~' + note + length)
+        elif r < 0.13:
+            out.append('{' + rng.choice('gaeAB') + '}' + note + length)
+        elif r < 0.14:
+            out.append('"' + rng.choice(['G', 'D', 'Am', 'Em7']) + '"' + note + length)
+        elif r < 0.15:
+            out.append('!trill!' + note + length)
+        else:
+            out.append(note + length)
+        if rng.random() < 0.3: out.append(' ')
+        x += 1
+    return ''.join(out)
+
+
+def make_raw(abc, rng):
+    """
+    Turns a cleaned abc string back into something which looks like a raw Session tune,
+    folding every 16 bars into a repeated 8 bar part with first and second endings.
+    """
+    bars = [b for b in abc.split('|') if b]
+    out = []
+    for x in range(0, len(bars), 16):
+        part = [humanize_bar(b, rng) for b in bars[x:x + 8]]
+        style = rng.random()
+        if style < 0.4 and len(part) >= 4:
+            out.append('|:' + '|'.join(part[:-1]) + '|1 ' + part[-1] + ':|2 ' + part[-1] + '||')
+        elif style < 0.8:
+            out.append('|:' + '|'.join(part) + ':|')
+        else:
+            out.append('|'.join(part) + '|' + '|'.join(part) + '||')
+        if rng.random() < 0.3: out.append('\r\n')
+    return ''.join(out)
+
+
+def load_corpora(names, limit=None):
+    """
+    :param names: The corpora to load, from CORPORA
+    :param limit: An optional cap on the number of tunes in each corpus
+    :return: A dictionary of corpus names to lists of (abc, tune_id, meter) tuples
+    """
+    clean = load_tunes(CLEAN_FILE) or []
+    corpora = dict()
+    for name in names:
+        if name == 'clean':
+            tunes = clean
+        elif name == 'raw':
+            if not os.path.exists(Ingest.RAW_STORE):
+                print('Raw tunes not found at "{}", skipping. Run Ingest to download them.'.format(Ingest.RAW_STORE))
+                continue
+            tunes = Ingest.read_store(columns=['abc', 'setting', 'meter'])
+        else:
+            rng = random.Random(SEED)
+            tunes = [dict(t, abc=make_raw(t['abc'], rng)) for _ in range(SYNTHETIC_COPIES) for t in clean]
+        corpora[name] = [(t['abc'], t['setting'], t.get('meter', Cleaner.DEFAULT_METER)) for t in tunes][:limit]
+    return corpora
+# endregion CORPORA
+
+
+# region TIMING
+def clear_caches():
+    for cache in CACHES: cache.cache_clear()
+
+
+def stage_inputs(tunes):
+    """
+    Runs each tune through the cleaner once, keeping the input each stage saw.
+    Tunes drop out at the stage which rejects them, as they do when cleaning.
+    :param tunes: A list of (abc, tune_id, meter) tuples
+    :return: A dictionary of stage names to lists of (function, input) tuples
+    """
+    inputs = dict()
+    for abc, tune_id, meter in tunes:
+        cleaner = Cleaner.meter_cleaner(meter)
+        if isinstance(cleaner, Cleaner.CleanResult): continue
+        cleaned = abc
+        for name, stage in cleaner.stages(tune_id):
+            inputs.setdefault(name, []).append((stage, cleaned))
+            cleaned = stage(cleaned)
+            if isinstance(cleaned, str): break
+    return inputs
+
+
+def time_calls(calls, warmup=WARMUP, repeat=REPEAT, cold=True):
+    """
+    Times a list of calls, after some untimed warmup runs.
+    :param calls: A list of (function, argument) tuples
+    :param cold: Flag to empty the memoised helpers before every repetition
+    :return: A dictionary of timings, with the totals in seconds and the percentiles of single calls in microseconds
+    """
+    clock = time.perf_counter
+    for _ in range(warmup):
+        for function, argument in calls: function(argument)
+
+    totals = []
+    singles = []
+    for _ in range(repeat):
+        if cold: clear_caches()
+        total = 0.0
+        for function, argument in calls:
+            start = clock()
+            function(argument)
+            seconds = clock() - start
+            total += seconds
+            singles.append(seconds)
+        totals.append(total)
+
+    singles.sort()
+    timing = {'calls': len(calls), 'median': statistics.median(totals), 'min': min(totals), 'max': max(totals)}
+    for p in PERCENTILES:
+        timing['p{}_us'.format(p)] = 1e6 * singles[min(len(singles) - 1, len(singles) * p // 100)] if singles else 0.0
+    return timing
+
+
+def benchmark(corpora, warmup=WARMUP, repeat=REPEAT, cold=True):
+    """
+    Times every stage of the cleaner, and the whole of clean_tune, over each corpus.
+    :return: A dictionary of corpus names to dictionaries of stage names to timings
+    """
+    results = dict()
+    for name, tunes in corpora.items():
+        print('Timing {} tunes of the {} corpus...'.format(len(tunes), name))
+        results[name] = {stage: time_calls(calls, warmup, repeat, cold)
+                         for stage, calls in stage_inputs(tunes).items()}
+        whole = [(lambda tune: Cleaner.clean_tune(tune[0], tune[1], meter=tune[2]), tune) for tune in tunes]
+        results[name]['clean_tune'] = time_calls(whole, warmup, repeat, cold)
+    return results
+
+
+def scaling(corpora, workers, repeat=REPEAT):
+    """
+    Times clean_many over each corpus with each number of processes.
+    Worker counts above the number of cores are still timed, but can't be expected to be any faster.
+    :param workers: A list of process counts
+    :return: A dictionary of corpus names to dictionaries of process counts to timings,
+    with the speedup relative to the first process count
+    """
+    results = dict()
+    for name, tunes in corpora.items():
+        print('Timing clean_many over {} tunes of the {} corpus...'.format(len(tunes), name))
+        results[name] = dict()
+        for count in workers:
+            totals = []
+            for _ in range(repeat):
+                clear_caches()
+                start = time.perf_counter()
+                Cleaner.clean_many(tunes, workers=count)
+                totals.append(time.perf_counter() - start)
+            median = statistics.median(totals)
+            results[name][str(count)] = {'median': median, 'tunes_per_s': len(tunes) / max(median, 1e-9)}
+        first = results[name][str(workers[0])]['median']
+        for t in results[name].values(): t['speedup'] = first / max(t['median'], 1e-9)
+    return results
+
+
+def metadata(warmup, repeat, cold):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'cleaner_version': Cleaner.VERSION, 'python': platform.python_version(),
+            'machine': platform.machine(), 'cpu_count': os.cpu_count(), 'created': str(datetime.now()), 'warmup': warmup, 'repeat': repeat,
+            'cold': cold, 'synthetic_copies': SYNTHETIC_COPIES, 'seed': SEED}
+# endregion TIMING
+
+
+# region REPORTING
+def print_results(results):
+    for corpus, stages in results.items():
+        print('\n{} corpus'.format(corpus))
+        print('{:<14}{:>8}{:>12}{:>12}{:>11}{:>11}{:>11}'.format(
+            'Stage', 'Calls', 'Median ms', 'Min ms', 'p50 us', 'p90 us', 'p99 us'))
+        for stage, t in stages.items():
+            print('{:<14}{:>8}{:>12.2f}{:>12.2f}{:>11.1f}{:>11.1f}{:>11.1f}'.format(
+                stage, t['calls'], 1e3 * t['median'], 1e3 * t['min'], t['p50_us'], t['p90_us'], t['p99_us']))
+
+
+def print_scaling(results):
+    for corpus, counts in results.items():
+        print('\n{} corpus, clean_many on {} cores'.format(corpus, os.cpu_count()))
+        print('{:<10}{:>12}{:>10}{:>10}'.format('Workers', 'Median s', 'Tunes/s', 'Speedup'))
+        for count, t in counts.items():
+            print('{:<10}{:>12.2f}{:>10.0f}{:>10.2f}'.format(count, t['median'], t['tunes_per_s'], t['speedup']))
+
+
+def compare(old, new, threshold=THRESHOLD):
+    """
+    Compares the median times of two benchmark results, printing the change for every stage they share.
+    :return: A list of (corpus, stage, ratio) tuples for the stages which slowed down by more than threshold
+    """
+    regressions = []
+    print('\nCompared with {} (threshold {:.0%})'.format(old['meta'].get('commit') or 'baseline', threshold))
+    for corpus, stages in new['results'].items():
+        for stage, t in stages.items():
+            before = old['results'].get(corpus, {}).get(stage)
+            if not before or not before['median']: continue
+            ratio = t['median'] / before['median']
+            flag = ''
+            if ratio > 1 + threshold:
+                regressions.append((corpus, stage, ratio))
+                flag = '  REGRESSION'
+            print('{:<12}{:<14}{:>10.2f}ms -> {:>8.2f}ms {:>+8.1%}{}'.format(
+                corpus, stage, 1e3 * before['median'], 1e3 * t['median'], ratio - 1, flag))
+    return regressions
+# endregion REPORTING
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times each stage of the cleaner.')
+    parser.add_argument('--corpora', nargs='+', choices=CORPORA, default=CORPORA)
+    parser.add_argument('--limit', type=int, help='The most tunes to take from each corpus')
+    parser.add_argument('--warmup', type=int, default=WARMUP)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--warm', action='store_true', help='Keep the memoised helpers between repetitions')
+    parser.add_argument('--out', default=OUT_FILE, help='The JSON file to write the results to')
+    parser.add_argument('--compare', help='An earlier JSON file to check for regressions against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--workers', nargs='+', type=int, help='Also time clean_many with these numbers of processes')
+    args = parser.parse_args()
+
+    corpora = load_corpora(args.corpora, args.limit)
+    results = {'meta': metadata(args.warmup, args.repeat, not args.warm),
+               'results': benchmark(corpora, args.warmup, args.repeat, not args.warm)}
+    print_results(results['results'])
+    if args.workers:
+        results['scaling'] = scaling(corpora, args.workers, args.repeat)
+        print_scaling(results['scaling'])
+
+    if os.path.dirname(args.out): os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, 'w') as f: json.dump(results, f, indent=2)
+    print('\nResults written to "{}"'.format(args.out))
+
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+        if compare(baseline, results, args.threshold): sys.exit(1)
@@ -0,0 +1,192 @@
+"""
+Cache keeps the results of cleaning tunes in an SQLite file, keyed by a hash of the raw abc string
+and the cleaner's settings, so that unchanged tunes aren't cleaned again on the next run.
+
+    python -m src.Generation.Cleaning.Cache stats [path]
+    python -m src.Generation.Cleaning.Cache clear [path]
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from itertools import repeat
+
+from src.Generation.Cleaning import Cleaner, NoteArray
+
+CACHE_FILE = '../../Data/Cache/Cleaned_Tunes.sqlite'
+# The size of the cached abc strings is capped, the least recently used are evicted first
+MAX_BYTES = 256 * 2 ** 20
+
+# SQLite limits the number of parameters in a single query
+QUERY_CHUNK = 500
+
+
+class TuneCache:
+    def __init__(self, path=CACHE_FILE, max_bytes=MAX_BYTES):
+        """
+        :param path: The SQLite file to keep the cache in, which is created if needed
+        :param max_bytes: The total size of the cached abc strings to keep
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS tunes (
+                key TEXT PRIMARY KEY, status TEXT, abc TEXT, reason TEXT, stage TEXT,
+                size INTEGER, used INTEGER);
+            CREATE INDEX IF NOT EXISTS tunes_used ON tunes (used);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER);
+            INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0);''')
+        self.db.commit()
+
+        # Every read or write takes the next tick, which orders the entries by when they were last used
+        self.tick = self.db.execute('SELECT COALESCE(MAX(used), 0) FROM tunes').fetchone()[0]
+        self.salt = json.dumps(Cleaner.parameters(), sort_keys=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def key(self, abc, meter=Cleaner.DEFAULT_METER):
+        """
+        Hashes the raw abc string and its meter along with the cleaner's version and settings
+        """
+        return hashlib.sha256('\n'.join((self.salt, meter, abc)).encode('utf-8')).hexdigest()
+
+    def get_many(self, abcs, meters=None):
+        """
+        Looks up the cleaned results of a list of raw abc strings.
+        :param abcs: A list of raw abc strings
+        :param meters: The matching list of meters, defaults to 4/4 for every string
+        :return: A list of CleanResults, with None for the strings which aren't cached
+        """
+        keys = [self.key(abc, meter) for abc, meter in zip(abcs, meters or repeat(Cleaner.DEFAULT_METER))]
+        found = dict()
+        for i in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[i:i + QUERY_CHUNK]
+            rows = self.db.execute('SELECT key, status, abc, reason, stage FROM tunes WHERE key IN ({})'
+                                   .format(','.join('?' * len(chunk))), chunk)
+            for key, status, abc, reason, stage in rows:
+                found[key] = Cleaner.CleanResult(status, abc, Cleaner.Reason(reason) if reason else None, stage)
+
+        # The hits are marked used in the order they were asked for
+        hits = [key for key in dict.fromkeys(keys) if key in found]
+        self.db.executemany('UPDATE tunes SET used = ? WHERE key = ?',
+                            [(self.tick + x, key) for x, key in enumerate(hits, 1)])
+        self.tick += len(hits)
+        self.count('hits', len(found))
+        self.count('misses', len(keys) - len(found))
+        self.db.commit()
+        return [found.get(key) for key in keys]
+
+    def put_many(self, abcs, results, meters=None):
+        """
+        Adds the cleaned results of a list of raw abc strings, then evicts old entries if the cache is too large.
+        :param abcs: A list of raw abc strings
+        :param results: The matching list of CleanResults
+        :param meters: The matching list of meters, defaults to 4/4 for every string
+        """
+        # Each row takes its own tick, so the start of a large batch can be evicted without the rest of it
+        rows = [(self.key(abc, meter), r.status, r.abc, r.reason.value if r.reason else None, r.stage, len(r.abc),
+                 self.tick + x) for x, (abc, r, meter) in
+                enumerate(zip(abcs, results, meters or repeat(Cleaner.DEFAULT_METER)), 1)]
+        self.tick += len(rows)
+        self.db.executemany('INSERT OR REPLACE INTO tunes VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes
+        """
+        size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM tunes').fetchone()[0]
+        if size <= self.max_bytes: return
+
+        # Walk from the least recently used, stopping as soon as enough has been found
+        excess = size - self.max_bytes
+        evicted = 0
+        keys = []
+        for key, total in self.db.execute('SELECT key, size FROM tunes ORDER BY used, key'):
+            keys.append(key)
+            evicted += total
+            if evicted >= excess: break
+
+        for i in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[i:i + QUERY_CHUNK]
+            self.db.execute('DELETE FROM tunes WHERE key IN ({})'.format(','.join('?' * len(chunk))), chunk)
+        self.count('evictions', len(keys))
+
+    def count(self, name, amount):
+        self.db.execute('UPDATE stats SET value = value + ? WHERE name = ?', (amount, name))
+
+    def clean_many(self, tunes, workers=None, chunksize=256, verbose=False, profile=None, notes=False):
+        """
+        Cleans a batch of tunes, only cleaning the ones which aren't already cached.
+        Takes the same parameters as Cleaner.clean_many.
+        :return: A list of CleanResults, in the same order as tunes. With notes, the list of CleanResults and the
+        matching list of NoteArrays, which are built from the cleaned abc for the cached tunes.
+        """
+        tunes = list(tunes)
+        meters = [meter[0] if meter else Cleaner.DEFAULT_METER for abc, tune_id, *meter in tunes]
+        results = self.get_many([tune[0] for tune in tunes], meters)
+        missing = [x for x, r in enumerate(results) if r is None]
+        if verbose: print('{}/{} tunes found in the cache.'.format(len(tunes) - len(missing), len(tunes)))
+
+        cleaned = Cleaner.clean_many([tunes[x] for x in missing], workers=workers, chunksize=chunksize,
+                                     verbose=verbose, profile=profile, notes=notes)
+        if notes: cleaned, built = cleaned
+        for x, result in zip(missing, cleaned): results[x] = result
+        self.put_many([tunes[x][0] for x in missing], cleaned, [meters[x] for x in missing])
+        if not notes: return results
+
+        arrays = [NoteArray.from_abc(r.abc) if r.status == Cleaner.CLEANED else None for r in results]
+        for x, array in zip(missing, built): arrays[x] = array
+        return results, arrays
+
+    def stats(self):
+        """
+        :return: A dictionary of the hit, miss and eviction counts, along with the current entries and size
+        """
+        stats = dict(self.db.execute('SELECT name, value FROM stats'))
+        stats['entries'], stats['bytes'] = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tunes').fetchone()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """
+        Removes every entry, and resets the statistics
+        """
+        self.db.execute('DELETE FROM tunes')
+        self.db.execute('UPDATE stats SET value = 0')
+        self.db.commit()
+
+
+def print_stats(stats):
+    print('Entries:   {}'.format(stats['entries']))
+    print('Size:      {:.1f} MB'.format(stats['bytes'] / 2 ** 20))
+    print('Hits:      {}'.format(stats['hits']))
+    print('Misses:    {}'.format(stats['misses']))
+    print('Hit rate:  {:.1%}'.format(stats['hit_rate']))
+    print('Evictions: {}'.format(stats['evictions']))
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    with TuneCache(sys.argv[2] if len(sys.argv) > 2 else CACHE_FILE) as cache:
+        if command == 'stats':
+            print_stats(cache.stats())
+        elif command == 'clear':
+            cache.clear()
+            print('Cache cleared.')
+        else:
+            print('Unknown command "{}", expected "stats" or "clear"'.format(command))
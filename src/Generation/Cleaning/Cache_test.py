@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from src.Generation.Cleaning import Cache, Cleaner
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'cache.sqlite')
+        self.tunes = [("|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|" * 4, '1'),
+                      ('A|B|C|D||', '2'),
+                      ('M:4/4|A|B|C|D||', '3')]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_hits(self):
+        serial = [Cleaner.clean_tune(abc, tune_id) for abc, tune_id in self.tunes]
+        with Cache.TuneCache(self.path) as cache:
+            self.assertEqual(serial, cache.clean_many(self.tunes, workers=1))
+            self.assertEqual((0, 3), (cache.stats()['hits'], cache.stats()['misses']))
+
+        # The results survive between runs
+        with Cache.TuneCache(self.path) as cache:
+            self.assertEqual(serial, cache.clean_many(self.tunes, workers=1))
+            self.assertEqual((3, 3, 3), (cache.stats()['hits'], cache.stats()['misses'], cache.stats()['entries']))
+
+    def test_notes(self):
+        serial = [Cleaner.clean_notes(abc, tune_id) for abc, tune_id in self.tunes]
+        with Cache.TuneCache(self.path) as cache:
+            cache.clean_many(self.tunes[:1], workers=1)
+            # The cached tune's notes are built from its cleaned abc, the others' by the cleaner
+            results, arrays = cache.clean_many(self.tunes, workers=1, notes=True)
+            self.assertEqual([r for r, _ in serial], results)
+            self.assertEqual([repr(a) for _, a in serial], list(map(repr, arrays)))
+            self.assertEqual((1, 3), (cache.stats()['hits'], cache.stats()['misses']))
+
+    def test_version(self):
+        with Cache.TuneCache(self.path) as cache:
+            cache.clean_many(self.tunes, workers=1)
+        with mock.patch.object(Cleaner, 'VERSION', Cleaner.VERSION + 1), Cache.TuneCache(self.path) as cache:
+            self.assertEqual([None] * 3, cache.get_many([abc for abc, tune_id in self.tunes]))
+
+    def test_eviction(self):
+        # Room for the first tune and one rejection
+        size = len(Cleaner.clean_tune(self.tunes[0][0]).abc) + len('!!BAD ABC!!')
+        with Cache.TuneCache(self.path, max_bytes=size) as cache:
+            cache.clean_many(self.tunes[:1], workers=1)
+            cache.clean_many(self.tunes[1:], workers=1)
+            # The first tune is the least recently used, so it is the one to go
+            found = cache.get_many([abc for abc, tune_id in self.tunes])
+            self.assertEqual([False, True, True], [r is not None for r in found])
+            self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_eviction_within_batch(self):
+        # Each rejection takes 11 bytes, so a batch of three only has to lose its first
+        tunes = [('A|B||', '1'), ('C|D||', '2'), ('E|F||', '3')]
+        with Cache.TuneCache(self.path, max_bytes=2 * len('!!BAD ABC!!')) as cache:
+            cache.clean_many(tunes, workers=1)
+            found = cache.get_many([abc for abc, tune_id in tunes])
+            self.assertEqual([False, True, True], [r is not None for r in found])
+            self.assertEqual((1, 2), (cache.stats()['evictions'], cache.stats()['entries']))
+
+            # The hits were used in order too, so the next tune pushes out the older of the two
+            cache.clean_many([('G|A||', '4')], workers=1)
+            found = cache.get_many([abc for abc, tune_id in tunes[1:]])
+            self.assertEqual([False, True], [r is not None for r in found])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Catalog indexes the raw tune store in SQLite, by tune, setting, type, meter, mode and scale, along with
+whether the cleaner kept or rejected each tune. A subset such as every major reel is then found with a
+query, and tunes the cleaner already rejected can be left out, without scanning the whole store.
+
+    python -m src.Generation.Cleaning.Catalog [path]
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+
+from src.Generation.Cleaning import Cleaner, Ingest, TuneStore
+
+CATALOG_FILE = '../../Data/Cache/Catalog.sqlite'
+INDEXED = ['tune', 'setting', 'number', 'type', 'meter', 'mode', 'scale', 'status']
+
+# The scale of a mode such as 'Dmajor' or 'F#dorian'
+SCALE_RE = re.compile(r'[A-G][#b]?(.*)')
+
+
+def scale(mode):
+    match = SCALE_RE.match(mode)
+    return match.group(1) if match else ''
+
+
+def digest(abc):
+    return hashlib.sha1(abc.encode('utf-8')).hexdigest()
+
+
+class TuneCatalog:
+    def __init__(self, path=CATALOG_FILE):
+        """
+        :param path: The SQLite file to keep the catalog in, which is created if needed
+        """
+        self.path = path
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS tunes (
+                row INTEGER PRIMARY KEY, tune TEXT, setting TEXT, number INTEGER, type TEXT, meter TEXT,
+                mode TEXT, scale TEXT, digest TEXT, status TEXT, reason TEXT, salt TEXT);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);''')
+        for column in INDEXED:
+            self.db.execute('CREATE INDEX IF NOT EXISTS tunes_{0} ON tunes ({0})'.format(column))
+        self.db.commit()
+
+        # A status is only trusted if the tune was cleaned by the current version and settings
+        self.salt = json.dumps(Cleaner.parameters(), sort_keys=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM tunes').fetchone()[0]
+
+    def update(self, store=Ingest.RAW_STORE):
+        """
+        Indexes the tunes of a store, if it has changed since it was last indexed. The cleaner's verdict
+        on a tune is kept as long as its abc is unchanged.
+        :param store: The path of a TuneStore of raw tunes
+        :return: True if the catalog was rebuilt
+        """
+        info = os.stat(store)
+        signature = json.dumps([os.path.abspath(store), info.st_size, info.st_mtime_ns])
+        if dict(self.db.execute('SELECT name, value FROM meta')).get('store') == signature: return False
+
+        with TuneStore.TuneStore(store) as tunes:
+            columns = {c: tunes.column(c) if c in tunes.columns else [''] * len(tunes)
+                       for c in ['tune', 'setting', 'type', 'meter', 'mode']}
+            digests = [digest(abc) for abc in tunes.column('abc')]
+
+        query = 'SELECT setting, digest, status, reason, salt FROM tunes WHERE status IS NOT NULL'
+        known = {(setting, d): (status, reason, salt) for setting, d, status, reason, salt in self.db.execute(query)}
+        rows = []
+        for row, values in enumerate(zip(*columns.values(), digests)):
+            tune, setting, kind, meter, mode, d = values
+            number = int(setting) if setting.isdigit() else None
+            rows.append((row, tune, setting, number, kind, meter, mode, scale(mode), d)
+                        + known.get((setting, d), (None, None, None)))
+
+        self.db.execute('DELETE FROM tunes')
+        self.db.executemany('INSERT INTO tunes VALUES ({})'.format(','.join('?' * 12)), rows)
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('store', signature))
+        self.db.commit()
+        return True
+
+    def select(self, types=None, meters=None, modes=None, scales=None, status=None, skip_rejected=False):
+        """
+        Finds the tunes which fit the parameters. An empty or None list allows every value.
+        :param types: A list of tune types, such as ['reel', 'hornpipe']
+        :param meters: A list of meters, such as ['4/4']
+        :param modes: A list of modes, such as ['Dmajor', 'Gmajor']
+        :param scales: A list of scales, such as ['major'] for tunes in any major key
+        :param status: Only take the tunes the current cleaner left with this status, Cleaner.CLEANED or REJECTED
+        :param skip_rejected: Flag to leave out the tunes the current cleaner rejected
+        :return: A list of the rows of the tunes in the store, in order of setting
+        """
+        where, params = [], []
+        for column, values in [('type', types), ('meter', meters), ('mode', modes), ('scale', scales)]:
+            if not values: continue
+            where.append('{} IN ({})'.format(column, ','.join('?' * len(values))))
+            params += list(values)
+        if status:
+            where.append('status = ? AND salt = ?')
+            params += [status, self.salt]
+        if skip_rejected:
+            where.append('NOT (status IS ? AND salt IS ?)')
+            params += [Cleaner.REJECTED, self.salt]
+
+        query = 'SELECT row FROM tunes {} ORDER BY number, setting'
+        return [row for row, in self.db.execute(query.format('WHERE ' + ' AND '.join(where) if where else ''), params)]
+
+    def mark(self, settings, results):
+        """
+        Records the cleaner's verdict on a list of tunes.
+        :param settings: A list of the settings of the tunes
+        :param results: The matching list of CleanResults
+        """
+        self.db.executemany('UPDATE tunes SET status = ?, reason = ?, salt = ? WHERE setting = ?',
+                            [(r.status, r.reason.value if r.reason else None, self.salt, setting)
+                             for setting, r in zip(settings, results)])
+        self.db.commit()
+
+    def counts(self, column):
+        """
+        :param column: One of the indexed columns, such as 'type'
+        :return: A dictionary of the column's values to the number of tunes with each
+        """
+        if column not in INDEXED: raise ValueError('"{}" is not one of {}'.format(column, INDEXED))
+        query = 'SELECT {0}, COUNT(*) FROM tunes GROUP BY {0} ORDER BY COUNT(*) DESC'.format(column)
+        return dict(self.db.execute(query))
+
+
+if __name__ == '__main__':
+    with TuneCatalog(sys.argv[1] if len(sys.argv) > 1 else CATALOG_FILE) as catalog:
+        if catalog.update(): print('Catalog rebuilt from "{}"'.format(Ingest.RAW_STORE))
+        print('{} tunes'.format(len(catalog)))
+        for column in ['type', 'meter', 'scale', 'status']:
+            print('\n' + column.upper())
+            for value, count in list(catalog.counts(column).items())[:10]:
+                print('{:<14}{:>8}'.format(str(value), count))
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from src.Generation.Cleaning import Catalog, Cleaner, TuneStore
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.folder.name, 'raw.npz')
+        self.path = os.path.join(self.folder.name, 'catalog.sqlite')
+        good = '|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|' * 4
+        self.tunes = [{'tune': '1', 'setting': '10', 'type': 'reel', 'meter': '4/4', 'mode': 'Gmajor', 'abc': good},
+                      {'tune': '1', 'setting': '9', 'type': 'reel', 'meter': '4/4', 'mode': 'Ddorian', 'abc': good},
+                      {'tune': '2', 'setting': '3', 'type': 'jig', 'meter': '6/8', 'mode': 'F#major', 'abc': 'A|B||'},
+                      {'tune': '3', 'setting': '4', 'type': 'reel', 'meter': '4/4', 'mode': 'Bbmajor', 'abc': 'A|B||'}]
+        TuneStore.write(self.tunes, self.store)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_select(self):
+        with Catalog.TuneCatalog(self.path) as catalog:
+            self.assertTrue(catalog.update(self.store))
+            self.assertFalse(catalog.update(self.store))
+            # Every major reel, in order of setting
+            self.assertEqual([3, 0], catalog.select(types=['reel'], scales=['major']))
+            self.assertEqual([2, 3, 1, 0], catalog.select())
+            self.assertEqual([2], catalog.select(meters=['6/8'], modes=['F#major', 'Gmajor']))
+            self.assertEqual({'major': 3, 'dorian': 1}, catalog.counts('scale'))
+            with self.assertRaises(ValueError): catalog.counts('abc')
+
+    def test_status(self):
+        with Catalog.TuneCatalog(self.path) as catalog:
+            catalog.update(self.store)
+            settings = [t['setting'] for t in self.tunes]
+            catalog.mark(settings, [Cleaner.clean_tune(t['abc'], t['setting']) for t in self.tunes])
+            self.assertEqual([1, 0], catalog.select(status=Cleaner.CLEANED))
+            self.assertEqual([1, 0], catalog.select(skip_rejected=True))
+            self.assertEqual([0], catalog.select(modes=['Gmajor'], skip_rejected=True))
+
+        # A new dump keeps the verdicts on the tunes whose abc didn't change
+        self.tunes[1]['abc'] = 'A|B||'
+        self.tunes.append({'tune': '5', 'setting': '11', 'type': 'reel', 'meter': '4/4', 'mode': 'Gmajor', 'abc': ''})
+        TuneStore.write(self.tunes, self.store)
+        with Catalog.TuneCatalog(self.path) as catalog:
+            self.assertTrue(catalog.update(self.store))
+            self.assertEqual([0], catalog.select(status=Cleaner.CLEANED))
+            self.assertEqual([1, 0, 4], catalog.select(skip_rejected=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
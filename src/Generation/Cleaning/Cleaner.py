@@ -1,12 +1,48 @@
+import os
 import re
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from functools import lru_cache
+from itertools import chain, islice, repeat
+from operator import itemgetter
+
+from src.Generation.Cleaning import Duration, Lexer, NoteArray, Profiler
+from src.Generation.Cleaning.Lexer import Token
+
+# Bump whenever a change to the cleaner changes its output, so cached results are thrown out
+VERSION = 6
 
 MIN_BARS = 15
+# The time signature used when a tune doesn't give one, 'C' and 'C|' are common and cut time
+DEFAULT_METER = '4/4'
+METER_SYMBOLS = {'C': '4/4', 'C|': '2/2'}
 GRAMMAR_CHARACTERS = "zabcdefgABCDEFG23468T-^=_,></'|"
+GRAMMAR_SET = frozenset(GRAMMAR_CHARACTERS)
+# Characters which the whole string grammar rewrites can match on
+REWRITE_SET = frozenset('|:[]12-<>')
+
+# Characters which are removed or swapped before the abc string is tokenized
+CHARACTER_MAP = str.maketrans({'\\': None, '\x14': None, ';': ':', '’': '\'', '`': '\'', '´': '\''})
+
+# Token kinds which mark the bar structure
+BARLINE_KINDS = frozenset([Lexer.BARLINE, Lexer.REPEAT, Lexer.ENDING])
+# Token kinds which are dropped along with the ornamentation
+ORNAMENT_KINDS = frozenset([Lexer.DECORATION, Lexer.GRACE, Lexer.ANNOTATION, Lexer.SLUR, Lexer.ORNAMENT])
+
+TIE_TOKEN = Token(Lexer.TIE, '-')
+TRIPLET_TOKEN = Token(Lexer.TUPLET, 'T')
+TUPLE_TOKEN = Token(Lexer.TUPLET, 'X')
+OPEN_SLUR_TOKEN = Token(Lexer.SLUR, '(')
+
+# The cleaned version of each special token seen so far, each cleared once it holds Lexer.MEMO_SIZE tokens
+GRAMMAR_TOKENS = {}
+REWRITTEN_TOKENS = {}
+ORNAMENT_TOKENS = {}
 
 # region REGULAR EXPRESSION OBJECTS
 # region --- Grammar Generation
-APOSTROPHE_RE = re.compile('[’`´]')
-SEMICOLON_RE = re.compile(';')
 BARLINES_RE = re.compile('(\|]+)|(\[+\|)|(\|!\|)')
 REPEATS_RE = re.compile(':\|*:+')
 END_1_RE = re.compile('(\|*\[?1\.?)')
@@ -14,73 +50,213 @@ END_2_RE = re.compile('(:?\|+\[?2\.?)|(:\|1)')
 QUIRK_1_RE = re.compile('--+')
 QUIRK_2_RE = re.compile(r'([<>])\1+')
 QUIRK_3_RE = re.compile('<>|><')
+DECORATION_MARKS_RE = re.compile('[!+]')
+GRACE_QUIRKS_RE = re.compile('{[^}]*[<>]')
 # endregion --- Grammar Generation
 
-# region --- Ornamentation Generation
-COMMENTS_RE = re.compile('(!.{1,16}!)|(\+.{1,16}\+)|({[\^=_\w,\'/]+?\})|(".*?")')
-ORNAMNETS_RE = re.compile('[.~HLMOPSTuv*$J!]')
-FIND_TRIPLETS_RE = re.compile('\(3')
-TUPLES_RE = re.compile('\([\d]')
-SLURS_RE = re.compile('[()]')
-# endregion --- Ornamentation Generation
-
 # region --- Timing Generation
 SWUNG_NOTES_RE = re.compile(r'([_=^]*[a-gzA-G][,\']*)(/?[\d]?)([<>])([_=^]*[a-gzA-G][,\']*)\2')
-TIES_RE = re.compile('([_=^]*[a-gzA-G][,\']*)([\d]*/?[\d]*)-([_=^]*[a-gzA-G][,\']*)([\d]*/?[\d]*)')
+TIES_RE = re.compile(r"(?:[_=^]*[a-gzA-G][,']*[\d]*/?[\d]*-)+[_=^]*[a-gzA-G][,']*[\d]*/?[\d]*")
+TIED_NOTE_RE = re.compile(r"([_=^]*[a-gzA-G][,']*)([\d]*/?[\d]*)")
 OLD_NOTE_RE = re.compile('([_=^]*[a-gzA-g][,\']*)(/?[\d]?)')
 REPLACE_TRIPLETS_RE = re.compile('T([_=^]*[a-gzA-g][,\']*/?[\d]?){3}')
 IMPLIED_HALF_LENGTH_RE = re.compile('([_=^]*[a-gzA-g][,\']*)/([^\d])')
 # endregion --- Timing Generation
 
-# region --- Fraction Handling
-ISOLATE_TIME_RE = re.compile('[_=^]*[a-gzA-G][,\']*([\d]*/?[\d]*)')
-FRACTIONAL_PARTS_RE = re.compile('([\d]*)/?([\d]*)')
-# endregion --- Fraction Handling
+# region --- Repeat Handling
+# A second ending takes in any barline before its ':|'
+REPEAT_MARKS_RE = re.compile(r'(\|*:\|2|\|1|:\||\|:)')
+BARLINE_GROUPS_RE = re.compile(r'(\|+)')
+# endregion --- Repeat Handling
+
+# Every note, along with its accidental if it has one
+HANDLE_ACCIDENTALS_RE = re.compile("([_=^]*)([a-gzA-G][,']*)")
+
+REJECTION_RE = re.compile('!!BAD ABC - (.*?)!!')
 
-HANDLE_ACCIDENTALS_RE = re.compile('[_=^]+[a-gzA-G][,\']*')
+# Complex meters add their beats up, such as '2+3+2/8'
+METER_RE = re.compile(r'(\d+(?:\+\d+)*)/(\d+)')
 
 
 # endregion REGULAR EXPRESSION OBJECTS
 
 
-# region CLEAN CHARACTERS
-def clean_grammar(abc):
+# region TOKENS
+@lru_cache(maxsize=2 ** 16)
+def lex_bar(bar):
     """
-    Cleans the varying user input possibilities into a more
-    consistent grammar to help simplify future processing
+    Tokenizes the abc string of a single bar, once the ornaments have been removed.
+    Bars repeat a lot, both within and between tunes, so each is only lexed once.
+    :param bar: The abc string of a bar
+    :return: A tuple of tokens
     """
-    abc = ''.join(abc.split())
-    abc = abc.replace("\\", "")
-    abc = abc.replace("\x14", "")
+    return tuple(Lexer.tokenize(bar, bar=True))
 
-    # Replaces mistyped repeats and apostrophes
-    abc = SEMICOLON_RE.sub(':', abc)
-    abc = APOSTROPHE_RE.sub('\'', abc)
 
-    # Handles extra Data in the abc string
-    if 'M:' in abc: return '!!BAD ABC - EXTRA TIME SIGNATURE!!'
-    if abc[:2] == 'C:' or abc[:2] == 'R:':
-        abc = abc[abc.index('|'):]
+def map_tokens(table, function, tokens):
+    """
+    Maps each token through table, filling the table in with function for special tokens
+    it hasn't seen yet. Runs of notes are passed through untouched.
+    """
+    if len(table) > Lexer.MEMO_SIZE: table.clear()
+    for token in set(tokens).difference(table):
+        if token.kind != Lexer.NOTES: table[token] = function(token)
+    return list(map(table.get, tokens, tokens))
+
+
+def map_bars(function, bars):
+    """
+    Applies function to every distinct bar in bars, reusing the result for repeated bars.
+    :param function: Takes the abc string of a bar and returns either a new one or a '!!BAD ABC' string
+    :param bars: A list of abc strings, one for each bar
+    :return: The new list of bars, or the first '!!BAD ABC' string returned
+    """
+    done = {}
+    for bar in set(bars):
+        done[bar] = function(bar)
+        if '!!BAD ABC' in done[bar]: return done[bar]
+    return list(map(done.__getitem__, bars))
 
-    # Replaces alternate barline notations
-    abc = BARLINES_RE.sub('||', abc)
 
-    # Consolidates repeat grammar
+# endregion TOKENS
+
+
+# region CLEAN CHARACTERS
+def rewrite_grammar(abc):
+    """
+    Applies the barline and quirk rewrites to a whole abc string
+    """
+    abc = BARLINES_RE.sub('||', abc)
     if abc[0] == ':': abc = '|' + abc
     if abc[-1] == ':': abc = abc + '|'
     abc = REPEATS_RE.sub(':||:', abc)
     abc = END_1_RE.sub('|1', abc)
     abc = END_2_RE.sub(':|2', abc)
 
-    # Fixes other grammatical quirks
     abc = QUIRK_1_RE.sub('-', abc)
     abc = QUIRK_2_RE.sub(r'\1', abc)
     abc = QUIRK_3_RE.sub('', abc)
-
     return abc
 
 
-def remove_ornaments(abc):
+@lru_cache(maxsize=Lexer.MEMO_SIZE)
+def clean_barline(text, first=False, last=False):
+    """
+    Consolidates the grammar of a single run of barline characters.
+    :param text: The barline text
+    :param first: If the barline starts the tune
+    :param last: If the barline ends the tune
+    :return: The cleaned token, or a list of tokens if a '2' was split off the end
+    """
+    cleaned = BARLINES_RE.sub('||', text)
+    if first and cleaned[0] == ':': cleaned = '|' + cleaned
+    if last and cleaned[-1] == ':': cleaned = cleaned + '|'
+    cleaned = REPEATS_RE.sub(':||:', cleaned)
+    cleaned = END_1_RE.sub('|1', cleaned)
+    cleaned = END_2_RE.sub(':|2', cleaned)
+
+    # A '2' that didn't become a second ending is part of the next bar
+    if '2' in text and not cleaned.endswith(':|2'):
+        return [clean_barline(text[:text.index('2')], first), Token(Lexer.NOTES, '2')]
+    return Token(Lexer.barline_kind(cleaned), cleaned)
+
+
+def clean_token(token, rewritten=False):
+    """
+    Cleans the grammar of a single special token.
+    :param token: A token which isn't a run of notes
+    :param rewritten: If the abc string has already been through rewrite_grammar
+    :return: The cleaned token, None if it should be dropped, or a list of tokens
+    """
+    if rewritten:
+        # The endings have already been rewritten, so any '.' left is a staccato mark,
+        # and any '2' which didn't become a second ending is part of the next bar
+        if token.kind not in BARLINE_KINDS: return token
+        text = token.text.replace('.', '')
+        if '2' in text and not text.endswith(':|2'):
+            return [Lexer.SPECIAL_TOKENS[text[:text.index('2')]], Token(Lexer.NOTES, '2')]
+        return Lexer.SPECIAL_TOKENS[text]
+
+    # Replaces alternate barline notations and consolidates repeat grammar
+    if token.kind in BARLINE_KINDS:
+        return clean_barline(token.text)
+
+    # Fixes other grammatical quirks
+    elif token.kind == Lexer.TIE:
+        return TIE_TOKEN
+    elif token.kind == Lexer.BROKEN:
+        text = QUIRK_3_RE.sub('', QUIRK_2_RE.sub(r'\1', token.text))
+        return Token(token.kind, text) if text else None
+    return token
+
+
+def needs_rewrite(abc, tokens):
+    """
+    Checks if the grammar rewrites could change which decorations or grace notes are found,
+    in which case the whole abc string has to be rewritten before it is tokenized.
+    Decorations match greedily, so nothing within reach of an opening mark can be rewritten.
+    """
+    if GRACE_QUIRKS_RE.search(abc): return True
+    if '!' not in abc and '+' not in abc: return False
+
+    decorations = sum([t.kind == Lexer.DECORATION for t in tokens])
+    marks = [m.start() for m in DECORATION_MARKS_RE.finditer(abc)]
+    if len(marks) != 2 * decorations: return True
+    return any([REWRITE_SET.intersection(abc[i + 1:i + 18]) for i in marks[::2]])
+
+
+def clean_grammar(abc):
+    """
+    Cleans the varying user input possibilities into a more
+    consistent grammar to help simplify future processing
+    :param abc: An abc string
+    :return: A list of tokens, with the notes left in runs
+    """
+    abc = ''.join(abc.split()).translate(CHARACTER_MAP)
+
+    # Handles extra Data in the abc string
+    if 'M:' in abc: return '!!BAD ABC - EXTRA TIME SIGNATURE!!'
+    if abc[:2] == 'C:' or abc[:2] == 'R:':
+        abc = abc[abc.index('|'):]
+
+    # Decorations and grace notes are only found once the grammar is rewritten,
+    # which can move their closing marks, so those tunes are rewritten up front
+    tokens = Lexer.tokenize(abc, notes=False)
+    rewritten = needs_rewrite(abc, tokens)
+    if rewritten:
+        abc = rewrite_grammar(abc)
+        tokens = Lexer.tokenize(abc, notes=False)
+    if rewritten:
+        cleaned = map_tokens(REWRITTEN_TOKENS, lambda t: clean_token(t, True), tokens)
+    else:
+        cleaned = map_tokens(GRAMMAR_TOKENS, clean_token, tokens)
+
+        # Repeats at either end of the tune need an outer barline
+        if tokens and tokens[0].kind in BARLINE_KINDS:
+            cleaned[0] = clean_barline(tokens[0].text, True, len(tokens) == 1)
+        if len(tokens) > 1 and tokens[-1].kind in BARLINE_KINDS:
+            cleaned[-1] = clean_barline(tokens[-1].text, False, True)
+
+    # Drop the swing markings which cancelled out, and split off any
+    # second endings which were really note lengths
+    cleaned = list(filter(None, cleaned))
+    if list in map(type, cleaned):
+        cleaned = [t for token in cleaned for t in (token if type(token) is list else [token])]
+    return cleaned
+
+
+def clean_ornament(token):
+    """
+    Removes ornamentation from a single special token, and swaps tuplets for a single character
+    """
+    if token.kind in ORNAMENT_KINDS:
+        return None
+    elif token.kind == Lexer.TUPLET and token.text[0] == '(':
+        return TRIPLET_TOKEN if token.text == '(3' else TUPLE_TOKEN
+    return token
+
+
+def remove_ornaments(tokens):
     """
     Removes ornamentation from the abc string, as
     well as converting triplets and other non base-two
@@ -110,16 +286,24 @@ def remove_ornaments(abc):
         "***"        Comments or chord
     """
 
-    # Removes any of the instructions between '!' and the old '+', grace notes and comments
-    abc = COMMENTS_RE.sub('', abc)
-    abc = ORNAMNETS_RE.sub('', abc)
-
-    # Preserve triplets, swap out any other length modifiers, then nuke parenthesis
-    abc = FIND_TRIPLETS_RE.sub('T', abc)
-    abc = TUPLES_RE.sub('X', abc)
-    abc = SLURS_RE.sub('', abc)
-
-    return abc
+    # A slur followed by a number, once the ornaments between them are gone, is a tuple
+    if OPEN_SLUR_TOKEN in tokens:
+        cleaned = []
+        slur = False
+        for token in tokens:
+            if token.kind in ORNAMENT_KINDS:
+                slur = token == OPEN_SLUR_TOKEN or (slur and token.kind != Lexer.SLUR)
+                continue
+            if slur and token.kind == Lexer.NOTES and token.text[0] in '023456789':
+                cleaned.append(TRIPLET_TOKEN if token.text[0] == '3' else TUPLE_TOKEN)
+                token = Token(token.kind, token.text[1:])
+            slur = False
+            cleaned.append(token)
+        tokens = cleaned
+
+    # Removes any of the instructions between '!' and the old '+', grace notes and comments,
+    # preserves triplets and swaps out any other length modifiers
+    return list(filter(None, map_tokens(ORNAMENT_TOKENS, clean_ornament, tokens)))
 
 
 # endregion CLEAN CHARACTERS
@@ -130,67 +314,15 @@ def merge_note_lengths(a, b):
     """
     Takes two note lengths parts and returns a string of their sum
     """
-    a = FRACTIONAL_PARTS_RE.findall(a)[0]
-    b = FRACTIONAL_PARTS_RE.findall(b)[0]
-    num, den = simplify_fractions(a, b)
-    if num == 1 and den == 1:
-        return ''
-    elif den == 1:
-        return str(num)
-    else:
-        return str(num) + '/' + str(den)
-
-
-def simplify_fractions(a, b):
-    """
-    Takes two tuples which each contain two integer convertable values,
-    and returns a simplified fraction as a tuple.
-    :param a: A tuple in the form (numerator, denominator)
-    :param b: A tuple in the form (numerator, denominator)
-    :return: A simplified tuple of ints in the form (numerator, denominator)
-    """
-    num1 = int(a[0]) if a[0] != '' else 1
-    num2 = int(b[0]) if b[0] != '' else 1
-    den1 = int(a[1]) if a[1] != '' else 1
-    den2 = int(b[1]) if b[1] != '' else 1
-    den = den1 * den2
-
-    # Both denominators are 1, sum the numerators
-    if den == 1:
-        num = num1 + num2
-    else:
-        # Cross multiply
-        num = (num1 * den2) + (num2 * den1)
-        c = 2
-        # And remove common factors
-        while den != 1 and num != 1 and c <= den and c <= num:
-            while den % c == 0 and num % c == 0:
-                den = den // c
-                num = num // c
-            c += 1
-    return num, den
-
-
-def count_bar(bar):
-    time = ISOLATE_TIME_RE.findall(bar)
-
-    num_sum = 0
-    den_sum = 1
-    for x in time:
-        a = FRACTIONAL_PARTS_RE.findall(x)[0]
-        num_sum, den_sum = simplify_fractions(a, (num_sum, den_sum))
-
-    return num_sum / den_sum
+    return Duration.to_length(Duration.add(Duration.parse(a), Duration.parse(b)))
 
 
 def remove_swing_notes(abc):
     def remove_swing_helper(x):
-        a = FRACTIONAL_PARTS_RE.findall(x.group(2))[0]
-        num = int(a[0]) if a[0] != '' else 1
-        den = int(a[1]) if a[1] != '' else 1
-        half = str(num) + '/' + str(den * 2)
-        short = merge_note_lengths(half, '0/1')
-        long = merge_note_lengths(half, x.group(2))
+        length = Duration.parse(x.group(2))
+        half = Duration.scale(length, 1, 2)
+        short = Duration.to_length(half)
+        long = Duration.to_length(Duration.add(half, length))
 
         if x.group(3) == '>':
             return x.group(1) + long + x.group(4) + short
@@ -235,244 +367,244 @@ def remove_triplets(abc):
 
 def remove_ties(abc):
     def condense_ties(m):
-        if m.group(1) != m.group(3):
-            # Pitches are different. Remove '-'
-            return m.group().replace('-', '')
-        else:
-            # Pitches are the same. Merge note lengths
-            return m.group(1) + merge_note_lengths(m.group(2), m.group(4))
+        # Walk the chain of tied notes, merging the lengths of each run of the same pitch
+        cleaned = ''
+        pitch, length = None, None
+        for note, part in TIED_NOTE_RE.findall(m.group()):
+            if note == pitch:
+                length = Duration.add(length, Duration.parse(part))
+            else:
+                # Pitches are different. Drop the '-'
+                if pitch is not None: cleaned += pitch + Duration.to_length(length)
+                pitch, length = note, Duration.parse(part)
+        return cleaned + pitch + Duration.to_length(length)
 
-    # TODO - Replace with a single re.sub call
-    abc = TIES_RE.sub(condense_ties, abc)
-    abc = TIES_RE.sub(condense_ties, abc)
-    abc = TIES_RE.sub(condense_ties, abc)
+    # Every chain of tied notes is merged in a single pass, however long it is
+    return TIES_RE.sub(condense_ties, abc)
 
-    return abc
+
+def clean_bar_lengths(bar):
+    """
+    Makes the implicit note lengths of a single bar explicit
+    """
+    tokens = lex_bar(bar)
+    if any([t.kind == Lexer.OTHER for t in tokens]):
+        # Stray characters can sit inside a length, so fall back on the abc string
+        bar = bar.replace('//', '/4') + '|'
+        bar = IMPLIED_HALF_LENGTH_RE.sub(r'\1/2\2', bar)
+        bar = IMPLIED_HALF_LENGTH_RE.sub(r'\1/2\2', bar)
+        return bar[:-1]
+
+    cleaned = ''
+    for t in tokens:
+        if t.kind == Lexer.NOTE and '/' in t.length:
+            length = t.length.replace('//', '/4')
+            t = t._replace(length='/2' if length == '/' else length)
+        cleaned += t.text
+    return cleaned
 
 
 # endregion NOTE LENGTHS
 
 
 # region REMOVE REPEATS
-def repair_bars(abc):
+def repair_bars(bars, beats_per_bar):
     """
-    Takes an abc string, and merges pickups and bars which are too short.
+    Takes a list of bars, and merges pickups and bars which are too short.
+    :param bars: A list of bar strings
+    :param beats_per_bar: The number of beats in a bar of the tune's meter
     """
 
-    # Split into individual bars, remove the first and last bar
-    # as these could be pickup related, and non-standard length
-    bars = abc.split('|')
-    if len(bars) < 3: return abc
+    # Remove the first and last bar as these could be
+    # pickup related, and non-standard length
+    if len(bars) < 3: return bars
     end = bars.pop()
     if end == '': end = bars.pop()
-    cleaned = bars.pop(0) + '|'
+    cleaned = [bars.pop(0)]
+
     x = 0
     while x < len(bars):
         bar = bars[x]
-        s = count_bar(bar)
-        if s % BEATS_PER_BAR != 0 and x < len(bars) - 1 and (s + count_bar(bars[x + 1])) % BEATS_PER_BAR == 0:
-            cleaned += bar + bars[x + 1] + '|'
+        s = Duration.bar_length(bar)
+        if not Duration.divides(s, beats_per_bar) and x < len(bars) - 1 and \
+                Duration.divides(Duration.add(s, Duration.bar_length(bars[x + 1])), beats_per_bar):
+            cleaned.append(bar + bars[x + 1])
             x += 1
         else:
-            cleaned += bar + '|'
+            cleaned.append(bar)
         x += 1
-    cleaned += end + '|'
+    cleaned.append(end)
     return cleaned
 
 
-def remove_single_dual_repeat(abc, tune_id):
+def split_ending(bars, abc):
     """
-    Takes a string with one 1st and 2nd ending, and removes it
+    Splits a second ending off the start of an abc string.
+    :param bars: The number of bars in the second ending
+    :param abc: The abc string which follows the ':|2', up to the next repeat mark
+    :return: The second ending and the rest of the abc string, or None if it has too few bars
     """
+    pieces = BARLINE_GROUPS_RE.split(abc, bars)
+    if len(pieces) < 2 * bars + 1: return None
+    return ''.join(pieces[:-1]), pieces[-1]
 
-    # Split on the second ending, and check to make sure there are two parts.
-    temp = abc.split(':|2')
-    end2 = temp.pop()
-    if len(temp) == 0: return '!!BAD ABC - BLANK END2!!'
 
-    # Take the first part, and remove the starting repeat if needed, then count the repeats
-    x = temp[0]
-    cleaned = ''
-    if x[:2] == '|:': x = x[2:]
+def expand_repeats(abc):
+    """
+    Unrolls the repeats and first/second endings of an abc string in a single pass.
+    A part which starts with '|:' or finishes with ':|' is played twice, and a part with
+    endings is played through the first ending, then again through the second ending,
+    which is taken to have the same number of bars as the first.
+    :param abc: A spaceless abc string, with the barlines cleaned by clean_grammar
+    :return: A list of abc strings which join into the unrolled tune, or a '!!BAD ABC' string
+    """
+    # Every other piece is a repeat mark, with the abc string between them
+    pieces = REPEAT_MARKS_RE.split(abc)
+    marks = pieces[1::2]
+    expanded = list()
+    # The pieces of the current part, and if it started with '|:'
+    part = [pieces[0]]
+    started = False
+    x = 0
+    while x < len(marks):
+        mark, after = marks[x], pieces[2 * x + 2]
+        x += 1
+
+        if mark == '|:':
+            expanded += part * 2 if started else part
+            part, started = [after], True
+        elif mark == ':|':
+            expanded += part * 2
+            part, started = [after], False
+        elif mark == '|1':
+            # The first ending runs up to the ':|2'
+            if x == len(marks):
+                return '!!BAD ABC - UNCLOSED ENDING!!'
+            elif marks[x] == '|1' or marks[x] == '|:':
+                return '!!BAD ABC - NESTED ENDING!!'
+            elif marks[x] == ':|':
+                return '!!BAD ABC - REPEAT IN ENDING!!'
+            end1 = after
+            bars = len(BARLINE_GROUPS_RE.findall(end1 + marks[x]))
+            after = pieces[2 * x + 2]
+            x += 1
 
-    # If there is more than 1 repeat, isolate the 1st ending, and deal with the other repeats
-    if x.count(':|') != 0 or x.count('|:') != 0:
-        simple, x = x.rsplit('|:', 1)
-        cleaned = remove_simple_repeats(simple, tune_id) + '|'
+            # The second ending can only run up to the next repeat mark if it's closed by the mark's barline
+            ending = split_ending(bars, after)
+            if ending is None and x < len(marks) and (marks[x][0] != '|' or len(BARLINE_GROUPS_RE.findall(after)) + 1 < bars):
+                return '!!BAD ABC - REPEAT IN ENDING!!'
+            end2, after = ending or (after, '')
+            expanded += part + [end1] + part + [end2]
+            part, started = [after], False
+        else:
+            return '!!BAD ABC - UNOPENED ENDING!!'
 
-    # Split on the 1st ending, isolating the part that repeats
-    beg, end1 = x.split('|1')
-    cleaned += beg + '|' + end1 + '|' + beg + '|' + end2 + '|'
+    expanded += part * 2 if started else part
+    return expanded
 
-    if ':|' in cleaned or '|:' in cleaned:
-        return '!!BAD ABC - VALUE ERROR - SIMPLE!!'
-    return cleaned
+
+# endregion REMOVE REPEATS
 
 
-def remove_dual_repeat(abc, tune_id):
+def parse_bar_accidentals(bar):
     """
-    Takes the string, and splits into pieces, specifically
-    the beginning 1st ending and 2nd ending, then reconstructs
-    it explicitly without the repeats, and returns the string.
+    Takes the abc string of a single bar, and writes out each accidental on the later notes
+    of the same pitch and octave, until another accidental replaces it
     """
+    carried = dict()
 
-    # If the string is empty, do nothing. If the string starts with 1 or :,
-    # it is effectively un-salvageable.
-    if len(abc) == 0:
-        return ''
-    elif abc[0] == '1' or abc[0] == ':':
-        return '!!BAD ABC - MALFORM STRING!!'
+    def carry_accidental(m):
+        accidental, note = m.groups()
+        if accidental:
+            carried[note] = accidental
+            return m.group()
+        return carried.get(note, '') + note
 
-    cleaned = ''
-    count1 = abc.count('|1')
-    count2 = abc.count(':|2')
-
-    # If the number of 1st and 2nd endings are the same,
-    # we can somewhat safely assume that the structure is sound
-    if count1 == count2:
-        # If a 2nd ending isn't paired with a first ending
-        for x in abc.split(':|2')[:-1]:
-            if '|1' not in x: return '!!BAD ABC - MISMATCH ENDS!!'
-
-        try:
-            for x in range(count1):
-                loc1 = abc.index('|1') + 1
-                loc2 = abc.index(':|2') + 2
-                bars = 0
-                fin = loc2
-
-                # TODO - Simplify this using regex.
-                # Count the groups of '|' in the ranges of the abc string
-                # This approach does assume that the 1st and 2nd ending are
-                # of the same bar length, though that's reasonable considering
-                # the AABB format of most Irish music.
-
-                while loc1 < loc2:
-                    loc1 += 1
-                    if abc[loc1] != '|':
-                        continue
-                    else:
-                        while abc[loc1] == '|':
-                            loc1 += 1
-                        bars += 1
-
-                while bars > 0:
-                    fin += 1
-                    if fin >= len(abc): break
-                    if abc[fin] != '|':
-                        continue
-                    else:
-                        while abc[fin] == '|':
-                            fin += 1
-                            if fin >= len(abc): break
-                        bars -= 1
-
-                sub = abc[:fin - 1]
-                abc = abc[fin - 1:]
-                cleaned += remove_single_dual_repeat(sub, tune_id)
-        except ValueError:
-            return '!!BAD ABC!!'
-    # Otherwise, something is very wrong with the endings
-    elif count1 > count2:
-        return '!!BAD ABC - TOO MANY END1s!!'
-    elif count2 > count1:
-        return '!!BAD ABC - TOO MANY END2s!!'
-    else:
-        return '!!BAD ABC - UNKNOWN ENDING!!'
-    return cleaned
+    return HANDLE_ACCIDENTALS_RE.sub(carry_accidental, bar)
+
+
+def parse_accidentals(bars):
+    def parse_accidentals_helper(bar):
+        if '^' in bar or '_' in bar or '=' in bar: return parse_bar_accidentals(bar)
+        return bar
 
+    return map_bars(parse_accidentals_helper, bars)
 
-def remove_simple_repeats(abc, tune_id):
+
+# region RESULTS
+CLEANED = 'cleaned'
+REJECTED = 'rejected'
+
+
+class Reason(Enum):
     """
-    Takes a string, which only has simple repeats in it and
-    returns a string with the repeats explicitly written.
+    Why a tune was rejected. The values match the '!!BAD ABC - ...!!' strings returned by the stages.
     """
-    cleaned = ''
+    EXTRA_TIME_SIGNATURE = 'EXTRA TIME SIGNATURE'
+    UNCLOSED_ENDING = 'UNCLOSED ENDING'
+    UNOPENED_ENDING = 'UNOPENED ENDING'
+    NESTED_ENDING = 'NESTED ENDING'
+    REPEAT_IN_ENDING = 'REPEAT IN ENDING'
+    SHORT_PIECE = 'SHORT PIECE'
+    INVALID_CHARS = 'INVALID CHARS'
+    SWING_NOT_REMOVED = 'SWING NOT REMOVED'
+    TRIPLET_TOO_SMALL = 'TRIPLET TOO SMALL'
+    INVALID_TRIPLET = 'INVALID TRIPLET (/3)'
+    TRIPLET_NOT_REMOVED = 'TRIPLET NOT REMOVED'
+    INCORRECT_BAR_LENGTH = 'INCORRECT BAR LENGTH'
+    RESTS = 'RESTS'
+    UNKNOWN_METER = 'UNKNOWN METER'
+
+
+class CleanResult(namedtuple('CleanResult', ['status', 'abc', 'reason', 'stage'])):
+    """
+    The outcome of cleaning a single tune. A rejected tune has '!!BAD ABC!!' as its abc string,
+    along with the reason and the name of the stage which rejected it.
+    """
+    __slots__ = ()
 
-    if abc.count(':|') > abc.count('|:'):
-        temp = abc.split(':|')
-        # Remove the 'outside' element, as it isn't repeated
-        end = temp.pop()
-        # Unless it needs to be repeated due to the opposite repeat
-        if '|:' in end: end = remove_simple_repeats(end, tune_id)
-        for x in temp:
-            # Process the chunk if it has the other repeat, otherwise double it
-            if '|:' in x:
-                cleaned += remove_simple_repeats(x, tune_id) + '|'
-            else:
-                cleaned += x + '|' + x + '|'
-        cleaned += end + '|'
-
-    # Follows the above logic, just in reverse
-    elif abc.count(':|') <= abc.count('|:'):
-        temp = abc.split('|:')
-        beg = temp.pop(0)
-        if ':|' in beg:
-            cleaned = remove_simple_repeats(beg, tune_id)
-        else:
-            cleaned = beg + '|'
-        for x in temp:
-            if ':|' in x:
-                cleaned += remove_simple_repeats(x, tune_id)
-            else:
-                cleaned += x + '|' + x + '|'
 
-    return cleaned
+def rejection(message, stage):
+    """
+    Takes the '!!BAD ABC - ...!!' string returned by a stage and turns it into a rejected result
+    """
+    return CleanResult(REJECTED, '!!BAD ABC!!', Reason(REJECTION_RE.search(message).group(1)), stage)
 
 
-# endregion REMOVE REPEATS
+def summarize(results):
+    """
+    Counts the rejected tunes in a batch of results by their reason.
+    :param results: A list of CleanResults
+    :return: A Counter of Reasons
+    """
+    return Counter([r.reason for r in results if r.status == REJECTED])
 
 
-def parse_accidentals(abc):
-    cleaned = ''
-    bars = abc.split('|')
-    for bar in bars:
-        accidentals = HANDLE_ACCIDENTALS_RE.findall(bar)
-
-        # There are no accidentals, add the bar and continue
-        if len(accidentals) == 0:
-            cleaned += bar + '|'
-
-        # Pass over bars which have a single accidental, that comes after all other notes of the same pitch
-        elif len(accidentals) == 1 and bar.count(accidentals[0][1:],
-                                                 bar.index(accidentals[0]) + len(accidentals[0])) == 0:
-            cleaned += bar + '|'
-
-        # If the number of target pitches is the same as the number of accidentals, all of the relevant notes
-        # already have accidentals, so the bar is skipped.
-        elif sum([bar.count(i) for i in set(accidentals)]) == sum(
-                [bar.count(i) for i in set([j[1:] for j in accidentals])]):
-            cleaned += bar + '|'
-
-        elif len(accidentals) == 1:
-            acc = accidentals[0]
-            piv = bar.index(acc) + len(acc)
-            cleaned += bar[:piv] + bar[piv:].replace(acc[1:], acc) + '|'
+def print_summary(summary):
+    """
+    Prints the rejection counts returned by summarize, most common first
+    """
+    for reason, count in summary.most_common():
+        print('{:>6}  {}'.format(count, reason.value))
 
-        else:
-            # TODO - Handle more complex accidental structures appropriately.
-            return '!!BAD ABC - TEMPORARY ACCIDENTAL REMOVAL!!'
 
-    return cleaned
+# endregion RESULTS
 
 
 # region MAIN
-def remove_repeats(abc, tune_id):
+def remove_repeats(tokens, tune_id, beats_per_bar):
     """
-    :param abc: A spaceless abc string
+    :param tokens: A list of tokens
     :param tune_id: The tune setting
-    :return: An abc string, without repeats, and single barlines
+    :param beats_per_bar: The number of beats in a bar of the tune's meter
+    :return: A list of bars without repeats
     """
+    abc = ''.join(map(itemgetter(1), tokens))
 
-    # If the song has first or second endings, we need to remove those first
-    if '|1' in abc or ':|2' in abc:
-        cleaned = remove_dual_repeat(abc, tune_id)
-    # Otherwise, if it has repeats, we deal with those
-    elif '|:' in abc or ':|' in abc:
-        cleaned = remove_simple_repeats(abc, tune_id)
-    # If there are no repeats, return the spaceless string
-    else:
-        cleaned = abc
+    # Write out the repeats and endings explicitly
+    expanded = expand_repeats(abc)
+    if isinstance(expanded, str): return expanded
+    cleaned = '|'.join(expanded) + '|'
 
     # Normalize the barline grammar, for future processing
     while ']' in cleaned: cleaned = cleaned.replace(']', '|')
@@ -481,66 +613,58 @@ def remove_repeats(abc, tune_id):
         if cleaned[0] == '|': cleaned = cleaned[1:]
 
     # Condense bars which were improperly split
-    cleaned = repair_bars(cleaned)
-
-    return cleaned
+    bars = repair_bars(cleaned.split('|'), beats_per_bar)
+    if len(bars) < 3 and bars[-1] == '': bars.pop()
+    return bars
 
 
-def remove_bad_tunes(abc):
+def remove_bad_tunes(bars, min_bars):
     """
      Checks if the song has qualities which make it unusable.
     """
 
     # Removes any songs less than X+1 bars long.
-    if abc.count('|') < MIN_BARS:
-        return '!!BAD ABC - SHORT PIECE'
+    if len(bars) < min_bars:
+        return '!!BAD ABC - SHORT PIECE!!'
 
     # Removes any song which has characters not contained in the defined grammar
-    chars = set(x for x in GRAMMAR_CHARACTERS)
-    tune = set(x for x in abc)
-    if len(tune - chars) != 0:
+    if not GRAMMAR_SET.issuperset(''.join(bars)):
         return '!!BAD ABC - INVALID CHARS!!'
 
-    return abc
+    return bars
 
 
-def clean_note_lengths(abc):
+def clean_note_lengths(bars):
     """
-    Takes the abc string, and normalizes the length grammar
+    Takes a list of bars, and normalizes the length grammar
     """
+    def clean_note_lengths_helper(bar):
+        # Makes implicit not lengths explicit
+        if '/' in bar: bar = clean_bar_lengths(bar)
 
-    # Makes implicit not lengths explicit
-    abc = abc.replace('//', '/4')
-    # TODO - Replace with a single re.sub call
-    abc = IMPLIED_HALF_LENGTH_RE.sub(r'\1/2\2', abc)
-    abc = IMPLIED_HALF_LENGTH_RE.sub(r'\1/2\2', abc)
-
-    abc = remove_swing_notes(abc)
-    abc = remove_triplets(abc)
+        if '<' in bar or '>' in bar: bar = remove_swing_notes(bar)
+        if 'T' in bar or '/3' in bar: bar = remove_triplets(bar)
+        return bar
 
-    return abc
+    return map_bars(clean_note_lengths_helper, bars)
 
 
-def check_time(abc):
-    bars = abc.split('|')
-    s = 0
-    try:
-        for bar in bars: s += count_bar(bar)
-    except ValueError:
-        return '!!BAD ABC - INCORRECT BAR LENGTH!!'
-    if s % BEATS_PER_BAR == 0:
+def check_time(bars, beats_per_bar):
+    if Duration.divides(Duration.total_length(bars), beats_per_bar):
         # There is an appropriate number of beats in the whole tune
         pass
-        # abc = '!!BAD ABC - INCORRECT BAR LENGTH!!'
     else:
-        if (s - count_bar(bars[0])) % BEATS_PER_BAR == 0:
-            # The piece has the right number of beats, minus the pickup bar
-            # pass
-            abc = '!!BAD ABC - INCORRECT BAR LENGTH!!'
-        else:
-            # There is a non-standard number of beats somwhere other than the pickup
-            abc = '!!BAD ABC - INCORRECT BAR LENGTH!!'
-    return abc
+        # There is a non-standard number of beats somewhere, or the pickup is incomplete
+        return '!!BAD ABC - INCORRECT BAR LENGTH!!'
+    return bars
+
+
+def condense_ties(bars):
+    def condense_ties_helper(bar):
+        if '-' in bar: return remove_ties(bar)
+        return bar
+
+    return map_bars(condense_ties_helper, bars)
 
 
 def print_bad_abc(abc, tune_id, extra=list()):
@@ -561,34 +685,235 @@ def print_bad_abc(abc, tune_id, extra=list()):
     print()
 
 
-def clean(abc, tune_id='Test'):
+def beats_per_bar(meter):
     """
+    :param meter: A time signature, such as '6/8' or 'C|'
+    :return: The number of beats in a bar, which the length of every bar is a multiple of
+    """
+    meter = METER_SYMBOLS.get(meter.strip(), meter.strip())
+    match = METER_RE.fullmatch(meter)
+    if not match: raise ValueError('Unknown meter "{}"'.format(meter))
+    return sum(map(int, match.group(1).split('+')))
+
+
+class Cleaner:
+    """
+    Cleans abc strings for a single meter. It keeps no state between tunes,
+    so one instance can be shared by any number of threads.
+    """
+
+    def __init__(self, meter=DEFAULT_METER, min_bars=MIN_BARS):
+        """
+        :param meter: The time signature of the tunes, such as '4/4' for reels or '6/8' for jigs
+        :param min_bars: The number of bars a tune needs to be kept
+        """
+        self.meter = meter
+        self.beats_per_bar = beats_per_bar(meter)
+        self.min_bars = min_bars
+
+    def parameters(self):
+        """
+        Returns the settings which change the output of the cleaner, which cached results are keyed on
+        """
+        return {'version': VERSION, 'min_bars': self.min_bars, 'grammar': GRAMMAR_CHARACTERS,
+                'beats_per_bar': self.beats_per_bar}
+
+    def stages(self, tune_id='Test'):
+        """
+        Returns the cleaning stages in order, as (name, function) tuples. Each function takes the output of
+        the one before it, and returns a '!!BAD ABC' string as soon as the tune is unusable. The grammar
+        and ornament stages work on tokens, and every stage from the repeats on works on bar strings.
+        """
+        return [('grammar', clean_grammar), ('ornaments', remove_ornaments),
+                ('repeats', lambda x: remove_repeats(x, tune_id, self.beats_per_bar)),
+                ('bad tunes', lambda x: remove_bad_tunes(x, self.min_bars)),
+                ('note lengths', clean_note_lengths), ('time', lambda x: check_time(x, self.beats_per_bar)),
+                ('accidentals', parse_accidentals), ('ties', condense_ties)]
+
+    def clean_bars(self, abc, tune_id='Test', profile=None):
+        """
+        Runs the abc string through each cleaning stage, stopping at the first one which rejects it,
+        so no later stage is handed a '!!BAD ABC' string or spends any time on a rejected tune.
+        :param abc: An abc string
+        :param tune_id: The tune setting, which is used as the unique id
+        :param profile: An optional Profiler.StageProfile to record the time spent in each stage
+        :return: A CleanResult, and the list of cleaned bars or None if the tune was rejected
+        """
+        cleaned = abc
+        for name, stage in self.stages(tune_id):
+            cleaned = stage(cleaned) if profile is None else profile.run(name, stage, cleaned)
+            if isinstance(cleaned, str): return rejection(cleaned, name), None
+
+        abc = '|'.join(cleaned) + '||'
+
+        #TODO - Added for testing
+        if 'z' in abc:
+            return CleanResult(REJECTED, '!!BAD ABC!!', Reason.RESTS, 'output'), None
+        return CleanResult(CLEANED, abc, None, None), cleaned
+
+    def clean_tune(self, abc, tune_id='Test', profile=None):
+        """
+        Runs the abc string through each cleaning stage, stopping at the first one which rejects it.
+        :param abc: An abc string
+        :param tune_id: The tune setting, which is used as the unique id
+        :param profile: An optional Profiler.StageProfile to record the time spent in each stage
+        :return: A CleanResult
+        """
+        return self.clean_bars(abc, tune_id, profile)[0]
+
+    def clean_notes(self, abc, tune_id='Test', profile=None):
+        """
+        Cleans an abc string, building the notes of the cleaned tune straight from its bars.
+        :return: A CleanResult, and a NoteArray or None if the tune was rejected
+        """
+        result, bars = self.clean_bars(abc, tune_id, profile)
+        return result, NoteArray.from_bars(bars) if bars is not None else None
+
+    def clean(self, abc, tune_id='Test'):
+        """
+        :param abc: An abc string
+        :param tune_id: The tune setting, which is used as the unique id
+        :return: Either '!!BAD ABC!!' or a valid abc string
+        """
+        return self.clean_tune(abc, tune_id).abc
+
+
+@lru_cache(maxsize=2 ** 8)
+def for_meter(meter=DEFAULT_METER):
+    """
+    :return: The shared Cleaner for a meter
+    """
+    return Cleaner(meter)
+
+
+def parameters():
+    """
+    Returns the settings of the default Cleaner, which cached results are keyed on along with the meter
+    """
+    return for_meter().parameters()
+
+
+def meter_cleaner(meter):
+    """
+    :return: The shared Cleaner for a meter, or a rejected CleanResult if the meter can't be read
+    """
+    try:
+        return for_meter(meter)
+    except ValueError:
+        return CleanResult(REJECTED, '!!BAD ABC!!', Reason.UNKNOWN_METER, 'meter')
+
+
+def clean_tune(abc, tune_id='Test', profile=None, meter=DEFAULT_METER):
+    """
+    Cleans an abc string with the shared Cleaner for its meter.
     :param abc: An abc string
     :param tune_id: The tune setting, which is used as the unique id
+    :param profile: An optional Profiler.StageProfile to record the time spent in each stage
+    :param meter: The time signature of the tune
+    :return: A CleanResult
+    """
+    cleaner = meter_cleaner(meter)
+    if isinstance(cleaner, CleanResult): return cleaner
+    return cleaner.clean_tune(abc, tune_id, profile)
+
+
+def clean_notes(abc, tune_id='Test', meter=DEFAULT_METER, profile=None):
+    """
+    Cleans an abc string with the shared Cleaner for its meter.
+    :return: A CleanResult, and a NoteArray of the cleaned tune or None if it was rejected
+    """
+    cleaner = meter_cleaner(meter)
+    if isinstance(cleaner, CleanResult): return cleaner, None
+    return cleaner.clean_notes(abc, tune_id, profile)
+
+
+def clean(abc, tune_id='Test', meter=DEFAULT_METER):
+    """
+    :param abc: An abc string
+    :param tune_id: The tune setting, which is used as the unique id
+    :param meter: The time signature of the tune
     :return: Either '!!BAD ABC!!' or a valid abc string
     """
-    global BEATS_PER_BAR, BEAT_SUBDIVISIONS
-    # TODO - Base this on time signature
-    BEATS_PER_BAR = 4
-
-    # TODO - Base this on the most frequent sum of notes in a bar
-    BEAT_SUBDIVISIONS = 1
-
-    abc = clean_grammar(abc)
-    abc = remove_ornaments(abc)
-    cleaned = remove_repeats(abc, tune_id)
-    cleaned = remove_bad_tunes(cleaned)
-    cleaned = clean_note_lengths(cleaned)
-    cleaned = check_time(cleaned)
-    cleaned = parse_accidentals(cleaned)
-    if '-' in cleaned: cleaned = remove_ties(cleaned)
-
-    #TODO - Added for testing
-    if 'z' in cleaned:
-        return '!!BAD ABC!!'
-
-    if '!!BAD ABC' in cleaned:
-        # print_bad_abc(abc, tune_id)
-        return '!!BAD ABC!!'
-    return cleaned
+    return clean_tune(abc, tune_id, meter=meter).abc
+
+
+def clean_chunk(chunk, profiled=False, notes=False):
+    """
+    Cleans a chunk of tunes in a single process.
+    :param chunk: A list of (abc, tune_id) or (abc, tune_id, meter) tuples
+    :param profiled: Flag to record the time spent in each stage
+    :param notes: Flag to also build the NoteArray of each tune, as clean_notes does
+    :return: The process id, the seconds taken, the list of CleanResults, or of (CleanResult, NoteArray) pairs
+    with notes, and the StageProfile or None
+    """
+    profile = Profiler.StageProfile() if profiled else None
+    start = time.perf_counter()
+    if notes:
+        cleaned = [clean_notes(abc, tune_id, *meter, profile=profile) for abc, tune_id, *meter in chunk]
+    else:
+        cleaned = [clean_tune(abc, tune_id, profile, *meter) for abc, tune_id, *meter in chunk]
+    return os.getpid(), time.perf_counter() - start, cleaned, profile
+
+
+def clean_chunks(tunes, workers=None, chunksize=256, profile=None, throughput=None, notes=False):
+    """
+    Cleans tunes across a pool of processes, handing back the results of each chunk as soon as it, and every
+    chunk before it, is finished. Takes the same parameters as clean_many.
+    :param throughput: An optional dictionary of process ids to the tunes cleaned and seconds taken, which is added to
+    :return: A generator of lists of CleanResults, or of (CleanResult, NoteArray) pairs with notes, one list for
+    each chunk of tunes, in order
+    """
+    tunes = iter(tunes)
+    profiled = profile is not None
+    workers = workers or os.cpu_count() or 1
+    # The chunks are read from tunes as they're needed, so an iterator of tunes is never held all at once
+    chunks = iter(lambda: list(islice(tunes, chunksize)), [])
+    first = list(islice(chunks, 2))
+    chunks = chain(first, chunks)
+    throughput = dict() if throughput is None else throughput
+
+    def collect(results):
+        for pid, seconds, chunk, chunk_profile in results:
+            count, total = throughput.get(pid, (0, 0))
+            throughput[pid] = count + len(chunk), total + seconds
+            if chunk_profile: profile.merge(chunk_profile)
+            yield chunk
+
+    def run(pool):
+        # Only a couple of chunks per worker are handed out ahead of the one being collected
+        pending = deque(pool.submit(clean_chunk, chunk, profiled, notes) for chunk in islice(chunks, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            for chunk in islice(chunks, 1): pending.append(pool.submit(clean_chunk, chunk, profiled, notes))
+            yield result
+
+    if workers == 1 or len(first) < 2:
+        yield from collect(map(clean_chunk, chunks, repeat(profiled), repeat(notes)))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            yield from collect(run(pool))
+
+
+def clean_many(tunes, workers=None, chunksize=256, verbose=False, profile=None, notes=False):
+    """
+    Cleans a batch of tunes across a pool of processes. Tunes of different meters can be mixed.
+    :param tunes: A list of (abc, tune_id) tuples, or (abc, tune_id, meter) for tunes which aren't in 4/4
+    :param workers: The number of processes to use, defaults to the number of cores.
+    With a single worker the tunes are cleaned in this process.
+    :param chunksize: The number of tunes handed to a worker at a time
+    :param verbose: Flag to print the throughput of each worker, and the reasons tunes were rejected
+    :param profile: An optional Profiler.StageProfile, which the stage timings of every worker are added to
+    :param notes: Flag to also build the NoteArray of each cleaned tune, so it needn't be parsed again
+    :return: A list of CleanResults, in the same order as tunes. With notes, the list of CleanResults and the
+    matching list of NoteArrays, with None for the tunes which were rejected.
+    """
+    throughput = dict()
+    cleaned = [r for chunk in clean_chunks(tunes, workers, chunksize, profile, throughput, notes) for r in chunk]
+    if notes: cleaned, arrays = [r for r, _ in cleaned], [a for _, a in cleaned]
+
+    if verbose:
+        for pid, (count, total) in sorted(throughput.items()):
+            print('Worker {}: {} tunes in {:.2f}s ({:.0f} tunes/s)'.format(pid, count, total, count / max(total, 1e-9)))
+        print_summary(summarize(cleaned))
+    return (cleaned, arrays) if notes else cleaned
 # endregion MAIN
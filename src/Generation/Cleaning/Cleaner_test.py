@@ -1,5 +1,7 @@
+import re
 import unittest
-from src.Generation.Cleaning import Cleaner
+from concurrent.futures import ThreadPoolExecutor
+from src.Generation.Cleaning import Cleaner, Profiler
 
 
 class TestCleaner(unittest.TestCase):
@@ -7,13 +9,15 @@ class TestCleaner(unittest.TestCase):
     def setUp(self):
 
         def rr(string):
-            return Cleaner.remove_repeats(Cleaner.remove_whitespace(string), 'TEST')
+            # Cleans the grammar and unrolls the repeats, leaving the bars joined by single barlines
+            tokens = Cleaner.clean_grammar(string)
+            expanded = Cleaner.expand_repeats(''.join(token.text for token in tokens))
+            return '|'.join(filter(None, re.split(r'[|\]]', '|'.join(expanded))))
 
         self.rr = rr
-        pass
 
     def test_simple_strings(self):
-        def quick_test(test_str, correct='A|B|C|D|]'):
+        def quick_test(test_str, correct='A|B|C|D'):
             self.assertEqual(correct, self.rr(test_str), test_str + ' unsuccessfully converted to ' + correct)
 
         basic1 = 'A|B|C|D||'
@@ -30,10 +34,10 @@ class TestCleaner(unittest.TestCase):
         quick_test(basic4)
         quick_test(basic5)
         quick_test(basic6)
-        quick_test(basic7, 'K:Dmaj|A|B|C|D|]')
+        quick_test(basic7, 'K:Dmaj|A|B|C|D')
 
     def test_simple_repeats(self):
-        def quick_test(test_str, correct='A|A|B|B|C|C|D|D|]'):
+        def quick_test(test_str, correct='A|A|B|B|C|C|D|D'):
             self.assertEqual(correct, self.rr(test_str), test_str + ' unsuccessfully converted to ' + correct)
 
         basic1 = '|:A|:B|:C|:D||'
@@ -53,7 +57,7 @@ class TestCleaner(unittest.TestCase):
         quick_test(basic7)
 
     def test_simple_dual_repeats(self):
-        def quick_test(test_str, correct='A|B|C|E|A|B|C|F|]'):
+        def quick_test(test_str, correct='A|B|C|E|A|B|C|F'):
             self.assertEqual(correct, self.rr(test_str), test_str + ' unsuccessfully converted to ' + correct)
 
         basic1 = 'A|B|C|1E:|2F||'
@@ -75,7 +79,7 @@ class TestCleaner(unittest.TestCase):
         quick_test(basic8)
 
     def test_complex_repeats(self):
-        def quick_test(test_str, correct='AB|CD|AB|CD|EF|EF|]'):
+        def quick_test(test_str, correct='AB|CD|AB|CD|EF|EF'):
             self.assertEqual(correct, self.rr(test_str), test_str + ' unsuccessfully converted to ' + correct)
 
         basic1 = 'AB|CD:||:EF:|'
@@ -86,7 +90,7 @@ class TestCleaner(unittest.TestCase):
         quick_test(basic2)
         quick_test(basic3)
 
-        correct2 = 'A|BCB|BCB|DF|GA|ABC|ABC|DE|DE|]'
+        correct2 = 'A|BCB|BCB|DF|GA|ABC|ABC|DE|DE'
         comp1 = 'A|:BCB:|DF|GA|:ABC|:DE|'
         comp2 = 'A|:BCB:|DF|GA|:ABC::DE|'
         comp3 = 'A|:BCB:|DF|GA|:ABC::DE:|'
@@ -96,7 +100,7 @@ class TestCleaner(unittest.TestCase):
         quick_test(comp3, correct2)
 
     def test_complex_dual_repeats(self):
-        def quick_test(test_str, correct='A|CB|DD|CB|EE|FG|BA|CD|FG|DC|BA|]'):
+        def quick_test(test_str, correct='A|CB|DD|CB|EE|FG|BA|CD|FG|DC|BA'):
             self.assertEqual(correct, self.rr(test_str), test_str + ' unsuccessfully converted to ' + correct)
 
         comp1 = "A|:CB|1DD:|2EE|||:FG|[1BA|CD:|[2DC|BA||"
@@ -112,11 +116,127 @@ class TestCleaner(unittest.TestCase):
         quick_test(comp5)
 
     def test_current_issue(self):
-        def quick_test(test_str, correct='A|CB|DD|CB|EE|FG|BA|CD|FG|DC|BA|]'):
+        def quick_test(test_str, correct='A|CB|DD|CB|EE|FG|BA|CD|FG|DC|BA'):
             self.assertEqual(correct, self.rr(test_str), test_str + ' unsuccessfully converted to ' + correct)
 
         comp6 = "A|:CB|1DD:|2EE|FG|[1BA|CD:||2DC|BA||"
         quick_test(comp6)
 
-
-
+    def test_clean_many(self):
+        tunes = [("|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|" * 4, '1'),
+                 ('A|B|C|D||', '2'),
+                 ("|:dcd fa<dd2|f>d e ddf ed|eAA2A Bc ~d|1 e~d~dc d2fe:|2 e~d~dc d2fe||" * 3, '3')] * 5
+        serial = [Cleaner.clean_tune(abc, tune_id) for abc, tune_id in tunes]
+        self.assertEqual(serial, Cleaner.clean_many(tunes, workers=1))
+        self.assertEqual(serial, Cleaner.clean_many(tunes, workers=2, chunksize=4))
+        chunks = list(Cleaner.clean_chunks(tunes, workers=2, chunksize=4))
+        self.assertEqual(([4, 4, 4, 3], serial), ([len(c) for c in chunks], [r for c in chunks for r in c]))
+
+        # The tunes are only read as the chunks are needed, past the first two which decide whether to start a pool
+        read = []
+        chunks = Cleaner.clean_chunks((read.append(t) or t for t in tunes), workers=1, chunksize=4)
+        self.assertEqual(serial[:4], next(chunks))
+        self.assertEqual(8, len(read))
+        self.assertEqual(serial, serial[:4] + [r for c in chunks for r in c])
+
+    def test_rejections(self):
+        result = Cleaner.clean_tune('A|B|C|D||')
+        self.assertEqual((Cleaner.REJECTED, '!!BAD ABC!!', Cleaner.Reason.SHORT_PIECE, 'bad tunes'), result)
+        result = Cleaner.clean_tune('M:4/4|A|B|C|D||')
+        self.assertEqual((Cleaner.Reason.EXTRA_TIME_SIGNATURE, 'grammar'), (result.reason, result.stage))
+        result = Cleaner.clean_tune('|:AB|1CD|EF||')
+        self.assertEqual((Cleaner.Reason.UNCLOSED_ENDING, 'repeats'), (result.reason, result.stage))
+
+        summary = Cleaner.summarize([Cleaner.clean_tune(abc) for abc in ['A|B||', 'C|D||', 'M:|A||']])
+        self.assertEqual({Cleaner.Reason.SHORT_PIECE: 2, Cleaner.Reason.EXTRA_TIME_SIGNATURE: 1}, summary)
+
+    def test_short_circuit(self):
+        seen = []
+
+        class Recording(Cleaner.Cleaner):
+            def stages(self, tune_id='Test'):
+                return [(name, lambda x, name=name, stage=stage: seen.append((name, x)) or stage(x))
+                        for name, stage in super().stages(tune_id)]
+
+        cleaner = Recording()
+        self.assertEqual('grammar', cleaner.clean_tune('M:4/4|A|B|C|D||').stage)
+        self.assertEqual(['grammar'], [name for name, _ in seen])
+
+        seen.clear()
+        self.assertEqual('repeats', cleaner.clean_tune('|:AB|1CD|EF||').stage)
+        self.assertEqual(['grammar', 'ornaments', 'repeats'], [name for name, _ in seen])
+
+        # No stage is ever handed the '!!BAD ABC' string of the one before it
+        seen.clear()
+        for abc in ['A|B|C|D||', '|:AB|CD|EF|GA:|' * 4, "|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|" * 4]:
+            cleaner.clean_tune(abc)
+        self.assertFalse([name for name, x in seen if isinstance(x, str) and x.startswith('!!BAD ABC')])
+        self.assertEqual('ties', seen[-1][0])
+
+        profile = Profiler.StageProfile()
+        Cleaner.clean_tune('M:4/4|A|B|C|D||', profile=profile)
+        self.assertEqual({'grammar': 1}, {name: s['rejected'] for name, s in profile.as_dict().items()})
+
+    def test_profile(self):
+        tunes = [("|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|" * 4, '1'), ('A|B|C|D||', '2')] * 3
+        profile = Profiler.StageProfile()
+        serial = Cleaner.clean_many(tunes, workers=1)
+        self.assertEqual(serial, Cleaner.clean_many(tunes, workers=2, chunksize=2, profile=profile))
+
+        stages = profile.as_dict()
+        self.assertEqual(['grammar', 'ornaments', 'repeats', 'bad tunes'], list(stages)[:4])
+        self.assertEqual((6, 0), (stages['grammar']['calls'], stages['grammar']['rejected']))
+        self.assertEqual((6, 3), (stages['bad tunes']['calls'], stages['bad tunes']['rejected']))
+        self.assertEqual(3, stages['ties']['calls'])
+        self.assertEqual(len(tunes[0][0]) * 3 + len(tunes[1][0]) * 3, stages['grammar']['chars_in'])
+
+    def test_meters(self):
+        self.assertEqual([4, 2, 6, 9, 7], list(map(Cleaner.beats_per_bar, ['C', 'C|', '6/8', '9/8', '2+3+2/8'])))
+        self.assertRaises(ValueError, Cleaner.Cleaner, 'none')
+
+        jig = '|:DFA dAF|GBd gdB|AFD DFA|BGE E3|DFA dAF|GBd gdB|AFA dAF|GED D3:|' * 2
+        # Bars of a jig are only merged in pairs when it is cleaned as 4/4
+        self.assertEqual('DFAdAF|GBdgdBAFDDFA|', Cleaner.clean(jig)[:20])
+        self.assertEqual('DFAdAF|GBdgdB|AFDDFA|', Cleaner.Cleaner('6/8').clean(jig)[:21])
+        self.assertEqual(Cleaner.Reason.UNKNOWN_METER, Cleaner.clean_tune(jig, meter='none').reason)
+
+        tunes = [(jig, '1', '6/8'), (jig, '2'), ("|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|" * 4, '3')]
+        serial = [Cleaner.clean_tune(*tune[:2], meter=tune[2]) if len(tune) > 2 else Cleaner.clean_tune(*tune)
+                  for tune in tunes]
+        self.assertEqual(serial, Cleaner.clean_many(tunes, workers=1))
+
+        # A single cleaner can be shared between threads
+        cleaner = Cleaner.Cleaner('6/8')
+        with ThreadPoolExecutor(4) as pool:
+            self.assertEqual([cleaner.clean(jig)] * 20, list(pool.map(cleaner.clean, [jig] * 20)))
+
+    def test_remove_ties(self):
+        self.assertEqual('A4', Cleaner.remove_ties('A-A-A-A'))
+        self.assertEqual('A10', Cleaner.remove_ties('A3/2-A/2-A-A-A-A-A-A-A-A'))
+        # Ties between different pitches are dropped
+        self.assertEqual('d2cB2A', Cleaner.remove_ties('d-dcB-B-A'))
+        self.assertEqual('^AA2', Cleaner.remove_ties('^A-A-A'))
+
+    def test_accidentals(self):
+        self.assertEqual('A^FG^F', Cleaner.parse_bar_accidentals('A^FGF'))
+        # Accidentals only carry to notes in the same octave
+        self.assertEqual('^FGF,f', Cleaner.parse_bar_accidentals('^FGF,f'))
+        # Any number of accidentals, each replacing the last for its pitch
+        self.assertEqual('_B^c_B^c=B=B', Cleaner.parse_bar_accidentals('_B^cBc=BB'))
+
+    def test_expand_repeats(self):
+        def quick_test(test_str, correct):
+            bars = '|'.join(Cleaner.expand_repeats(test_str)).split('|')
+            self.assertEqual(correct, '|'.join(filter(None, bars)), test_str + ' unsuccessfully converted to ' + correct)
+
+        quick_test('A|:B|C:|D', 'A|B|C|B|C|D')
+        quick_test('|:A|:B|', 'A|A|B|B')
+        quick_test('A|B|1C:|2D|E:|', 'A|B|C|A|B|D|E|E')
+        quick_test('|:A|1B:|2C|:D|1E:|2F||G', 'A|B|A|C|D|E|D|F|G')
+        # Second endings have as many bars as the first
+        quick_test('|:A|1B|C:|2D|E|F|', 'A|B|C|A|D|E|F')
+
+        self.assertEqual('!!BAD ABC - UNCLOSED ENDING!!', Cleaner.expand_repeats('A|1B|C||'))
+        self.assertEqual('!!BAD ABC - UNOPENED ENDING!!', Cleaner.expand_repeats('A|B:|2C||'))
+        self.assertEqual('!!BAD ABC - NESTED ENDING!!', Cleaner.expand_repeats('A|1B|1C:|2D||'))
+        self.assertEqual('!!BAD ABC - REPEAT IN ENDING!!', Cleaner.expand_repeats('A|1B:|C:|2D||'))
@@ -0,0 +1,165 @@
+"""
+Download keeps a local mirror of The Session's tunes.json, with the ETag, Last-Modified, size and sha256
+of the copy it holds saved alongside it. A refresh sends a conditional request, so an unchanged dump costs a
+single round trip, and a transfer which was cut off is resumed with a Range request rather than restarted.
+
+    python -m src.Generation.Cleaning.Download [url] [mirror]
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import re
+import sys
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from src.Generation.Cleaning import Ingest
+
+MIRROR = os.path.join(Ingest.DATA_FOLDER, 'Raw', 'tunes.json')
+TIMEOUT = 60
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-\d+/(\d+|\*)')
+
+
+# region METADATA
+def meta_path(fname):
+    return fname + '.meta.json'
+
+
+def part_path(fname):
+    return fname + '.part'
+
+
+def load_meta(fname):
+    """
+    :param fname: The path of the mirror
+    :return: The metadata saved with the mirror, or an empty dictionary
+    """
+    try:
+        with open(meta_path(fname)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def save_meta(meta, fname):
+    temp = meta_path(fname) + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(temp, meta_path(fname))
+
+
+def file_hash(fname, chunk_size=Ingest.CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''): digest.update(chunk)
+    return digest
+# endregion METADATA
+
+
+# region FETCHING
+def validator(headers):
+    """
+    :return: The validator to resume a download with, a strong ETag or else the Last-Modified date
+    """
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'): return etag
+    return headers.get('last_modified')
+
+
+def request_headers(url, fname, meta):
+    """
+    :return: The headers to send, and the number of bytes of the partial download the response should follow on from
+    """
+    partial = meta.get('partial') or dict()
+    part = part_path(fname)
+    if partial.get('url') == url and validator(partial) and os.path.exists(part):
+        start = os.path.getsize(part)
+        return {'Range': 'bytes={}-'.format(start), 'If-Range': validator(partial)}, start
+
+    headers = dict()
+    if meta.get('url') == url and os.path.exists(fname) and os.path.getsize(fname) == meta.get('size'):
+        if meta.get('etag'): headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'): headers['If-Modified-Since'] = meta['last_modified']
+    return headers, 0
+
+
+def restart(url, fname, chunk_size, timeout):
+    """
+    Throws away a partial download which can't be resumed and downloads the file from the start.
+    """
+    if os.path.exists(part_path(fname)): os.remove(part_path(fname))
+    return fetch(url, fname, chunk_size, timeout)
+
+
+def fetch(url=Ingest.URL, fname=MIRROR, chunk_size=Ingest.CHUNK_SIZE, timeout=TIMEOUT):
+    """
+    Brings the local mirror of a url up to date. If the transfer is cut off, what arrived is kept, and the
+    next call carries on from there as long as the file upstream is still the same one.
+    :param url: The url to mirror
+    :param fname: The path of the mirror
+    :param chunk_size: The number of bytes to read at a time
+    :param timeout: The number of seconds to wait on the server
+    :return: True if the mirror changed, False if upstream hasn't changed since the last fetch
+    """
+    if os.path.dirname(fname): os.makedirs(os.path.dirname(fname), exist_ok=True)
+    meta = load_meta(fname)
+    headers, start = request_headers(url, fname, meta)
+    try:
+        resp = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304: return False
+        # The partial download is no longer a prefix of the file, most likely as it got shorter
+        if e.code == 416 and start: return restart(url, fname, chunk_size, timeout)
+        raise
+
+    with resp:
+        if resp.status == 206:
+            match = CONTENT_RANGE_RE.match(resp.headers.get('Content-Range', ''))
+            if not match or int(match.group(1)) != start: return restart(url, fname, chunk_size, timeout)
+            total = None if match.group(2) == '*' else int(match.group(2))
+        else:
+            # The server sent the whole file, either as it changed or as it doesn't do ranges
+            start = 0
+            length = resp.headers.get('Content-Length')
+            total = int(length) if length else None
+
+        found = {'url': url, 'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+        meta['partial'] = found
+        save_meta(meta, fname)
+
+        digest = file_hash(part_path(fname), chunk_size) if start else hashlib.sha256()
+        with open(part_path(fname), 'ab' if start else 'wb') as f:
+            try:
+                for chunk in iter(lambda: resp.read(chunk_size), b''):
+                    f.write(chunk)
+                    digest.update(chunk)
+            except http.client.IncompleteRead as e:
+                f.write(e.partial)
+                digest.update(e.partial)
+            f.flush()
+            os.fsync(f.fileno())
+
+    size = os.path.getsize(part_path(fname))
+    if total is not None and size != total:
+        if size > total: os.remove(part_path(fname))
+        raise OSError('Download of "{}" stopped at {} of {} bytes, fetch again to resume'.format(url, size, total))
+
+    sha256 = digest.hexdigest()
+    changed = sha256 != meta.get('sha256') or not os.path.exists(fname)
+    os.replace(part_path(fname), fname)
+    save_meta(dict(found, size=size, sha256=sha256, fetched=str(datetime.now())), fname)
+    return changed
+# endregion FETCHING
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else Ingest.URL
+    mirror = sys.argv[2] if len(sys.argv) > 2 else MIRROR
+    if fetch(source, mirror):
+        print('Downloaded "{}" to "{}"'.format(source, mirror))
+    else:
+        print('"{}" is up to date'.format(mirror))
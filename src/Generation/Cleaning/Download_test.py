@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.Generation.Cleaning import Download
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    A stand in for Github, which serves one file with an ETag and supports conditional and range requests.
+    Setting cut drops the connection after that many bytes of the body.
+    """
+    body, etag, cut = b'', '"1"', None
+    last_modified = 'Sat, 01 Jun 2019 00:00:00 GMT'
+    requests = []
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == cls.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        ranged = self.headers.get('Range')
+        if ranged and self.headers.get('If-Range') in (cls.etag, cls.last_modified):
+            start = int(ranged[len('bytes='):-1])
+            if start >= len(cls.body):
+                self.send_response(416)
+                self.end_headers()
+                return
+        body = cls.body[start:]
+        self.send_response(206 if start else 200)
+        if start: self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(cls.body) - 1, len(cls.body)))
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', cls.etag)
+        self.send_header('Last-Modified', cls.last_modified)
+        self.end_headers()
+        if cls.cut is not None:
+            body = body[:cls.cut]
+            cls.cut = None
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        Handler.body, Handler.etag, Handler.cut, Handler.requests = b'[' + b'{"abc": "ABcd|"},' * 5000 + b'{}]', '"1"', None, []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/tunes.json'.format(self.server.server_port)
+        self.folder = tempfile.TemporaryDirectory()
+        self.mirror = os.path.join(self.folder.name, 'Raw', 'tunes.json')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+    def read(self):
+        with open(self.mirror, 'rb') as f: return f.read()
+
+    def test_conditional(self):
+        self.assertTrue(Download.fetch(self.url, self.mirror))
+        self.assertEqual(Handler.body, self.read())
+        meta = Download.load_meta(self.mirror)
+        self.assertEqual(('"1"', len(Handler.body)), (meta['etag'], meta['size']))
+        self.assertEqual(Download.file_hash(self.mirror).hexdigest(), meta['sha256'])
+
+        # Nothing changed upstream, so nothing is sent
+        self.assertFalse(Download.fetch(self.url, self.mirror))
+        self.assertEqual('"1"', Handler.requests[-1]['If-None-Match'])
+
+        Handler.body, Handler.etag = Handler.body.replace(b'ABcd', b'EFga'), '"2"'
+        self.assertTrue(Download.fetch(self.url, self.mirror))
+        self.assertEqual(Handler.body, self.read())
+
+        # The whole file came again, but its contents are the same
+        Handler.etag = '"3"'
+        self.assertFalse(Download.fetch(self.url, self.mirror))
+
+    def test_resume(self):
+        Handler.cut = 1000
+        with self.assertRaises(OSError):
+            Download.fetch(self.url, self.mirror)
+        self.assertFalse(os.path.exists(self.mirror))
+        self.assertEqual(1000, os.path.getsize(Download.part_path(self.mirror)))
+
+        self.assertTrue(Download.fetch(self.url, self.mirror))
+        self.assertEqual(('bytes=1000-', '"1"'), (Handler.requests[-1]['Range'], Handler.requests[-1]['If-Range']))
+        self.assertEqual(Handler.body, self.read())
+        self.assertEqual(Download.file_hash(self.mirror).hexdigest(), Download.load_meta(self.mirror)['sha256'])
+        self.assertFalse(os.path.exists(Download.part_path(self.mirror)))
+
+    def test_resume_changed(self):
+        # The file changed upstream since the transfer was cut off, so it starts again
+        Handler.cut = 1000
+        with self.assertRaises(OSError):
+            Download.fetch(self.url, self.mirror)
+        Handler.body, Handler.etag = b'[{"abc": "z8|"}]', '"2"'
+        self.assertTrue(Download.fetch(self.url, self.mirror))
+        self.assertEqual(Handler.body, self.read())
+
+        # A partial download longer than the new file can't be resumed either
+        Handler.body, Handler.etag = b'[]', '"3"'
+        with open(Download.part_path(self.mirror), 'wb') as f: f.write(b'[{"abc"')
+        Download.save_meta(dict(Download.load_meta(self.mirror), partial={'url': self.url, 'etag': '"3"'}), self.mirror)
+        self.assertTrue(Download.fetch(self.url, self.mirror))
+        self.assertEqual(b'[]', self.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
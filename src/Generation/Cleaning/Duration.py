@@ -0,0 +1,86 @@
+"""
+Duration does exact arithmetic on note lengths. A duration is a tuple of ints in the form (numerator, denominator),
+always in lowest terms, and measured in multiples of the tune's default note length.
+"""
+
+from functools import lru_cache
+from math import gcd
+
+from src.Generation.Cleaning import Lexer
+
+ZERO = (0, 1)
+ONE = (1, 1)
+
+
+def reduce(num, den):
+    """
+    :return: The fraction num/den in lowest terms
+    """
+    common = gcd(num, den)
+    return (num // common, den // common) if common > 1 else (num, den)
+
+
+def add(a, b):
+    """
+    :return: The sum of two durations
+    """
+    if a[1] == b[1]: return reduce(a[0] + b[0], a[1])
+    return reduce(a[0] * b[1] + b[0] * a[1], a[1] * b[1])
+
+
+def scale(a, num, den=1):
+    """
+    :return: A duration multiplied by num/den
+    """
+    return reduce(a[0] * num, a[1] * den)
+
+
+def divides(a, beats):
+    """
+    :return: Whether a duration is a whole number of beats, which is exact unlike a float modulo
+    """
+    # A '/0' length can reach here before the tune is rejected for its invalid characters
+    return a[1] != 0 and a[0] % (beats * a[1]) == 0
+
+
+@lru_cache(maxsize=Lexer.MEMO_SIZE)
+def parse(length):
+    """
+    Takes the length part of a note, such as '', '3', '/2' or '3/2', and returns it as a duration
+    """
+    return reduce(*Lexer.note_length(length))
+
+
+@lru_cache(maxsize=Lexer.MEMO_SIZE)
+def to_length(duration):
+    """
+    Takes a duration and returns it as the length part of a note, leaving out the default length of 1
+    """
+    num, den = duration
+    if den == 1: return '' if num == 1 else str(num)
+    return '{}/{}'.format(num, den)
+
+
+@lru_cache(maxsize=2 ** 16)
+def bar_length(bar):
+    """
+    Takes the abc string of a cleaned bar and returns the total duration of its notes.
+    Most bars of a tune repeat, so each is only counted once.
+    """
+    num, den = ZERO
+    for length in Lexer.note_lengths(bar):
+        a, b = parse(length)
+        if b == den:
+            num += a
+        else:
+            num, den = num * b + a * den, den * b
+    return reduce(num, den)
+
+
+def total_length(bars):
+    """
+    :return: The total duration of a list of bars
+    """
+    total = ZERO
+    for bar in bars: total = add(total, bar_length(bar))
+    return total
@@ -0,0 +1,28 @@
+import unittest
+from src.Generation.Cleaning import Duration
+
+
+class TestDuration(unittest.TestCase):
+
+    def test_arithmetic(self):
+        self.assertEqual((3, 4), Duration.add((1, 2), (1, 4)))
+        self.assertEqual((1, 1), Duration.add((1, 3), (2, 3)))
+        self.assertEqual((1, 3), Duration.scale((2, 3), 1, 2))
+        self.assertTrue(Duration.divides((8, 1), 4))
+        self.assertTrue(Duration.divides((12, 3), 4))
+        self.assertFalse(Duration.divides((11, 3), 4))
+
+    def test_lengths(self):
+        self.assertEqual((1, 2), Duration.parse('2/4'))
+        self.assertEqual('', Duration.to_length((1, 1)))
+        self.assertEqual('3', Duration.to_length((3, 1)))
+        self.assertEqual('3/2', Duration.to_length((3, 2)))
+
+    def test_bar_length(self):
+        self.assertEqual((8, 1), Duration.bar_length('GD1/2G3/2ABAGF'))
+        self.assertEqual((7, 1), Duration.bar_length('G2GBd2/3d2/3d2/3B'))
+        self.assertEqual((15, 1), Duration.total_length(['GD1/2G3/2ABAGF', 'G2GBd2/3d2/3d2/3B', '']))
+
+
+if __name__ == '__main__':
+    unittest.main()
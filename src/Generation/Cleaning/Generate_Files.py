@@ -1,80 +1,117 @@
 from src.Generation.Cleaning import Cleaner as Clean
-from datetime import datetime
-from requests import get
-from requests.exceptions import RequestException
-from contextlib import closing
-import ast
+from src.Generation.Cleaning import Download, Ingest, NoteArray, TuneStore
+from collections import Counter
+from itertools import islice
+import os
 
+# The number of tunes cleaned at a time by clean_dicts, each batch is handed on as soon as it is cleaned
+BATCH_SIZE = 4096
 
-def update_tunes():
+
+def update_tunes(url=Ingest.URL, fname=Ingest.RAW_STORE, mirror=Download.MIRROR):
     """
-    Gets the tunes from "The Session"'s Github page, and prints it
-    as a python dictionary.
+    Brings the local mirror of "The Session"'s tunes.json up to date, and streams its tunes
+    into the raw tune store one at a time. Nothing is rebuilt when the dump hasn't changed.
+    :param url: The url of the tunes.json dump.
+    :param fname: Path to the store to write.
+    :param mirror: Path to keep the downloaded tunes.json at.
+    :return: True if the store was rebuilt.
     """
-    url = 'https://raw.githubusercontent.com/adactio/TheSession-data/master/json/tunes.json'
     try:
-        with closing(get(url, stream=True)) as resp:
-            with open('../../Data/Raw/The_Session_Raw.py', 'w') as f:
-                text = resp.content.decode('utf-8')
-                temp = ast.literal_eval(text)
-
-                f.write("created = '" + str(datetime.now()) + "'\n\n")
-                f.write("tunes = [\n")
-                while True:
-                    tune = temp.pop()
-                    f.write(str(tune))
-                    if len(temp) == 0: break
-                    f.write(",\n")
-                f.write("\n]")
-    except RequestException as e:
+        changed = Download.fetch(url, mirror)
+        if not changed and os.path.exists(fname) and os.path.getmtime(fname) >= os.path.getmtime(mirror):
+            print("The Session's tunes haven't changed, skipping update...")
+            return False
+        print('{} tunes written to "{}"'.format(Ingest.update_store(mirror, fname), fname))
+        return True
+    except (OSError, ValueError) as e:
         print(e)
+        return False
 
 
-def create_dict_list(tunes, types=None, meters=None, modes=None):
+def create_dict_list(tunes, types=None, meters=None, modes=None, workers=1, cache=None, profile=None, catalog=None):
     """
     Creates a list of tunes dictionaries, which can be restricted based on style/time.
-    :param tunes: List of 'tune' dictionaries.
+    Takes the same parameters as clean_dicts.
+    :return: A list of relevant tune dictionaries.
+    """
+    return list(clean_dicts(tunes, types, meters, modes, workers, cache, profile, catalog))
+
+
+def clean_dicts(tunes, types=None, meters=None, modes=None, workers=1, cache=None, profile=None, catalog=None,
+                batch_size=BATCH_SIZE, notes=False):
+    """
+    Cleans the tunes dictionaries which fit the parameters a batch at a time, handing back each batch as soon
+    as it is cleaned, so the cleaned tunes can be written out without holding them all.
+    :param tunes: An iterable of 'tune' dictionaries, such as the generator from Ingest.read_store.
     :param types: A list of strings which is checked against the appropriate dict key.
     Skips parsing the tune if it doesn't fit the parameters.
     :param meters: A list of strings which is checked against the appropriate dict key.
     Skips parsing the tune if it doesn't fit the parameters.
     :param modes: A list of strings which is checked against the appropriate dict key.
     Skips parsing the tune if it doesn't fit the parameters.
-    :return: A sorted list of relevant tun dictionaries.
+    :param workers: The number of processes to clean the tunes with. None uses every core.
+    :param cache: An optional Cache.TuneCache, so tunes cleaned by an earlier run aren't cleaned again.
+    :param profile: An optional Profiler.StageProfile to record the time spent in each cleaning stage.
+    :param catalog: An optional Catalog.TuneCatalog to record which tunes the cleaner kept.
+    :param batch_size: The number of tunes to clean at a time.
+    :param notes: Flag to add the NoteArray of each cleaned tune, under 'note_array'.
+    :return: A generator of the cleaned tune dictionaries, in the order they were read.
     """
-    cleaned = list()
-    tunes = sorted(tunes, key=lambda x: int(x['setting']), reverse=True)
-    for t in tunes:
+    types, meters, modes = set(types or []), set(meters or []), set(modes or [])
+    total = 0
+
+    def select():
+        nonlocal total
+        for t in tunes:
+            total += 1
+
+            if types and t['type'] not in types: continue
+            if meters and t['meter'] not in meters: continue
+            if modes and t['mode'] not in modes: continue
+
+            tune = dict()
+            cats = ["tune", "setting", "type", "meter", "mode", "abc"]
+            for c in cats: tune[c] = t[c]
+            yield tune
 
-        if types and t['type'] not in types: continue
-        if meters and t['meter'] not in meters: continue
-        if modes and t['mode'] not in modes: continue
+    # Clean the tunes in parallel, each by the rules of its own meter, keeping the ones which survive.
+    # Only a batch of the tunes is read at a time, so they needn't all fit in memory.
+    clean_many = cache.clean_many if cache else Clean.clean_many
+    summary = Counter()
+    count = 0
+    selected = select()
+    cleaned = 0
+    for batch in iter(lambda: list(islice(selected, batch_size)), []):
+        results = clean_many([(t['abc'], t['setting'], t['meter']) for t in batch], workers=workers, profile=profile,
+                             notes=notes)
+        results, arrays = results if notes else (results, [None] * len(batch))
+        if catalog is not None: catalog.mark([t['setting'] for t in batch], results)
+        summary.update(Clean.summarize(results))
+        cleaned += len(batch)
+        print('Cleaned {} tunes...'.format(cleaned))
 
-        tune = dict()
-        cats = ["tune", "setting", "type", "meter", "mode"]
-        for c in cats: tune[c] = t[c]
-        tune['abc'] = Clean.clean(t['abc'], tune['setting'])
-        if tune['abc'] != '!!BAD ABC!!':
-            cleaned.append(tune)
+        for tune, result, array in zip(batch, results, arrays):
+            if result.status == Clean.CLEANED:
+                count += 1
+                yield dict(tune, abc=result.abc, note_array=array) if notes else dict(tune, abc=result.abc)
 
-    print('{}/{} tunes successfully cleaned!'.format(len(cleaned), len(tunes)))
-    return cleaned
+    Clean.print_summary(summary)
+    print('{}/{} tunes successfully cleaned!'.format(count, total))
 
 
-def dicts_to_file(cleaned, fname):
+def dicts_to_file(cleaned, fname, notes=False):
     """
-    Takes a list of tune dictionaries and prints it to a file,
-    as a dictionary using setting as the key.
-    :param cleaned: List of tunes dictionaries.
-    :param fname: Path to the file to print.
+    Takes an iterable of tune dictionaries, such as the generator from clean_dicts, and writes it to a tune store,
+    which TuneStore.read_dict loads back as a dictionary using setting as the key. The store is replaced
+    atomically, so an interrupted run leaves the previous one in place.
+    :param cleaned: Iterable of tunes dictionaries, which is left as it is.
+    :param fname: Path to the store to write, which is replaced rather than added to.
+    :param notes: Flag to also write the 'note_array' of each tune into the store, as NoteArray.STORE_ARRAYS,
+    such as for the tunes from clean_dicts with notes. They are streamed and replaced along with the tunes.
+    :return: The number of tunes in the store.
     """
-    with open(fname, 'w') as f:
-        f.write("created = '" + str(datetime.now()) + "'\n\n")
-        f.write("tunes = {\n")
-        while True:
-            tune = cleaned.pop()
-            f.write(tune['setting'] + " : " + str(tune))
-            if len(cleaned) == 0: break
-            f.write(",\n")
-        f.write("\n}")
+    if not notes: return TuneStore.write(cleaned, fname, columns=TuneStore.TUNE_COLUMNS)
+    cleaned = (dict(tune, **NoteArray.to_store(tune['note_array'])) for tune in cleaned)
+    return TuneStore.write(cleaned, fname, columns=TuneStore.TUNE_COLUMNS, arrays=NoteArray.STORE_ARRAYS)
 
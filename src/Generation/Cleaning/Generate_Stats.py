@@ -80,5 +80,5 @@ def parse_stats(tunes, outfile=None):
 
 
 if __name__ == '__main__':
-    from Data.Raw.The_Session_Raw import tunes
-    parse_stats(tunes, '../../Data/Statistics/The_Session_Raw.txt')
+    from src.Generation.Cleaning import Ingest
+    parse_stats(Ingest.read_store(), '../../Data/Statistics/The_Session_Raw.txt')
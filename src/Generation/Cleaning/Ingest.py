@@ -0,0 +1,142 @@
+"""
+Ingest streams the tunes out of The Session's tunes.json, from a local copy or straight from the download,
+one record at a time, and keeps them in a TuneStore. The dump is never held in memory whole, and the
+store spools its columns to disk as it goes, so memory stays flat however large the dump grows.
+
+    python -m src.Generation.Cleaning.Ingest [tunes.json or url] [store]
+"""
+
+import codecs
+import json
+import os
+import re
+import sys
+import urllib.request
+
+from src.Generation.Cleaning import TuneStore
+
+URL = 'https://raw.githubusercontent.com/adactio/TheSession-data/master/json/tunes.json'
+DATA_FOLDER = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'Data'))
+RAW_STORE = os.path.join(DATA_FOLDER, 'Raw', 'The_Session_Raw' + TuneStore.EXTENSION)
+CHUNK_SIZE = 2 ** 16
+# The most text a single record can take up, so a malformed one is reported rather than read on to the end of the dump
+MAX_RECORD_SIZE = 4 * CHUNK_SIZE
+
+# Newer dumps name the ids 'tune_id' and 'setting_id', the rest of the code uses the old names
+RENAMED_KEYS = {'tune_id': 'tune', 'setting_id': 'setting'}
+
+WHITESPACE_RE = re.compile(r'\s*')
+# The commas between the records of the array
+SEPARATOR_RE = re.compile(r'[\s,]*')
+
+
+# region PARSING
+def iter_json_array(chunks, max_record_size=MAX_RECORD_SIZE):
+    """
+    Incrementally parses a JSON array, only keeping the unparsed end of the text in memory.
+    :param chunks: An iterable of bytes (utf-8) or str, which together make up the array
+    :param max_record_size: The number of characters past the end of the last item after which
+    the next one is taken to be malformed, instead of cut off by the end of the chunk
+    :return: A generator of the items of the array
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    chunks = iter(chunks)
+    # The character offset of the start of the buffer in the whole text
+    buffer, pos, offset = '', 0, 0
+    started, eof = False, False
+    while True:
+        pos = (SEPARATOR_RE if started else WHITESPACE_RE).match(buffer, pos).end()
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[': raise ValueError('Expected a JSON array, found "{}"'.format(buffer[pos]))
+                started, pos = True, pos + 1
+                continue
+            if buffer[pos] == ']': return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                # The item is most likely cut off by the end of the chunk, unless it has already run on too long
+                if eof: raise
+                if len(buffer) - pos > max_record_size:
+                    raise ValueError('No JSON item within {} characters of offset {}: {}'.format(
+                        max_record_size, offset + pos, e.msg)) from e
+            else:
+                # A number which runs to the end of the buffer might carry on in the next chunk
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    continue
+        if eof: raise ValueError('The JSON array ends early')
+
+        chunk = next(chunks, None)
+        eof = chunk is None
+        if eof or isinstance(chunk, bytes): chunk = text.decode(chunk or b'', final=eof)
+        buffer, pos, offset = buffer[pos:] + chunk, 0, offset + pos
+
+
+def file_chunks(fname, chunk_size=CHUNK_SIZE):
+    with open(fname, 'rb') as f:
+        yield from iter(lambda: f.read(chunk_size), b'')
+
+
+def url_chunks(url, chunk_size=CHUNK_SIZE):
+    with urllib.request.urlopen(url) as resp:
+        yield from iter(lambda: resp.read(chunk_size), b'')
+
+
+def normalize(record):
+    """
+    Renames the ids of a record from a newer dump to 'tune' and 'setting', and makes them strings.
+    """
+    for new, old in RENAMED_KEYS.items():
+        if new in record: record.setdefault(old, record.pop(new))
+    for key in RENAMED_KEYS.values():
+        if key in record: record[key] = str(record[key])
+    return record
+
+
+def read_json(source, chunk_size=CHUNK_SIZE):
+    """
+    :param source: The path or url of a tunes.json dump
+    :return: A generator of tune dictionaries
+    """
+    is_url = source.startswith(('http://', 'https://'))
+    chunks = url_chunks(source, chunk_size) if is_url else file_chunks(source, chunk_size)
+    for record in iter_json_array(chunks):
+        yield normalize(record)
+# endregion PARSING
+
+
+# region STORE
+def write_store(tunes, fname=RAW_STORE):
+    """
+    Writes a stream of tune dictionaries to a store, keeping every field of the dump. The store only
+    replaces the old one once complete, so a failed download leaves it intact.
+    :return: The number of tunes written
+    """
+    return TuneStore.write(tunes, fname)
+
+
+def read_store(fname=RAW_STORE, columns=None, **filters):
+    """
+    :param columns: The columns to read, every column by default
+    :param filters: Column names mapped to lists of allowed values, such as meter=['4/4']
+    :return: A list of the tune dictionaries in a store
+    """
+    return TuneStore.read(fname, columns, **filters)
+
+
+def update_store(source=URL, fname=RAW_STORE):
+    """
+    Streams the tunes from a tunes.json dump into a store.
+    :return: The number of tunes stored
+    """
+    return write_store(read_json(source), fname)
+# endregion STORE
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else URL
+    store = sys.argv[2] if len(sys.argv) > 2 else RAW_STORE
+    print('{} tunes written to "{}"'.format(update_store(source, store), store))
@@ -0,0 +1,66 @@
+import itertools
+import json
+import os
+import tempfile
+import unittest
+from src.Generation.Cleaning import Ingest
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tunes = [{'tune_id': '1', 'setting_id': '12', 'name': 'Ríl Mhór', 'meter': '4/4', 'abc': 'ABc|d2e2||'},
+                      {'tune_id': 2, 'setting_id': 30, 'name': 'The "Boys"', 'meter': '6/8', 'abc': 'A,\\nB,|'},
+                      {'tune': '3', 'setting': '4', 'name': '', 'meter': '4/4', 'abc': '', 'count': -1.5e3}]
+        self.text = ' \n[ ' + ',\n  '.join(json.dumps(t, ensure_ascii=False) for t in self.tunes) + ' ]\n'
+
+    def test_chunks(self):
+        data = self.text.encode('utf-8')
+        expected = json.loads(self.text)
+        # Every chunk size splits the records, and the multi-byte characters, in different places
+        for size in [1, 2, 3, 7, 64, len(data)]:
+            chunks = [data[x:x + size] for x in range(0, len(data), size)]
+            self.assertEqual(expected, list(Ingest.iter_json_array(chunks)))
+        self.assertEqual([12, 3.5, [1, 2]], list(Ingest.iter_json_array(['[1', '2,3', '.5,[1', ',2]]'])))
+        self.assertEqual([], list(Ingest.iter_json_array([b'\xef\xbb\xbf[ ]'])))
+
+    def test_errors(self):
+        for text in ['', '{"a": 1}', '[{"a": 1}, {"b": ', '[1, 2']:
+            with self.assertRaises(ValueError):
+                list(Ingest.iter_json_array([text]))
+
+    def test_malformed(self):
+        # A broken record is reported once it runs past the cap, without reading on to the end of the dump
+        read = []
+        chunks = itertools.chain(['[{"abc": "A|"}, {"abc": "B|"}, {"abc" "C|"},'], itertools.repeat('{"abc": "D|"},'))
+        chunks = (read.append(chunk) or chunk for chunk in chunks)
+        with self.assertRaisesRegex(ValueError, 'offset 31'):
+            list(Ingest.iter_json_array(chunks, max_record_size=100))
+        self.assertLess(len(read), 20)
+
+    def test_streaming(self):
+        # The records are yielded as they arrive, without waiting for the end of the array
+        chunks = itertools.chain(['['], itertools.repeat('{"abc": "ABcd|"},'))
+        self.assertEqual([{'abc': 'ABcd|'}] * 3, list(itertools.islice(Ingest.iter_json_array(chunks), 3)))
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as folder:
+            source = os.path.join(folder, 'tunes.json')
+            with open(source, 'w', encoding='utf-8') as f: f.write(self.text)
+            store = os.path.join(folder, 'Raw', 'tunes.npz')
+            self.assertEqual(3, Ingest.update_store(source, store))
+
+            tunes = list(Ingest.read_store(store))
+            self.assertEqual([('1', '12'), ('2', '30'), ('3', '4')], [(t['tune'], t['setting']) for t in tunes])
+            self.assertEqual(['Ríl Mhór', 'A,\\nB,|'], [tunes[0]['name'], tunes[1]['abc']])
+            self.assertNotIn('setting_id', tunes[0])
+
+            # A failed update leaves the old store in place
+            with open(source, 'w') as f: f.write('[{"tune": "5"},')
+            with self.assertRaises(ValueError): Ingest.update_store(source, store)
+            self.assertEqual(tunes, list(Ingest.read_store(store)))
+            self.assertEqual(['tunes.npz'], os.listdir(os.path.dirname(store)))
+
+
+if __name__ == '__main__':
+    unittest.main()
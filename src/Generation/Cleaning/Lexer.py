@@ -0,0 +1,212 @@
+"""
+Lexer splits an abc string into a stream of typed tokens in a single pass.
+
+Only the cleaner's grammar and ornament stages run over the token stream. The tokens are then joined
+back into a string for the repeats to be expanded, and the later stages work on the string of each
+distinct bar, with the note lengths, swing, triplets and ties still rewritten by regular expressions.
+Tunes whose decorations could be changed by the grammar rewrites are rewritten as a whole string
+before they are tokenized, to match the old cleaner.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+from itertools import repeat
+
+# region TOKEN KINDS
+NOTE = 'note'
+BARLINE = 'barline'
+REPEAT = 'repeat'
+ENDING = 'ending'
+TUPLET = 'tuplet'
+TIE = 'tie'
+BROKEN = 'broken'
+DECORATION = 'decoration'
+GRACE = 'grace'
+ANNOTATION = 'annotation'
+SLUR = 'slur'
+ORNAMENT = 'ornament'
+OTHER = 'other'
+# A run of notes and stray characters which hasn't been split into notes yet
+NOTES = 'notes'
+# endregion TOKEN KINDS
+
+# region REGULAR EXPRESSION OBJECTS
+# Everything which isn't part of a note. A '1' is always an ending, and a '2' is only
+# picked up as one when it directly follows a barline; otherwise it is a note length.
+# The lookahead lets the scan skip over notes without trying each alternative.
+SPECIAL_RE = re.compile(r'''((?=[|:\[\]1.~HLMOPSTuv*$J<>()"!+{-])'''
+                        r'''(?:(?:[|:\[\]]|1\.?)+(?:(?<=[|\[\]])2\.?)?|[.~HLMOPSTuv*$J]|[<>]+|-+|\([02-9]|[()]'''
+                        r'''|".*?"|!.{1,16}!|\+.{1,16}\+|\{(?:[\^=,'/]|[^\W1])+?\}|!))''')
+CONTENT_RE = re.compile(r'''([_=^]*)([a-gzA-G])([,']*)([02-9/]*)|([^a-gzA-G]+?(?=[_=^]*[a-gzA-G]|$))''')
+NOTES_RE = re.compile(r'''(?:[_=^]*[a-gzA-G][,']*[02-9/]*)*''')
+NOTE_PARTS_RE = re.compile(r'''([_=^]*)([a-gzA-G])([,']*)([02-9/]*)''')
+
+# Once a tune is cleaned into bars, the only marks left are triplets, ties and swing,
+# and a '1' can only be part of a note length
+BAR_SPECIAL_RE = re.compile(r'''(T|-+|[<>]+)''')
+BAR_CONTENT_RE = re.compile(r'''([_=^]*)([a-gzA-G])([,']*)([\d/]*)|([^a-gzA-G]+?(?=[_=^]*[a-gzA-G]|$))''')
+BAR_NOTES_RE = re.compile(r'''(?:[_=^]*[a-gzA-G][,']*[\d/]*)*''')
+BAR_NOTE_PARTS_RE = re.compile(r'''([_=^]*)([a-gzA-G])([,']*)([\d/]*)''')
+BAR_LENGTHS_RE = re.compile(r'''[a-gzA-G][,']*([\d/]*)''')
+LENGTH_RE = re.compile(r'(\d*)/?(\d*)')
+# endregion REGULAR EXPRESSION OBJECTS
+
+# The most entries any memo of tokens or lengths holds, so a corpus of odd text can't grow them without end
+MEMO_SIZE = 2 ** 16
+
+class Token(namedtuple('Token', ['kind', 'text'])):
+    """
+    Any piece of the abc string which isn't a note.
+    """
+    __slots__ = ()
+
+
+class Note(namedtuple('Note', ['accidental', 'pitch', 'octave', 'length'])):
+    """
+    A single note (or rest), split into its accidental, pitch, octave marks and length.
+    """
+    __slots__ = ()
+    kind = NOTE
+
+    @property
+    def text(self):
+        return self.accidental + self.pitch + self.octave + self.length
+
+    @property
+    def duration(self):
+        return note_length(self.length)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def note_length(length):
+    """
+    Takes the length part of a note and returns it as a fraction.
+    Only the leading 'n/d' is read, so '//' counts as a whole note,
+    just as the old ISOLATE_TIME_RE based counting did.
+    :param length: A note length string, such as '', '3', '/2' or '3/2'
+    :return: A tuple of ints in the form (numerator, denominator)
+    """
+    num, den = LENGTH_RE.match(length).groups()
+    return int(num) if num else 1, int(den) if den else 1
+
+
+def barline_kind(text):
+    """
+    Returns the kind of a run of barline characters
+    """
+    if '1' in text or '2' in text:
+        return ENDING
+    elif ':' in text:
+        return REPEAT
+    return BARLINE
+
+
+def special_kind(text, bar=False):
+    """
+    Returns the kind of a piece of the abc string matched by SPECIAL_RE or BAR_SPECIAL_RE
+    """
+    c = text[0]
+    if c in '|:[]1':
+        return barline_kind(text)
+    elif c == '-':
+        return TIE
+    elif c in '<>':
+        return BROKEN
+    elif c == 'T' and bar:
+        return TUPLET
+    elif c == '(':
+        return TUPLET if len(text) == 2 else SLUR
+    elif c == ')':
+        return SLUR
+    elif c == '"':
+        return ANNOTATION
+    elif c == '{':
+        return GRACE
+    elif c in '!+' and len(text) > 1:
+        return DECORATION
+    return ORNAMENT
+
+
+class SpecialTokens(dict):
+    """
+    Hands out a single shared Token for each distinct piece of text, so that
+    tokens can be looked up in bulk rather than built one at a time. Once it
+    holds MEMO_SIZE tokens it starts over, so stray text can't grow it forever.
+    """
+
+    def __init__(self, bar=False):
+        super().__init__()
+        self.bar = bar
+
+    def __missing__(self, text):
+        if len(self) >= MEMO_SIZE: self.clear()
+        token = self[text] = Token(special_kind(text, self.bar), text)
+        return token
+
+
+SPECIAL_TOKENS = SpecialTokens()
+BAR_SPECIAL_TOKENS = SpecialTokens(bar=True)
+EMPTY_NOTES = Token(NOTES, '')
+
+
+def lex_content(content, bar=False):
+    """
+    Takes a piece of the abc string which only holds notes and stray characters,
+    and returns a list of tokens.
+    :param content: A spaceless abc string
+    :param bar: If the string comes from a cleaned bar, rather than a raw tune
+    :return: A list of tokens
+    """
+    if (BAR_NOTES_RE if bar else NOTES_RE).fullmatch(content):
+        return list(map(tuple.__new__, repeat(Note), (BAR_NOTE_PARTS_RE if bar else NOTE_PARTS_RE).findall(content)))
+
+    tokens = []
+    for acc, pitch, octave, length, other in (BAR_CONTENT_RE if bar else CONTENT_RE).findall(content):
+        if pitch:
+            tokens.append(Note(acc, pitch, octave, length))
+        else:
+            tokens.append(Token(OTHER, other))
+    return tokens
+
+
+def tokenize(abc, bar=False, notes=True):
+    """
+    Scans a spaceless abc string once, and returns it as a list of tokens.
+    Notes are returned as Note tuples, everything else as Token tuples.
+    :param abc: A spaceless abc string
+    :param bar: If the string is a cleaned bar, rather than a raw tune
+    :param notes: If False, each run of notes is left as a single NOTES token
+    :return: A list of tokens
+    """
+    pieces = (BAR_SPECIAL_RE if bar else SPECIAL_RE).split(abc)
+    specials = list(map((BAR_SPECIAL_TOKENS if bar else SPECIAL_TOKENS).__getitem__, pieces[1::2]))
+    if notes:
+        tokens = lex_content(pieces[0], bar) if pieces[0] else []
+        for special, content in zip(specials, pieces[2::2]):
+            tokens.append(special)
+            if content: tokens += lex_content(content, bar)
+        return tokens
+
+    # Every other piece is a run of notes, though most will be empty
+    tokens = pieces
+    tokens[::2] = map(tuple.__new__, repeat(Token), zip(repeat(NOTES), pieces[::2]))
+    tokens[1::2] = specials
+    return list(filter(EMPTY_NOTES.__ne__, tokens))
+
+
+def note_lengths(bar):
+    """
+    Returns the length part of every note in a cleaned bar, in order.
+    This matches the lengths of the Note tokens, without building them.
+    :param bar: The abc string of a cleaned bar
+    :return: A list of note length strings
+    """
+    return BAR_LENGTHS_RE.findall(bar)
+
+
+def untokenize(tokens):
+    """
+    Joins a list of tokens back into an abc string
+    """
+    return ''.join([t.text for t in tokens])
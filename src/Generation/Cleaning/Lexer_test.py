@@ -0,0 +1,46 @@
+import unittest
+from src.Generation.Cleaning import Lexer
+from src.Generation.Cleaning.Lexer import Token, Note
+
+
+class TestLexer(unittest.TestCase):
+
+    def test_round_trip(self):
+        tunes = ['|:GD<G A BAGF|1 (3ddd ~B:|2 "Am"d2{e}B2||',
+                 'E!trill!Bc{e}A F2DF|]',
+                 '[|^c2 _B,/ =A\'3/2-A|[1 d>e:|[2 d4|]']
+        for abc in tunes:
+            abc = ''.join(abc.split())
+            self.assertEqual(abc, Lexer.untokenize(Lexer.tokenize(abc)))
+            self.assertEqual(abc, Lexer.untokenize(Lexer.tokenize(abc, notes=False)))
+
+    def test_kinds(self):
+        tokens = Lexer.tokenize('|:(3A^B,/2"D"c|1!roll!d:|2-')
+        self.assertEqual([Lexer.REPEAT, Lexer.TUPLET, Lexer.NOTE, Lexer.NOTE, Lexer.ANNOTATION, Lexer.NOTE,
+                          Lexer.ENDING, Lexer.DECORATION, Lexer.NOTE, Lexer.ENDING, Lexer.TIE],
+                         [t.kind for t in tokens])
+        self.assertEqual(Note('^', 'B', ',', '/2'), tokens[3])
+
+    def test_notes(self):
+        # A '2' is only an ending directly after a barline
+        self.assertEqual([Token(Lexer.NOTES, 'A2B'), Token(Lexer.ENDING, '|2'), Token(Lexer.NOTES, 'c')],
+                         Lexer.tokenize('A2B|2c', notes=False))
+        # Cleaned bars can hold any digit in a length
+        self.assertEqual([Note('', 'A', '', '1/2'), Token(Lexer.TUPLET, 'T'), Note('', 'B', '', '3')],
+                         Lexer.tokenize('A1/2TB3', bar=True))
+
+    def test_note_lengths(self):
+        self.assertEqual(['1/2', '', '3/2', '4'], Lexer.note_lengths('A1/2_Bc\'3/2-z4'))
+        self.assertEqual((1, 1), Lexer.note_length(''))
+        self.assertEqual((1, 2), Lexer.note_length('/2'))
+        self.assertEqual((3, 2), Lexer.note_length('3/2'))
+
+    def test_special_tokens_bounded(self):
+        tokens = Lexer.SpecialTokens()
+        for x in range(Lexer.MEMO_SIZE + 10): tokens['"{}"'.format(x)]
+        self.assertLessEqual(len(tokens), Lexer.MEMO_SIZE)
+        self.assertEqual(Token(Lexer.ANNOTATION, '"a"'), tokens['"a"'])
+
+
+if __name__ == '__main__':
+    unittest.main()
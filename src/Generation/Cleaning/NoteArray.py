@@ -0,0 +1,151 @@
+"""
+NoteArray holds a cleaned tune as parallel numpy arrays, one entry per note, so the vectorizer
+doesn't have to parse the cleaned abc string again. They can be saved on their own, either one tune
+to a file or a whole batch in a single file, or kept in a tune store alongside the tunes they were cleaned from.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from src.Generation.Cleaning import Duration
+
+# The midi numbers of the letters in the middle octave, the lower case letters are an octave higher
+LETTERS = {'C': 60, 'D': 62, 'E': 64, 'F': 65, 'G': 67, 'A': 69, 'B': 71}
+REST = 0
+ACCIDENTALS = {'_': -1, '=': 0, '^': 1}
+OCTAVES = {',': -12, "'": 12}
+# The accidental of a note which doesn't have one, so the key signature applies to it
+NO_ACCIDENTAL = -128
+
+FIELDS = ['pitch', 'accidental', 'num', 'den', 'bar']
+# The arrays, along with the number of bars, which includes any bars without notes
+DTYPES = {'pitch': np.int16, 'accidental': np.int8, 'num': np.int16, 'den': np.int16, 'bar': np.int32}
+
+# The arrays a NoteArray is kept in inside a tune store, its fields along with its bar count
+STORE_ARRAYS = dict([('notes/' + f, DTYPES[f]) for f in FIELDS] + [('notes/bars', np.int32)])
+
+NOTE_RE = re.compile(r"([_=^]*)([a-gzA-G])([,']*)([\d]*/?[\d]*)")
+
+
+class NoteArray(namedtuple('NoteArray', FIELDS + ['bars'])):
+    """
+    pitch: The midi number of each note, ignoring accidentals and the key, or REST
+    accidental: The semitones added by the note's own accidental, or NO_ACCIDENTAL
+    num, den: The length of each note as a fraction of the default note length
+    bar: The index of the bar each note is in
+    bars: The number of bars, an int
+    """
+    __slots__ = ()
+
+    @property
+    def notes(self):
+        """
+        :return: The number of notes
+        """
+        return len(self.pitch)
+
+    def bar_starts(self):
+        """
+        :return: The index of the first note of each bar, followed by the number of notes
+        """
+        return np.searchsorted(self.bar, np.arange(self.bars + 1))
+
+    def save(self, fname):
+        np.savez(fname, **self._asdict())
+
+
+def load(fname):
+    with np.load(fname) as f:
+        return NoteArray(*[f[field] for field in FIELDS], bars=int(f['bars']))
+
+
+@lru_cache(maxsize=2 ** 16)
+def parse_bar(bar):
+    """
+    Takes the abc string of a cleaned bar and returns the pitch, accidental, numerator and denominator
+    of each note, as a tuple of lists. Bars repeat a lot, so each is only parsed once.
+    """
+    pitches, accidentals, nums, dens = [], [], [], []
+    for accidental, letter, octave, length in NOTE_RE.findall(bar):
+        if letter == 'z':
+            pitch = REST
+        else:
+            pitch = LETTERS[letter.upper()] + (12 if letter.islower() else 0)
+            for c in octave: pitch += OCTAVES[c]
+        pitches.append(pitch)
+        accidentals.append(sum([ACCIDENTALS[c] for c in accidental]) if accidental else NO_ACCIDENTAL)
+        num, den = Duration.parse(length)
+        nums.append(num)
+        dens.append(den)
+    return pitches, accidentals, nums, dens
+
+
+def from_bars(bars):
+    """
+    :param bars: A list of the abc strings of each cleaned bar, empty bars are skipped
+    :return: A NoteArray
+    """
+    columns = [[], [], [], []]
+    bar_index = []
+    count = 0
+    for bar in bars:
+        if not bar: continue
+        parsed = parse_bar(bar)
+        for column, values in zip(columns, parsed): column += values
+        bar_index += [count] * len(parsed[0])
+        count += 1
+    return NoteArray(*[np.array(c, dtype=DTYPES[f]) for f, c in zip(FIELDS, columns + [bar_index])], bars=count)
+
+
+def from_abc(abc):
+    """
+    :param abc: A cleaned abc string, with bars split by '|'
+    :return: A NoteArray
+    """
+    return from_bars(abc.split('|'))
+
+
+def save_many(arrays, fname):
+    """
+    Saves a list of NoteArrays to a single file, as the joined arrays, the offset of each tune and its bar count.
+    """
+    arrays = list(arrays)
+    offsets = np.cumsum([0] + [a.notes for a in arrays]).astype(np.int64)
+    columns = {f: np.concatenate([a[x] for a in arrays]) if arrays else np.zeros(0, DTYPES[f])
+               for x, f in enumerate(FIELDS)}
+    np.savez(fname, offsets=offsets, bars=np.array([a.bars for a in arrays], dtype=np.int32), **columns)
+
+
+def load_many(fname):
+    """
+    :return: The list of NoteArrays saved by save_many
+    """
+    with np.load(fname) as f:
+        offsets, bars = f['offsets'], f['bars']
+        columns = [f[field] for field in FIELDS]
+    return [NoteArray(*[c[start:end] for c in columns], bars=int(count))
+            for start, end, count in zip(offsets[:-1], offsets[1:], bars)]
+
+
+def to_store(array):
+    """
+    :return: A dictionary of the NoteArray's fields under the names of STORE_ARRAYS, to add to a tune dictionary
+    which is written to a tune store
+    """
+    store = {'notes/' + f: array[x] for x, f in enumerate(FIELDS)}
+    store['notes/bars'] = [array.bars]
+    return store
+
+
+def from_store(store, rows=None):
+    """
+    :param store: An open TuneStore.TuneStore, written with STORE_ARRAYS
+    :param rows: The indices of the rows to read, every row by default
+    :return: A list of the NoteArray of each row, or None for the tunes which were written without one
+    """
+    columns = [store.array('notes/' + f, rows) for f in FIELDS]
+    return [NoteArray(*fields, bars=int(bars[0])) if len(bars) else None
+            for *fields, bars in zip(*columns, store.array('notes/bars', rows))]
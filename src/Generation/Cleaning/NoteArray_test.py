@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from src.Generation.Cleaning import Cleaner, NoteArray
+from src.Generation.Vectorizing import Vectorizer
+
+
+class TestNoteArray(unittest.TestCase):
+
+    def test_from_abc(self):
+        notes = NoteArray.from_abc("^F,2G/2|=c'3/2z||")
+        self.assertEqual([53, 67, 84, NoteArray.REST], notes.pitch.tolist())
+        self.assertEqual([1, NoteArray.NO_ACCIDENTAL, 0, NoteArray.NO_ACCIDENTAL], notes.accidental.tolist())
+        self.assertEqual(([2, 1, 3, 1], [1, 2, 2, 1]), (notes.num.tolist(), notes.den.tolist()))
+        self.assertEqual(([0, 0, 1, 1], 2), (notes.bar.tolist(), notes.bars))
+
+    def test_clean_notes(self):
+        abc = "|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|" * 4
+        result, notes = Cleaner.clean_notes(abc)
+        self.assertEqual(Cleaner.clean_tune(abc), result)
+        self.assertEqual(repr(NoteArray.from_abc(result.abc)), repr(notes))
+        self.assertEqual((Cleaner.clean_tune('A|B||'), None), Cleaner.clean_notes('A|B||'))
+
+    def test_clean_many(self):
+        tunes = [("|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|" * 4, '1'), ('A|B||', '2'),
+                 ("|:DFA dAF|GBd gdB|AFD DFA|BGE E3:|" * 4, '3', '6/8')] * 2
+        serial = [Cleaner.clean_notes(*tune[:2], *tune[2:]) for tune in tunes]
+        for workers in (1, 2):
+            results, arrays = Cleaner.clean_many(tunes, workers=workers, chunksize=2, notes=True)
+            self.assertEqual([r for r, _ in serial], results)
+            self.assertEqual([repr(a) for _, a in serial], list(map(repr, arrays)))
+        self.assertIsNone(arrays[1])
+
+    def test_vectorize(self):
+        tune = {'mode': 'Dmajor', 'abc': "A2FAA2dB|A2FAB^EE2|cd|DE=FGAFAB|defdedBd||"}
+        accs, mod = Vectorizer.get_sharps_or_flats(tune['mode'])
+        expected = Vectorizer.vectorize_abc(tune)
+        vectors = Vectorizer.vectorize_note_array(NoteArray.from_abc(tune['abc']), accs, mod)
+        for a, b in zip(expected, vectors):
+            self.assertTrue(np.array_equal(a, b))
+
+    def test_save(self):
+        arrays = [NoteArray.from_abc('ABc|d2e2||'), NoteArray.from_abc("|'||"), NoteArray.from_abc('_B,3/2C/2||')]
+        with tempfile.TemporaryDirectory() as folder:
+            fname = os.path.join(folder, 'notes.npz')
+            arrays[0].save(fname)
+            self.assertEqual(repr(arrays[0]), repr(NoteArray.load(fname)))
+            NoteArray.save_many(arrays, fname)
+            self.assertEqual(list(map(repr, arrays)), list(map(repr, NoteArray.load_many(fname))))
+
+
+if __name__ == '__main__':
+    unittest.main()
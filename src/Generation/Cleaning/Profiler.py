@@ -0,0 +1,88 @@
+"""
+Profiler collects the time spent in each stage of the cleaner, along with how much abc goes in and out of it
+and how many tunes it rejects. Profiling is opt-in, pass a StageProfile to Cleaner.clean_tune or clean_many.
+"""
+
+import json
+import time
+
+FIELDS = ['calls', 'seconds', 'chars_in', 'chars_out', 'rejected']
+
+
+def size(value):
+    """
+    :param value: An abc string, a list of tokens or a list of bars
+    :return: The number of abc characters in value
+    """
+    if isinstance(value, str): return len(value)
+    return sum(map(len, [x if isinstance(x, str) else getattr(x, 'text', None) or ''.join(x) for x in value]))
+
+
+class StageProfile:
+    def __init__(self):
+        # Stage name to a list of the FIELDS, kept in the order the stages first ran
+        self.stages = dict()
+        self.last, self.last_size = None, 0
+
+    def run(self, name, stage, value):
+        """
+        Runs a single stage, recording how long it took.
+        :param name: The name of the stage
+        :param stage: The stage function
+        :param value: The input to the stage
+        :return: The output of the stage
+        """
+        start = time.perf_counter()
+        result = stage(value)
+        seconds = time.perf_counter() - start
+
+        # Each stage's input is usually the last one's output, so its size is already known
+        chars_in = self.last_size if value is self.last else size(value)
+        self.last, self.last_size = result, size(result)
+        self.record(name, seconds, chars_in, self.last_size, isinstance(result, str))
+        return result
+
+    def __getstate__(self):
+        # Worker processes send their profiles back, which don't need to carry the last stage's output
+        return {'stages': self.stages, 'last': None, 'last_size': 0}
+
+    def record(self, name, seconds, chars_in, chars_out, rejected, calls=1):
+        totals = self.stages.setdefault(name, [0, 0.0, 0, 0, 0])
+        for x, amount in enumerate((calls, seconds, chars_in, chars_out, int(rejected))):
+            totals[x] += amount
+
+    def merge(self, other):
+        """
+        Adds the totals of another profile, such as one sent back from a worker process
+        """
+        for name, (calls, seconds, chars_in, chars_out, rejected) in other.stages.items():
+            self.record(name, seconds, chars_in, chars_out, rejected, calls)
+
+    def as_dict(self):
+        return {name: dict(zip(FIELDS, totals)) for name, totals in self.stages.items()}
+
+    def to_json(self, fname=None):
+        """
+        :param fname: An optional path to write the JSON to
+        :return: The profile as a JSON string
+        """
+        text = json.dumps(self.as_dict(), indent=2)
+        if fname:
+            with open(fname, 'w') as f: f.write(text)
+        return text
+
+    def table(self):
+        """
+        :return: The profile as a text table, with each stage's share of the total time
+        """
+        total = sum(totals[1] for totals in self.stages.values()) or 1e-9
+        rows = ['{:<14}{:>9}{:>11}{:>8}{:>11}{:>13}{:>13}{:>10}'.format(
+            'Stage', 'Calls', 'Seconds', '%', 'us/call', 'Chars in', 'Chars out', 'Rejected')]
+        for name, (calls, seconds, chars_in, chars_out, rejected) in self.stages.items():
+            rows.append('{:<14}{:>9}{:>11.3f}{:>7.1f}%{:>11.1f}{:>13}{:>13}{:>10}'.format(
+                name, calls, seconds, 100 * seconds / total, 1e6 * seconds / max(calls, 1),
+                chars_in, chars_out, rejected))
+        return '\n'.join(rows)
+
+    def print_table(self):
+        print(self.table())
@@ -0,0 +1,171 @@
+"""
+Reader streams tunes out of abc files, such as the folk-rnn and cleaned data sets, one at a time.
+Each tune is returned as a dictionary in the same shape as The Session's tunes, so it can be handed
+to the cleaner and the vectorizer just like them.
+
+    python -m src.Generation.Cleaning.Reader ../../Data/Clean/cleaned_data_abc
+    python -m src.Generation.Cleaning.Reader ../../Data/Clean/cleaned_data_abc.pack
+"""
+
+import os
+import re
+import sys
+from itertools import islice
+
+from src.Generation.Cleaning import Archive, Cleaner
+
+ABC_EXTENSIONS = ('.abc', '.txt')
+# The number of tunes cleaned at a time by clean_tunes
+BATCH_SIZE = 2048
+
+# A header field, such as 'T: Title', at the start of a line
+HEADER_RE = re.compile(r'([A-Za-z]):\s*(.*)')
+# Some files put the key on the same line as the meter, and start the body straight after it
+INLINE_KEY_RE = re.compile(r'\s+K:\s*')
+KEY_RE = re.compile(r'([A-G][#b]?)\s*(maj|min|ion|dor|phr|lyd|mix|aeo|loc|m(?![a-z]))?[a-z]*(?:\s+|$)', re.IGNORECASE)
+MODES = {'': 'major', 'maj': 'major', 'ion': 'major', 'min': 'minor', 'm': 'minor', 'dor': 'dorian',
+         'phr': 'phrygian', 'lyd': 'lydian', 'mix': 'mixolydian', 'aeo': 'aeolian', 'loc': 'locrian'}
+
+
+def abc_files(path):
+    """
+    :param path: An abc file, or a directory of them
+    :return: The paths of the abc files, with numbered files in numerical order
+    """
+    if not os.path.isdir(path): return [path]
+    names = [n for n in os.listdir(path) if n.lower().endswith(ABC_EXTENSIONS)]
+    names.sort(key=Archive.sort_key)
+    return [os.path.join(path, n) for n in names]
+
+
+def parse_key(value):
+    """
+    Splits the value of a K: field into the key and anything which follows it on the same line.
+    :param value: A key such as 'G', 'Ador', 'D Mixolydian' or 'DMaj'
+    :return: The mode in the form used by The Session, such as 'Dmajor', and the rest of the line
+    """
+    match = KEY_RE.match(value)
+    if not match: return '', value
+    tonic, mode = match.groups()
+    return tonic[0].upper() + tonic[1:] + MODES[(mode or '').lower()], value[match.end():]
+
+
+def tune_record(headers, body, source, index):
+    """
+    :param headers: A dictionary of the tune's header fields
+    :param body: A list of the lines of abc after the header
+    :param source: The file the tune was read from
+    :param index: The position of the tune in its file, used when it has no X: field
+    :return: A tune dictionary, with the same keys as The Session's along with the title, headers and source
+    """
+    number = headers.get('X') or str(index)
+    mode, _ = parse_key(headers.get('K', ''))
+    return {'tune': number,
+            'setting': '{}:{}'.format(os.path.basename(source), number),
+            'type': headers.get('R', '').lower(),
+            'meter': headers.get('M') or Cleaner.DEFAULT_METER,
+            'mode': mode,
+            'title': headers.get('T', ''),
+            'abc': '\n'.join(body),
+            'headers': headers,
+            'source': source}
+
+
+def read_file(fname):
+    """
+    Streams the tunes out of a single abc file.
+    :param fname: The path of an abc file
+    :return: A generator of tune dictionaries
+    """
+    with open(fname, encoding='utf-8', errors='replace') as f:
+        yield from read_lines(f, fname)
+
+
+def read_lines(lines, fname):
+    """
+    Streams the tunes out of the lines of an abc file. A tune starts with an X: field, or with the first
+    header after a blank line, and its body starts after the K: field.
+    :param lines: An iterable of the lines of the file
+    :param fname: The name of the file, used for the tunes' settings and sources
+    :return: A generator of tune dictionaries
+    """
+    headers, body = dict(), list()
+    field = None
+    index = 0
+    for line in lines:
+        line = line.strip()
+        match = HEADER_RE.match(line)
+
+        # A blank line or a new X: field ends the current tune
+        if (not line or (match and match.group(1) == 'X')) and body:
+            yield tune_record(headers, body, fname, index)
+            headers, body, field = dict(), list(), None
+            index += 1
+        if not line: continue
+
+        if 'K' in headers:
+            body.append(line)
+        elif match:
+            field, value = match.groups()
+            inline = INLINE_KEY_RE.search(value) if field != 'K' else None
+            if inline:
+                headers.setdefault(field, value[:inline.start()])
+                field, value = 'K', value[inline.end():]
+
+            if field == 'K':
+                # Anything after the key on its line is the start of the body
+                _, rest = parse_key(value)
+                value = value[:len(value) - len(rest)].strip()
+                if rest.strip(): body.append(rest.strip())
+            headers.setdefault(field, value)
+        elif field:
+            # A header which runs onto the next line
+            headers[field] = (headers[field] + ' ' + line).strip()
+
+    if body: yield tune_record(headers, body, fname, index)
+
+
+def read_tunes(path):
+    """
+    Streams the tunes out of an abc file, or every abc file in a directory, without loading them all at once.
+    A packed archive of a directory is read in one pass, with the same tunes as the directory.
+    :param path: An abc file, a directory of them, or an Archive of a directory
+    :return: A generator of tune dictionaries
+    """
+    if path.endswith(Archive.EXTENSION) and os.path.isfile(path):
+        with Archive.PackedArchive(path) as archive:
+            for name, data in archive.items(ABC_EXTENSIONS):
+                text = data.decode('utf-8', errors='replace')
+                yield from read_lines(text.splitlines(), os.path.join(path, name))
+        return
+    for fname in abc_files(path):
+        yield from read_file(fname)
+
+
+def clean_tunes(tunes, workers=1, batch_size=BATCH_SIZE, cache=None, keep_rejected=False):
+    """
+    Cleans a stream of tune dictionaries a batch at a time, each by the rules of its own meter.
+    :param tunes: An iterable of tune dictionaries, such as the ones from read_tunes
+    :param workers: The number of processes to clean each batch with. None uses every core.
+    :param batch_size: The number of tunes to clean at a time
+    :param cache: An optional Cache.TuneCache
+    :param keep_rejected: Flag to also return the tunes which were rejected
+    :return: A generator of tune dictionaries, with the cleaned abc and the CleanResult of each
+    """
+    clean_many = cache.clean_many if cache else Cleaner.clean_many
+    tunes = iter(tunes)
+    while True:
+        batch = list(islice(tunes, batch_size))
+        if not batch: return
+        results = clean_many([(t['abc'], t['setting'], t['meter']) for t in batch], workers=workers)
+        for tune, result in zip(batch, results):
+            if result.status == Cleaner.CLEANED or keep_rejected:
+                yield dict(tune, abc=result.abc, result=result)
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        results = [t['result'] for t in clean_tunes(read_tunes(path), keep_rejected=True)]
+        cleaned = sum([r.status == Cleaner.CLEANED for r in results])
+        print('{}: {}/{} tunes successfully cleaned!'.format(path, cleaned, len(results)))
+        Cleaner.print_summary(Cleaner.summarize(results))
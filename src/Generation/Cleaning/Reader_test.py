@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from src.Generation.Cleaning import Reader
+
+
+class TestReader(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name, text):
+        fname = os.path.join(self.folder.name, name)
+        with open(fname, 'w') as f: f.write(text)
+        return fname
+
+    def test_headers(self):
+        fname = self.write('tunes.abc', "X:1\nT:The Boys\nR:Reel\nM:4/4\nK:Ador\n|:ABcd|efga:|\n|:gfed|cBAG:|\n\n"
+                                        "X:2\nT:\nCleaned\nM:6/8 K: DMaj d'4d'2|a2f2\nd2B2|\n")
+        first, second = Reader.read_tunes(fname)
+        self.assertEqual(('1', 'tunes.abc:1', 'reel', '4/4', 'Adorian', 'The Boys'),
+                         tuple(first[k] for k in ['tune', 'setting', 'type', 'meter', 'mode', 'title']))
+        self.assertEqual('|:ABcd|efga:|\n|:gfed|cBAG:|', first['abc'])
+        # The title runs onto the next line, and the key shares a line with the meter and the body
+        self.assertEqual(('Cleaned', '6/8', 'Dmajor'), (second['title'], second['meter'], second['mode']))
+        self.assertEqual("d'4d'2|a2f2\nd2B2|", second['abc'])
+
+    def test_directory(self):
+        self.write('10.abc', 'T: Cleaned\nK: G\nABcd|\n\nT: Cleaned\nK: Em\nEFGA|\n')
+        self.write('2.abc', 'X:1\nK:D\nDEFG|\n')
+        self.write('notes.md', 'K:D\nDEFG|\n')
+        tunes = list(Reader.read_tunes(self.folder.name))
+        self.assertEqual(['2.abc:1', '10.abc:0', '10.abc:1'], [t['setting'] for t in tunes])
+        self.assertEqual(['Dmajor', 'Gmajor', 'Eminor'], [t['mode'] for t in tunes])
+
+    def test_clean_tunes(self):
+        body = '|:GD<G A BAGF|E Bc{e}A F2DF|G2GB (3ddd ~B|AG>F GD2 ~DF:|' * 4
+        fname = self.write('tunes.abc', 'X:1\nM:4/4\nK:G\n' + body + '\n\nX:2\nM:4/4\nK:G\nA|B|C|D||\n')
+        tunes = list(Reader.clean_tunes(Reader.read_tunes(fname), batch_size=1))
+        self.assertEqual(['tunes.abc:1'], [t['setting'] for t in tunes])
+        self.assertEqual(tunes[0]['result'].abc, tunes[0]['abc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 from datetime import datetime
+import os
 import numpy as np
-import importlib.util as ih
+from src.Generation.Cleaning import TuneStore
+from src.Generation.Vectorizing import Tensor
 
 FOLDER_NAME = '../../Data'
 ABC_DIR = '/Clean/'
@@ -20,19 +22,20 @@ class StatsHandler:
 
     def read_dict_file(self):
         try:
-            spec = ih.spec_from_file_location("tunes", FOLDER_NAME + ABC_DIR + self.filename + ".py")
-            foo = ih.module_from_spec(spec)
-            spec.loader.exec_module(foo)
-            tunes = foo.tunes
+            # The stats only need the categories, so the abc column is never read
+            tunes = TuneStore.read_dict(FOLDER_NAME + ABC_DIR + self.filename + TuneStore.EXTENSION,
+                                        columns=['type', 'meter', 'mode'])
         except FileNotFoundError:
-            print('Python file not found!')
+            print('Tune store not found!')
             tunes = []
         return tunes
 
     def read_npy_file(self):
-        fname = FOLDER_NAME + NPY_DIR + self.filename + '_Notes.npy'
+        fname = FOLDER_NAME + NPY_DIR + self.filename
         try:
-            array = np.load(fname)
+            # The dense pitch array if there is one, mapped rather than read
+            if os.path.isfile(fname + Tensor.SIDECAR): return Tensor.load(fname).pitch
+            array = np.load(fname + '_Notes.npy')
         except FileNotFoundError:
             print('Numpy file not found!')
             array = []
@@ -0,0 +1,369 @@
+"""
+TuneStore keeps a corpus of tune dictionaries on disk column by column, in place of the generated python
+data modules. Each column is the utf-8 text of every tune joined into one uint8 array, along with the offset
+of each tune's value, inside an uncompressed npz file. Opening a store reads nothing, each column is only
+read when asked for, and only the rows which are asked for are decoded. A store can also hold numeric arrays,
+such as the NoteArray of each tune, which are kept in the same way with their own dtype and written with the text.
+
+    python -m src.Generation.Cleaning.TuneStore path/to/Old_Data_Module.py
+"""
+
+import importlib.util as ih
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from array import array
+from datetime import datetime
+
+import numpy as np
+
+EXTENSION = '.npz'
+# The columns of a cleaned tune, in the order they are written
+TUNE_COLUMNS = ['tune', 'setting', 'type', 'meter', 'mode', 'abc']
+# The number of tunes decoded at a time when streaming a store
+BATCH_SIZE = 4096
+
+
+def data_key(column):
+    return 'data/' + column
+
+
+def offsets_key(column):
+    return 'offsets/' + column
+
+
+def array_key(name):
+    return 'arrays/' + name
+
+
+def array_offsets_key(name):
+    return 'array_offsets/' + name
+
+
+# region WRITING
+class TuneWriter:
+    """
+    Writes tune dictionaries to a store, one at a time or a batch at a time. Each column is spooled to a
+    temporary file as it grows, so the tunes are never all held in memory. The store is written to a
+    temporary file, synced to disk and renamed over fname once the writer is closed, so fname always
+    holds either the old store or the whole of the new one.
+    Values are stored as strings, and a tune without one of the columns gets an empty string.
+    Arrays are stored with their dtype, and a tune without one of them gets an empty array.
+    A store is a single npz file, so appending to one copies every tune already in it into the new file,
+    which costs as much as writing the store again. It suits small additions, not streaming into a large store.
+    """
+
+    def __init__(self, fname, columns=None, created=None, append=False, arrays=None):
+        """
+        :param fname: The path of the store
+        :param columns: The columns to write, by default every key of every tune, in the order they are seen
+        :param created: The date the tunes were created, by default now, or when the store was created if appending
+        :param append: Flag to keep the tunes already in the store at fname, and add to them. The whole store
+        is copied, see above.
+        :param arrays: A dictionary of the keys of the tunes to write as numeric arrays, to their dtypes
+        """
+        self.fname = fname
+        self.fixed = columns is not None
+        self.created = created or str(datetime.now())
+        self.count = 0
+        self.columns = dict()
+        self.arrays = dict()
+        if append and os.path.exists(fname): self.copy_store(fname, keep_created=created is None)
+        for column in columns or []:
+            if column not in self.columns: self.add_column(column)
+        for name, dtype in (arrays or dict()).items():
+            if name not in self.arrays: self.add_array(name, dtype)
+
+    def copy_store(self, fname, keep_created=True):
+        with TuneStore(fname) as store:
+            self.count = len(store)
+            if keep_created: self.created = store.created
+            for column in store.columns:
+                data, offsets = store.load(column)
+                spool = tempfile.TemporaryFile()
+                spool.write(data)
+                self.columns[column] = (spool, array('q', offsets.astype(np.int64).tobytes()))
+                store.loaded.pop(column)
+            for name in store.arrays:
+                data, offsets = store.load_array(name)
+                spool = tempfile.TemporaryFile()
+                spool.write(data.tobytes())
+                self.arrays[name] = (data.dtype, spool, array('q', offsets.astype(np.int64).tobytes()))
+                store.loaded.pop(array_key(name))
+
+    def add_column(self, column):
+        # The tunes already written didn't have the column
+        self.columns[column] = (tempfile.TemporaryFile(), array('q', [0] * (self.count + 1)))
+
+    def add_array(self, name, dtype):
+        self.arrays[name] = (np.dtype(dtype), tempfile.TemporaryFile(), array('q', [0] * (self.count + 1)))
+
+    def write(self, tune):
+        if not self.fixed:
+            for column in tune:
+                if column not in self.columns: self.add_column(column)
+        for column, (spool, offsets) in self.columns.items():
+            value = tune.get(column, '')
+            data = (value if isinstance(value, str) else str(value)).encode('utf-8')
+            spool.write(data)
+            offsets.append(offsets[-1] + len(data))
+        for name, (dtype, spool, offsets) in self.arrays.items():
+            values = np.asarray(tune.get(name, ()), dtype=dtype)
+            spool.write(values.tobytes())
+            offsets.append(offsets[-1] + len(values))
+        self.count += 1
+
+    def write_many(self, tunes):
+        for tune in tunes: self.write(tune)
+
+    def close(self):
+        """
+        Writes the spooled columns to the store, replacing any store already at fname.
+        :return: The number of tunes written
+        """
+        if os.path.dirname(self.fname): os.makedirs(os.path.dirname(self.fname), exist_ok=True)
+        temp = self.fname + '.tmp'
+        try:
+            with zipfile.ZipFile(temp, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+                write_member(zf, 'columns', np.array(list(self.columns), dtype=str))
+                write_member(zf, 'created', np.array(self.created))
+                write_member(zf, 'count', np.array(self.count))
+                for column, (spool, offsets) in self.columns.items():
+                    write_member(zf, offsets_key(column), np.frombuffer(offsets, dtype=np.int64))
+                    with zf.open(data_key(column) + '.npy', 'w', force_zip64=True) as out:
+                        np.lib.format.write_array_header_1_0(
+                            out, {'descr': '|u1', 'fortran_order': False, 'shape': (offsets[-1],)})
+                        spool.seek(0)
+                        shutil.copyfileobj(spool, out)
+                write_member(zf, 'arrays', np.array(list(self.arrays), dtype=str))
+                for name, (dtype, spool, offsets) in self.arrays.items():
+                    write_member(zf, array_offsets_key(name), np.frombuffer(offsets, dtype=np.int64))
+                    with zf.open(array_key(name) + '.npy', 'w', force_zip64=True) as out:
+                        np.lib.format.write_array_header_1_0(
+                            out, {'descr': dtype.str, 'fortran_order': False, 'shape': (offsets[-1],)})
+                        spool.seek(0)
+                        shutil.copyfileobj(spool, out)
+            fsync(temp)
+            os.replace(temp, self.fname)
+            fsync(os.path.dirname(os.path.abspath(self.fname)), directory=True)
+        finally:
+            self.discard()
+            if os.path.exists(temp): os.remove(temp)
+        return self.count
+
+    def discard(self):
+        for spool, _ in self.columns.values(): spool.close()
+        for _, spool, _ in self.arrays.values(): spool.close()
+        self.columns, self.arrays = dict(), dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        # A store which failed part way through is never written
+        if kind is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def fsync(path, directory=False):
+    """
+    Flushes a file, or a directory's entries after a rename, to disk. Not every platform can sync a directory.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0))
+    except OSError:
+        if directory: return
+        raise
+    try:
+        os.fsync(fd)
+    except OSError:
+        if not directory: raise
+    finally:
+        os.close(fd)
+
+
+def write_member(zf, name, values):
+    with zf.open(name + '.npy', 'w', force_zip64=True) as out:
+        np.lib.format.write_array(out, values, allow_pickle=False)
+
+
+def write(tunes, fname, columns=None, created=None, append=False, arrays=None):
+    """
+    Writes an iterable of tune dictionaries to a store, without changing the iterable's contents.
+    :param append: Flag to add the tunes to the ones already in the store, which rewrites the whole store
+    :param arrays: A dictionary of the keys of the tunes to write as numeric arrays, to their dtypes
+    :return: The number of tunes in the store
+    """
+    with TuneWriter(fname, columns, created, append, arrays) as writer:
+        writer.write_many(tunes)
+    return writer.count
+# endregion WRITING
+
+
+# region READING
+class TuneStore:
+    """
+    A store opened for reading. The columns are only read from disk when they are first used.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.file = np.load(fname, allow_pickle=False)
+        self.columns = self.file['columns'].tolist()
+        self.created = str(self.file['created'])
+        self.count = int(self.file['count'])
+        # Stores written before arrays were kept don't list any
+        self.arrays = self.file['arrays'].tolist() if 'arrays' in self.file.files else []
+        self.loaded = dict()
+
+    def __len__(self):
+        return self.count
+
+    def load(self, column):
+        """
+        :return: The column's text as bytes, and the offsets of each value in it
+        """
+        if column not in self.loaded:
+            if column not in self.columns: raise KeyError('No column "{}" in "{}"'.format(column, self.fname))
+            self.loaded[column] = (self.file[data_key(column)].tobytes(), self.file[offsets_key(column)])
+        return self.loaded[column]
+
+    def load_array(self, name):
+        """
+        :return: The joined values of an array, and the offsets of each tune's values in it
+        """
+        key = array_key(name)
+        if key not in self.loaded:
+            if name not in self.arrays: raise KeyError('No array "{}" in "{}"'.format(name, self.fname))
+            self.loaded[key] = (self.file[key], self.file[array_offsets_key(name)])
+        return self.loaded[key]
+
+    def array(self, name, rows=None):
+        """
+        :param name: The name of an array
+        :param rows: The indices of the rows to take, every row by default
+        :return: A list of each row's values, as views of the joined array
+        """
+        data, offsets = self.load_array(name)
+        starts, ends = offsets[:-1].tolist(), offsets[1:].tolist()
+        if rows is None: return [data[s:e] for s, e in zip(starts, ends)]
+        return [data[starts[x]:ends[x]] for x in rows]
+
+    def column(self, column, rows=None):
+        """
+        :param column: The name of a column
+        :param rows: The indices of the rows to decode, every row by default
+        :return: A list of the column's values
+        """
+        data, offsets = self.load(column)
+        starts, ends = offsets[:-1].tolist(), offsets[1:].tolist()
+        if rows is None: return [data[s:e].decode('utf-8') for s, e in zip(starts, ends)]
+        return [data[starts[x]:ends[x]].decode('utf-8') for x in rows]
+
+    def select(self, **filters):
+        """
+        Finds the rows whose values are among the allowed ones, only reading the filtered columns.
+        An empty or None list of values allows every value, as in Generate_Files.create_dict_list.
+        :param filters: Column names mapped to lists of allowed values, such as mode=['Dmajor', 'Gmajor']
+        :return: A list of the indices of the rows which pass every filter
+        """
+        rows = range(len(self))
+        for column, allowed in filters.items():
+            if not allowed: continue
+            allowed = set(allowed)
+            values = self.column(column, rows)
+            rows = [x for x, value in zip(rows, values) if value in allowed]
+        return list(rows)
+
+    def rows(self, columns=None, rows=None):
+        """
+        :param columns: The columns to read, every column by default
+        :param rows: The indices of the rows to read, every row by default
+        :return: A list of tune dictionaries
+        """
+        columns = columns or self.columns
+        values = [self.column(c, rows) for c in columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    def stream(self, columns=None, rows=None, batch_size=BATCH_SIZE):
+        """
+        Reads the tunes batch_size rows at a time, so only a batch of them is decoded at once.
+        Takes the same parameters as rows.
+        :return: A generator of tune dictionaries
+        """
+        rows = range(len(self)) if rows is None else rows
+        for start in range(0, len(rows), batch_size):
+            yield from self.rows(columns, rows[start:start + batch_size])
+
+    def to_dict(self, key='setting', columns=None, rows=None):
+        """
+        :return: A dictionary of the tunes using the key column, in the shape of the old python data modules
+        """
+        tunes = self.rows(columns and ([key] + [c for c in columns if c != key]), rows)
+        return {tune[key]: tune for tune in tunes}
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read(fname, columns=None, **filters):
+    """
+    :param fname: The path of a store
+    :param columns: The columns to read, every column by default
+    :param filters: Column names mapped to lists of allowed values
+    :return: A list of the tune dictionaries which pass the filters
+    """
+    with TuneStore(fname) as store:
+        return store.rows(columns, store.select(**filters) if filters else None)
+
+
+def stream(fname, columns=None, rows=None, **filters):
+    """
+    Reads the tunes which pass the filters a batch at a time, keeping the store open until the last is read.
+    :param rows: The indices of the rows to read, every row by default
+    :return: A generator of the tune dictionaries which pass the filters
+    """
+    with TuneStore(fname) as store:
+        if filters:
+            selected = store.select(**filters)
+            rows = selected if rows is None else sorted(set(selected).intersection(rows))
+        yield from store.stream(columns, rows)
+
+
+def read_dict(fname, key='setting', columns=None, **filters):
+    """
+    :return: A dictionary of the tunes which pass the filters, using the key column, like the old python data modules
+    """
+    with TuneStore(fname) as store:
+        return store.to_dict(key, columns, store.select(**filters) if filters else None)
+# endregion READING
+
+
+def convert_module(fname):
+    """
+    Converts one of the old generated python data modules to a store next to it.
+    :return: The path of the store
+    """
+    spec = ih.spec_from_file_location('tunes', fname)
+    module = ih.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    tunes = module.tunes
+    tunes = list(tunes.values()) if isinstance(tunes, dict) else tunes
+    out = os.path.splitext(fname)[0] + EXTENSION
+    write(tunes, out, created=getattr(module, 'created', None))
+    return out
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print('Converted "{}" to "{}"'.format(path, convert_module(path)))
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from src.Generation.Cleaning import Generate_Files, NoteArray, TuneStore
+
+
+class TestTuneStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.folder.name, 'Clean', 'tunes.npz')
+        self.tunes = [{'tune': '1', 'setting': '2', 'type': 'reel', 'meter': '4/4', 'mode': 'Dmajor', 'abc': 'ABcd|'},
+                      {'tune': '1', 'setting': '7', 'type': 'jig', 'meter': '6/8', 'mode': 'Gmajor', 'abc': "^f'3|"},
+                      {'tune': '4', 'setting': '9', 'type': 'reel', 'meter': '4/4', 'mode': 'Gmajor', 'abc': ''}]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_round_trip(self):
+        self.assertEqual(3, TuneStore.write(iter(self.tunes), self.fname, created='today'))
+        self.assertEqual(self.tunes, TuneStore.read(self.fname))
+        self.assertEqual({t['setting']: t for t in self.tunes}, TuneStore.read_dict(self.fname))
+        with TuneStore.TuneStore(self.fname) as store:
+            self.assertEqual((3, 'today', TuneStore.TUNE_COLUMNS), (len(store), store.created, store.columns))
+
+    def test_lazy(self):
+        TuneStore.write(self.tunes, self.fname)
+        with TuneStore.TuneStore(self.fname) as store:
+            self.assertEqual([1, 2], store.select(mode=['Gmajor'], meter=None))
+            self.assertEqual([2], store.select(mode=['Gmajor'], type=['reel', 'hornpipe']))
+            self.assertEqual(["^f'3|"], store.column('abc', [1]))
+            # Only the filtered and selected columns were read
+            self.assertEqual({'mode', 'type', 'abc'}, set(store.loaded))
+        self.assertEqual({'7': {'setting': '7', 'meter': '6/8'}},
+                         TuneStore.read_dict(self.fname, columns=['meter'], meter=['6/8']))
+
+    def test_stream(self):
+        TuneStore.write(self.tunes, self.fname)
+        with TuneStore.TuneStore(self.fname) as store:
+            self.assertEqual(self.tunes[::-1], list(store.stream(rows=[2, 1, 0], batch_size=2)))
+        self.assertEqual(self.tunes[1:], list(TuneStore.stream(self.fname, mode=['Gmajor'])))
+        self.assertEqual([{'abc': ''}], list(TuneStore.stream(self.fname, ['abc'], [0, 2], mode=['Gmajor'])))
+
+    def test_columns(self):
+        tunes = [{'abc': 'A|'}, {'abc': 'B|', 'title': 'Ríl', 'count': 3}, {}]
+        TuneStore.write(tunes, self.fname)
+        self.assertEqual([{'abc': 'A|', 'title': '', 'count': ''}, {'abc': 'B|', 'title': 'Ríl', 'count': '3'},
+                          {'abc': '', 'title': '', 'count': ''}], TuneStore.read(self.fname))
+        TuneStore.write([], self.fname, columns=['abc'])
+        self.assertEqual([], TuneStore.read(self.fname))
+
+    def test_append(self):
+        TuneStore.write(self.tunes[:1], self.fname, created='today')
+        with TuneStore.TuneWriter(self.fname, append=True) as writer:
+            writer.write_many(iter(self.tunes[1:2]))
+            writer.write_many([dict(self.tunes[2], title='Ríl')])
+        self.assertEqual(self.tunes, TuneStore.read(self.fname, columns=TuneStore.TUNE_COLUMNS))
+        with TuneStore.TuneStore(self.fname) as store:
+            self.assertEqual((['', '', 'Ríl'], 'today'), (store.column('title'), store.created))
+
+    def test_dicts_to_file(self):
+        cleaned = list(self.tunes)
+        self.assertEqual(3, Generate_Files.dicts_to_file(cleaned, self.fname))
+        self.assertEqual(self.tunes, cleaned)
+        self.assertEqual(self.tunes, TuneStore.read(self.fname))
+        # The store is replaced by the next run
+        self.assertEqual(2, Generate_Files.dicts_to_file(iter(cleaned[:2]), self.fname))
+        self.assertEqual(self.tunes[:2], TuneStore.read(self.fname))
+
+    def test_arrays(self):
+        tunes = [dict(self.tunes[0], pitch=[60, 62]), dict(self.tunes[1], pitch=np.array([-1], dtype=np.int16)),
+                 self.tunes[2]]
+        TuneStore.write(tunes, self.fname, columns=TuneStore.TUNE_COLUMNS, arrays={'pitch': np.int16})
+        with TuneStore.TuneStore(self.fname) as store:
+            self.assertEqual((self.tunes, ['pitch']), (store.rows(), store.arrays))
+            self.assertEqual([[60, 62], [-1], []], [a.tolist() for a in store.array('pitch')])
+            self.assertEqual(np.int16, store.array('pitch')[0].dtype)
+            self.assertEqual([[]], [a.tolist() for a in store.array('pitch', [2])])
+
+        # Appending keeps the arrays, and a tune written without one gets an empty array
+        TuneStore.write([dict(self.tunes[0], pitch=[72])], self.fname, append=True)
+        with TuneStore.TuneStore(self.fname) as store:
+            self.assertEqual([[60, 62], [-1], [], [72]], [a.tolist() for a in store.array('pitch')])
+
+    def test_dicts_to_file_notes(self):
+        cleaned = [dict(t, note_array=NoteArray.from_abc(t['abc'])) for t in self.tunes]
+        self.assertEqual(3, Generate_Files.dicts_to_file(iter(cleaned), self.fname, notes=True))
+        self.assertEqual(self.tunes, TuneStore.read(self.fname))
+        with TuneStore.TuneStore(self.fname) as store:
+            self.assertEqual(list(map(repr, [t['note_array'] for t in cleaned])),
+                             list(map(repr, NoteArray.from_store(store))))
+            self.assertEqual(repr(cleaned[1]['note_array']), repr(NoteArray.from_store(store, [1])[0]))
+        # Only the store itself is written
+        self.assertEqual(['tunes.npz'], os.listdir(os.path.dirname(self.fname)))
+
+    def test_failed_write(self):
+        TuneStore.write(self.tunes, self.fname)
+
+        def tunes():
+            yield self.tunes[0]
+            raise ValueError('Cut off')
+        with self.assertRaises(ValueError):
+            TuneStore.write(tunes(), self.fname)
+        self.assertEqual(self.tunes, TuneStore.read(self.fname))
+        self.assertEqual(['tunes.npz'], os.listdir(os.path.dirname(self.fname)))
+
+
+if __name__ == '__main__':
+    unittest.main()
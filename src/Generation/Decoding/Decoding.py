@@ -5,6 +5,7 @@ from music21 import instrument
 from music21.midi.realtime import StreamPlayer
 from src.Generation.Decoding import Audio_Converter
 from src.Generation.Vectorizing import Vectorizer as Vec
+from src.Generation.Vectorizing import Tensor
 import matplotlib.pyplot as plt
 import numpy as np
 import random
@@ -20,10 +21,17 @@ RANGE = MAX_PITCH - MIN_PITCH
 tritone = {0: 'z[=G2=G,2][=G2=G,2][=G2=G,2][_E8_E,8] z[=F2=F,2][=F2=F,2][=F2=F,2][=D8=D,]'}
 
 
-def load_vector(fname):
+def load_vector(fname, mmap_mode=None):
+    """
+    :param fname: A .npy file in the vectors folder, or the sidecar of a dense Tensor, whose pitches are loaded
+    :param mmap_mode: Passed to np.load, 'r' maps a dense array rather than reading it
+    """
     fname = VECTOR_DIR + fname
     try:
-        array = np.load(fname)
+        if fname.endswith(Tensor.SIDECAR):
+            array = Tensor.load(fname[:-len(Tensor.SIDECAR)], mmap_mode).pitch
+        else:
+            array = np.load(fname, mmap_mode=mmap_mode)
     except FileNotFoundError:
         array = []
 
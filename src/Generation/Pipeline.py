@@ -0,0 +1,177 @@
+"""
+Pipeline runs a chain of stages, each with the files it reads, the files it writes and the settings it
+depends on. Like make, a stage is skipped when nothing it depends on has changed since it last ran,
+which is decided by a fingerprint of the contents of its inputs and its parameters, as DVC does.
+The fingerprints are kept in a JSON state file beside the outputs.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+CHUNK_SIZE = 2 ** 20
+
+
+class Stage:
+    """
+    A step of a pipeline.
+    :param name: The name the stage is run and reported by
+    :param run: A function of no arguments which reads the inputs and writes the outputs
+    :param inputs: The paths of the files the stage reads, including the source of the code it runs
+    :param outputs: The paths of the files the stage writes
+    :param params: A dictionary of the settings which change what the stage writes, anything JSON can hold
+    :param always: Flag to run the stage every time, for stages which depend on something outside the files
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), params=None, always=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or dict()
+        self.always = always
+
+
+# region FINGERPRINTS
+def file_digest(fname, known=None):
+    """
+    :param fname: The path of a file
+    :param known: A dictionary of the digests found before, keyed by path, which is updated. A file whose
+    size and modification time are unchanged isn't read again.
+    :return: The sha1 of the file's contents, or None if it doesn't exist
+    """
+    if not os.path.isfile(fname): return None
+    info = os.stat(fname)
+    known = dict() if known is None else known
+    stamp = [info.st_size, info.st_mtime_ns]
+    if fname in known and known[fname][:2] == stamp: return known[fname][2]
+
+    digest = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''): digest.update(chunk)
+    known[fname] = stamp + [digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def fingerprint(stage, known=None):
+    """
+    :return: A digest of the stage's parameters and the contents of its inputs, or None if an input is missing
+    """
+    inputs = {fname: file_digest(fname, known) for fname in stage.inputs}
+    if None in inputs.values(): return None
+    text = json.dumps({'params': stage.params, 'inputs': inputs}, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+# endregion FINGERPRINTS
+
+
+# region RUNNING
+def load_state(fname):
+    try:
+        with open(fname) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'stages': dict(), 'files': dict()}
+
+
+def save_state(state, fname):
+    temp = fname + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(temp, fname)
+
+
+def up_to_date(stage, state):
+    """
+    :return: Whether the stage last ran with the same fingerprint, and its outputs are as it left them
+    """
+    record = state['stages'].get(stage.name)
+    if stage.always or not record: return False
+    if record['fingerprint'] != fingerprint(stage, state['files']): return False
+    return all(file_digest(fname, state['files']) == digest for fname, digest in record['outputs'].items())
+
+
+def select(stages, start=None, stop=None):
+    """
+    :return: The indices of the first and last stages to consider, from the names of start and stop
+    """
+    names = [stage.name for stage in stages]
+    for name in (start, stop):
+        if name and name not in names:
+            raise ValueError('Unknown stage "{}", expected one of {}'.format(name, ', '.join(names)))
+    first = names.index(start) if start else 0
+    last = names.index(stop) if stop else len(names) - 1
+    if first > last: raise ValueError('Stage "{}" comes after stage "{}"'.format(start, stop))
+    return first, last
+
+
+def run(stages, state_file, start=None, stop=None, force=False):
+    """
+    Runs the stages in order, skipping the ones which are up to date.
+    :param stages: A list of Stages, each after the stages whose outputs it reads
+    :param state_file: The JSON file the fingerprints are kept in
+    :param start: The name of the stage to start from. It and every stage after it are run even if up to date,
+    and the stages before it aren't run at all.
+    :param stop: The name of the last stage to run
+    :param force: Flag to run every stage even if up to date
+    :return: The names of the stages which ran
+    """
+    first, last = select(stages, start, stop)
+    state = load_state(state_file)
+    ran = []
+    for stage in stages[first:last + 1]:
+        if not (force or start) and up_to_date(stage, state):
+            print('Stage "{}" is up to date, skipping...'.format(stage.name))
+            continue
+
+        print('Running stage "{}"...'.format(stage.name))
+        began = time.perf_counter()
+        stage.run()
+        record(stage, state, state_file)
+        print('Finished stage "{}" in {:.1f}s.'.format(stage.name, time.perf_counter() - began))
+        ran.append(stage.name)
+    return ran
+
+
+def record(stage, state, state_file):
+    """
+    Records the fingerprint of a stage which has just run, and saves the state.
+    """
+    missing = [fname for fname in stage.outputs if not os.path.isfile(fname)]
+    if missing: raise FileNotFoundError('Stage "{}" did not write {}'.format(stage.name, ', '.join(missing)))
+
+    outputs = {fname: file_digest(fname, state['files']) for fname in stage.outputs}
+    state['stages'][stage.name] = {'fingerprint': fingerprint(stage, state['files']), 'outputs': outputs,
+                                   'params': stage.params}
+    # Saved after every stage, so a failure later on doesn't lose the stages which finished
+    save_state(state, state_file)
+
+
+def run_parallel(stages, state_file, workers=None, force=False):
+    """
+    Runs stages which don't depend on each other at the same time, each in its own process, skipping the ones
+    which are up to date. Each stage's run must be picklable, such as a module level function or a partial of one.
+    :param stages: A list of Stages, none of which read another's outputs
+    :param state_file: The JSON file the fingerprints are kept in
+    :param workers: The number of processes, None uses every core
+    :param force: Flag to run every stage even if up to date
+    :return: A dictionary of the names of the stages which ran to what their run functions returned
+    """
+    state = load_state(state_file)
+    stale = [stage for stage in stages if force or not up_to_date(stage, state)]
+    for stage in stages:
+        if stage not in stale: print('Stage "{}" is up to date, skipping...'.format(stage.name))
+    if not stale: return dict()
+
+    results = dict()
+    with ProcessPoolExecutor(min(workers or os.cpu_count(), len(stale))) as executor:
+        futures = {executor.submit(stage.run): stage for stage in stale}
+        print('Running stages {}...'.format(', '.join('"{}"'.format(stage.name) for stage in stale)))
+        for future in as_completed(futures):
+            stage = futures[future]
+            results[stage.name] = future.result()
+            record(stage, state, state_file)
+            print('Finished stage "{}".'.format(stage.name))
+    return results
+# endregion RUNNING
@@ -0,0 +1,104 @@
+import functools
+import os
+import tempfile
+import unittest
+from src.Generation import Pipeline
+
+
+def repeat_file(source, target, times, log):
+    """
+    A stage for run_parallel, which runs it in another process. Each run is logged, so runs can be counted.
+    """
+    with open(source) as f: text = f.read()
+    with open(target, 'w') as f: f.write(text * times)
+    with open(log, 'a') as f: f.write(os.path.basename(target) + '\n')
+    return len(text) * times
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.raw, self.clean, self.vectors = [os.path.join(self.folder.name, n) for n in ['raw', 'clean', 'vectors']]
+        self.state = os.path.join(self.folder.name, 'state.json')
+        self.write(self.raw, 'abc')
+        self.subdivision = 16
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, fname, text):
+        with open(fname, 'w') as f: f.write(text)
+
+    def read(self, fname):
+        with open(fname) as f: return f.read()
+
+    def stages(self):
+        return [Pipeline.Stage('clean', lambda: self.write(self.clean, self.read(self.raw).upper()),
+                               inputs=[self.raw], outputs=[self.clean]),
+                Pipeline.Stage('vectorize', lambda: self.write(self.vectors, self.read(self.clean) * self.subdivision),
+                               inputs=[self.clean], outputs=[self.vectors], params={'subdivision': self.subdivision})]
+
+    def test_skipping(self):
+        self.assertEqual(['clean', 'vectorize'], Pipeline.run(self.stages(), self.state))
+        self.assertEqual([], Pipeline.run(self.stages(), self.state))
+        # A changed setting only reruns the stages which depend on it
+        self.subdivision = 2
+        self.assertEqual(['vectorize'], Pipeline.run(self.stages(), self.state))
+        self.assertEqual('ABCABC', self.read(self.vectors))
+        # A changed input reruns its stage, and the next only if the output changed
+        self.write(self.raw, 'abd')
+        self.assertEqual(['clean', 'vectorize'], Pipeline.run(self.stages(), self.state))
+        self.write(self.raw, 'ABD')
+        self.assertEqual(['clean'], Pipeline.run(self.stages(), self.state))
+        # As does a missing or edited output
+        os.remove(self.vectors)
+        self.assertEqual(['vectorize'], Pipeline.run(self.stages(), self.state))
+
+    def test_range(self):
+        Pipeline.run(self.stages(), self.state)
+        self.assertEqual(['vectorize'], Pipeline.run(self.stages(), self.state, start='vectorize'))
+        self.assertEqual(['clean'], Pipeline.run(self.stages(), self.state, stop='clean', force=True))
+        with self.assertRaises(ValueError):
+            Pipeline.run(self.stages(), self.state, start='vectorize', stop='clean')
+        with self.assertRaises(ValueError):
+            Pipeline.run(self.stages(), self.state, start='fetch')
+
+    def parallel_stages(self, times):
+        log = os.path.join(self.folder.name, 'log')
+        return [Pipeline.Stage(name, functools.partial(repeat_file, self.raw, os.path.join(self.folder.name, name),
+                                                       times[name], log),
+                               inputs=[self.raw], outputs=[os.path.join(self.folder.name, name)],
+                               params={'times': times[name]}) for name in sorted(times)]
+
+    def runs(self):
+        return sorted(self.read(os.path.join(self.folder.name, 'log')).split())
+
+    def test_parallel(self):
+        times = {'a': 1, 'b': 2, 'c': 3}
+        self.assertEqual({'a': 3, 'b': 6, 'c': 9}, Pipeline.run_parallel(self.parallel_stages(times), self.state, 2))
+        self.assertEqual(['a', 'b', 'c'], self.runs())
+        self.assertEqual('abcabc', self.read(os.path.join(self.folder.name, 'b')))
+        # Each stage is recorded as it finishes, just as run records them
+        self.assertEqual(['a', 'b', 'c'], sorted(Pipeline.load_state(self.state)['stages']))
+        self.assertEqual({}, Pipeline.run_parallel(self.parallel_stages(times), self.state, 2))
+        self.assertEqual([], Pipeline.run(self.parallel_stages(times), self.state))
+
+        # Only the stale stages run, each once
+        times['b'] = 4
+        os.remove(os.path.join(self.folder.name, 'c'))
+        self.assertEqual({'b': 12, 'c': 9}, Pipeline.run_parallel(self.parallel_stages(times), self.state, 2))
+        self.assertEqual(['a', 'b', 'b', 'c', 'c'], self.runs())
+        self.assertEqual(['a', 'b', 'c'], sorted(Pipeline.run_parallel(self.parallel_stages(times), self.state,
+                                                                       force=True)))
+        self.assertEqual(['a', 'a', 'b', 'b', 'b', 'c', 'c', 'c'], self.runs())
+
+    def test_missing_output(self):
+        stages = [Pipeline.Stage('clean', lambda: None, inputs=[self.raw], outputs=[self.clean])]
+        with self.assertRaises(FileNotFoundError):
+            Pipeline.run(stages, self.state)
+        self.assertEqual(['clean'], Pipeline.run(self.stages()[:1], self.state))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+"""
+Sweep builds a data set for every combination of a grid of settings. The tunes any of them need are
+cleaned once into a shared store, since a tune cleans the same whatever else is in the data set, and
+only the filtering and vectorizing of each data set is run on its own, in parallel. Each data set is
+written to its own folder, and the sizes of all of them to a summary table. Like raw_to_npy, a data set
+whose settings and cleaned tunes haven't changed isn't built again.
+
+    python -m src.Generation.Sweep
+    python -m src.Generation.Sweep --force
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import os
+import time
+from collections import Counter
+
+import pandas as pd
+
+from src.Generation import Pipeline
+from src.Generation import raw_to_npy as Build
+from src.Generation.Cleaning import Ingest, TuneStore
+from src.Generation.Vectorizing import Dedup
+
+SWEEP_OUT = '/Sweeps/'
+SWEEP_NAME = 'Sweep'
+
+# Every combination of these values is built. Settings left out take raw_to_npy's values.
+GRID = {'bar_subdivision': [16, 48],
+        'modes': [['Dmajor', 'Gmajor'], ['Amajor', 'Emajor'], Build.MODES],
+        'meters': [['4/4']]}
+
+# The settings of each data set, with the raw_to_npy settings they default to
+DEFAULTS = {'types': 'TYPES', 'meters': 'METER', 'modes': 'MODES', 'bar_subdivision': 'BAR_SUBDIVISION',
+            'dedup': 'DEDUP', 'dedup_threshold': 'DEDUP_THRESHOLD', 'output': 'OUTPUT'}
+# The settings which pick the tunes to clean, with the column of the store each filters
+FILTERS = {'types': 'type', 'meters': 'meter', 'modes': 'mode'}
+
+# The number of data sets to build at a time. None uses every core.
+WORKERS = None
+
+SUMMARY_FILE = 'summary.json'
+
+
+# region CONFIGS
+def configs(grid):
+    """
+    :param grid: A dictionary of settings to the list of values to try for each
+    :return: A list of the settings of every combination, each with every setting in DEFAULTS
+    """
+    keys = list(grid)
+    out = []
+    for values in itertools.product(*[grid[k] for k in keys]):
+        config = {k: getattr(Build, v) for k, v in DEFAULTS.items()}
+        config.update(zip(keys, values))
+        out.append(config)
+    return out
+
+
+def config_name(config, keys=()):
+    """
+    :param keys: The settings to add to the name besides the bar subdivision and filters, such as the ones which
+    differ between the data sets of a sweep
+    :return: A folder name for a data set, such as '16_All_Dmajor-Gmajor_4-4', or '16_All_Dmajor-Gmajor_4-4_dedup-near'
+    with keys=['dedup']
+    """
+    parts = [str(config['bar_subdivision'])]
+    for key in ['types', 'modes', 'meters']:
+        parts.append('-'.join(config[key]) if config[key] else 'All')
+    for key in keys:
+        if key in FILTERS or key == 'bar_subdivision': continue
+        value = config[key]
+        parts.append('{}-{}'.format(key, '-'.join(map(str, value)) if isinstance(value, (list, tuple)) else value))
+    return '_'.join(parts).replace('/', '-').replace(' ', '')
+
+
+def config_names(configs):
+    """
+    :return: The folder name of each config, naming every setting which differs between them
+    :raises ValueError: If two configs have the same name, such as when the grid repeats a value
+    """
+    keys = [key for key in DEFAULTS if len({json.dumps(config[key], sort_keys=True) for config in configs}) > 1]
+    names = [config_name(config, keys) for config in configs]
+    repeated = sorted(name for name, count in Counter(names).items() if count > 1)
+    if repeated: raise ValueError('More than one data set is named {}'.format(', '.join(repeated)))
+    return names
+
+
+def union(configs, key):
+    """
+    :return: Every value of a filter over all of the configs, or an empty list to allow every value if any config does
+    """
+    if any(not config[key] for config in configs): return []
+    return sorted(set(itertools.chain(*[config[key] for config in configs])))
+# endregion CONFIGS
+
+
+# region BUILDING
+def build(config, clean_fname, folder):
+    """
+    Builds one data set out of the shared store of cleaned tunes. Run in its own process by sweep.
+    :param config: The settings of the data set, from configs
+    :param clean_fname: The store of cleaned tunes
+    :param folder: The folder to write the data set to
+    :return: The summary of the data set, which is also written to the folder
+    """
+    began = time.perf_counter()
+    filters = {column: config[key] for key, column in FILTERS.items()}
+    tunes_raw = Build.read_clean(clean_fname, **filters)
+    summary = {'name': os.path.basename(folder), 'tunes': len(tunes_raw)}
+    if tunes_raw:
+        tunes = Build.tunes_frame(tunes_raw)
+        # False rather than None, which vectorize_tunes takes to mean raw_to_npy's DEDUP
+        vectorized, kept = Build.vectorize_tunes(tunes, config['bar_subdivision'], config['dedup'] or False,
+                                                 config['dedup_threshold'], os.path.join(folder, 'Duplicates.json'))
+        summary['vectorized'] = int(sum([len(tune.shape) == 2 for tune in vectorized.notes]))
+    else:
+        kept = pd.DataFrame({'setting': [], 'notes': [], 'timing': []})
+        summary['vectorized'] = 0
+        if config['dedup']: Dedup.save_report(Dedup.dedup_frame(kept)[1], os.path.join(folder, 'Duplicates.json'))
+    Build.save_vectors(kept, os.path.join(folder, 'Vectors'), config['output'], config['bar_subdivision'])
+
+    summary.update(kept=len(kept), seconds=round(time.perf_counter() - began, 1))
+    summary.update({k: config[k] for k in DEFAULTS})
+    with open(os.path.join(folder, SUMMARY_FILE), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def stage(config, clean_fname, folder):
+    outputs = Build.vector_files(os.path.join(folder, 'Vectors'), config['output'])
+    outputs.append(os.path.join(folder, SUMMARY_FILE))
+    if config['dedup']: outputs.append(os.path.join(folder, 'Duplicates.json'))
+    return Pipeline.Stage(os.path.basename(folder), functools.partial(build, config, clean_fname, folder),
+                          inputs=[clean_fname] + Build.vectorize_sources(),
+                          outputs=outputs, params=config)
+
+
+def sweep(grid=GRID, name=SWEEP_NAME, workers=WORKERS, force=False):
+    """
+    Cleans the tunes every combination of the grid needs once, then builds each data set in parallel.
+    :param grid: A dictionary of settings to the list of values to try for each
+    :param name: The name of the sweep's folder
+    :param workers: The number of data sets to build at a time. None uses every core.
+    :param force: Flag to rebuild every data set even if up to date
+    :return: A frame of the summary of every data set
+    """
+    folder = Build.FOLDER_NAME + SWEEP_OUT + name
+    os.makedirs(folder, exist_ok=True)
+    for sub in [Build.ABC_OUT, Build.STATS_OUT, Build.CACHE_OUT]: os.makedirs(Build.FOLDER_NAME + sub, exist_ok=True)
+    state_file = os.path.join(folder, 'Pipeline.json')
+    grid_configs = configs(grid)
+    folders = [os.path.join(folder, name) for name in config_names(grid_configs)]
+
+    clean_fname = os.path.join(folder, 'Cleaned' + TuneStore.EXTENSION)
+    filters = {key: union(grid_configs, key) for key in FILTERS}
+    clean = Pipeline.Stage('clean', functools.partial(Build.clean, scales=[], fname=clean_fname, name=name, **filters),
+                           inputs=[Ingest.RAW_STORE] + Build.clean_sources(),
+                           outputs=[clean_fname], params=filters)
+    Pipeline.run([clean], state_file, force=force)
+
+    for f in folders: os.makedirs(f, exist_ok=True)
+    stages = [stage(config, clean_fname, f) for config, f in zip(grid_configs, folders)]
+    built = Pipeline.run_parallel(stages, state_file, workers, force)
+
+    rows = []
+    for f in folders:
+        with open(os.path.join(f, SUMMARY_FILE)) as file:
+            rows.append(dict(json.load(file), built=os.path.basename(f) in built))
+    summary = pd.DataFrame(rows)
+    summary.to_csv(os.path.join(folder, 'summary.csv'), index=False)
+    print(summary[['name', 'tunes', 'vectorized', 'kept', 'seconds', 'built']].to_string(index=False))
+    return summary
+# endregion BUILDING
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds a data set for every combination of GRID.')
+    parser.add_argument('--name', default=SWEEP_NAME, help='The name of the sweep\'s folder')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--force', action='store_true', help='Rebuild every data set, even if up to date')
+    args = parser.parse_args()
+    sweep(GRID, args.name, args.workers, args.force)
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from src.Generation import Sweep
+from src.Generation.Cleaning import Ingest
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = {'bar_subdivision': [16, 48], 'modes': [['Dmajor', 'Gmajor'], []], 'dedup': ['exact', 'near']}
+
+    def test_configs(self):
+        configs = Sweep.configs(self.grid)
+        self.assertEqual(8, len(configs))
+        self.assertTrue(all(set(config) == set(Sweep.DEFAULTS) for config in configs))
+        self.assertEqual((16, ['Dmajor', 'Gmajor'], 'exact'),
+                         (configs[0]['bar_subdivision'], configs[0]['modes'], configs[0]['dedup']))
+        self.assertEqual((48, [], 'near'), (configs[-1]['bar_subdivision'], configs[-1]['modes'], configs[-1]['dedup']))
+        # Settings left out of the grid take raw_to_npy's values
+        self.assertEqual((Sweep.Build.METER, Sweep.Build.OUTPUT), (configs[0]['meters'], configs[0]['output']))
+
+    def test_union(self):
+        configs = Sweep.configs({'modes': [['Gmajor', 'Dmajor'], ['Amajor', 'Dmajor']], 'types': [['reel']]})
+        self.assertEqual((['Amajor', 'Dmajor', 'Gmajor'], ['reel']), (Sweep.union(configs, 'modes'),
+                                                                     Sweep.union(configs, 'types')))
+        # A config which allows every mode needs every tune
+        self.assertEqual([], Sweep.union(Sweep.configs(self.grid), 'modes'))
+
+    def test_names(self):
+        config = dict(Sweep.configs(self.grid)[1], types=['reel', 'jig'], meters=['6/8'])
+        self.assertEqual('16_reel-jig_Dmajor-Gmajor_6-8', Sweep.config_name(config))
+        self.assertEqual('16_reel-jig_Dmajor-Gmajor_6-8_dedup-near', Sweep.config_name(config, ['dedup']))
+
+        # Every setting which differs between the data sets is in their names
+        names = Sweep.config_names(Sweep.configs(self.grid))
+        self.assertEqual(8, len(set(names)))
+        self.assertEqual(['16_All_Dmajor-Gmajor_4-4_dedup-exact', '16_All_Dmajor-Gmajor_4-4_dedup-near'], names[:2])
+        configs = Sweep.configs({'modes': [['Dmajor', 'Gmajor']]})
+        self.assertEqual(['16_All_Dmajor-Gmajor_4-4'], Sweep.config_names(configs))
+        with self.assertRaises(ValueError):
+            Sweep.config_names(Sweep.configs({'dedup': ['near', 'near']}))
+
+    def test_sources(self):
+        # The stages run again when the code they call changes, including the code which drives them
+        clean, vectorize = Sweep.Build.clean_sources(), Sweep.Build.vectorize_sources()
+        for module in [Sweep.Build, Sweep.TuneStore, Sweep.Build.Catalog, Sweep.Build.Cleaner]:
+            self.assertIn(module.__file__, clean)
+        for module in [Sweep.Build, Sweep.Build.Vectorizer]:
+            self.assertIn(module.__file__, vectorize)
+        stage = Sweep.stage(Sweep.configs(self.grid)[0], 'Cleaned.npz', 'Sweep')
+        self.assertEqual(['Cleaned.npz'] + vectorize, stage.inputs)
+
+    def test_sweep(self):
+        part = '|:dcd fa<dd2|f>d e ddf ed|eAA2A Bc ~d|1 e~d~dc d2fe:|2 e~d~dc d2fe||'
+        tunes = [{'tune': str(x), 'setting': str(x), 'type': 'reel', 'meter': '4/4', 'mode': mode,
+                  'abc': part * (2 + x)} for x, mode in enumerate(['Dmajor', 'Gmajor'] * 3)]
+        grid = {'bar_subdivision': [16, 48], 'modes': [['Dmajor'], ['Gmajor']]}
+        with tempfile.TemporaryDirectory() as folder:
+            raw = os.path.join(folder, 'Raw', 'raw.npz')
+            Sweep.TuneStore.write(tunes, raw)
+            with mock.patch.object(Ingest, 'RAW_STORE', raw), mock.patch.object(Sweep.Build, 'FOLDER_NAME', folder), \
+                    mock.patch.object(Sweep.Build, 'WORKERS', 1), \
+                    mock.patch.object(Sweep.Build, 'clean', wraps=Sweep.Build.clean) as clean:
+                summary = Sweep.sweep(grid, 'Test', workers=2)
+                # The tunes every data set needs are cleaned once, and each data set gets a folder and a summary row
+                self.assertEqual(1, clean.call_count)
+                names = Sweep.config_names(Sweep.configs(grid))
+                self.assertEqual(names, summary['name'].tolist())
+                sweep_folder = Sweep.Build.FOLDER_NAME + Sweep.SWEEP_OUT + 'Test'
+                for name in names:
+                    self.assertTrue(os.path.exists(os.path.join(sweep_folder, name, Sweep.SUMMARY_FILE)))
+                self.assertTrue(summary['built'].all())
+                self.assertEqual([3] * 4, summary['tunes'].tolist())
+                self.assertEqual([3] * 4, summary['vectorized'].tolist())
+
+                # Nothing is cleaned or built again when nothing changed
+                summary = Sweep.sweep(grid, 'Test', workers=2)
+                self.assertEqual(1, clean.call_count)
+                self.assertFalse(summary['built'].any())
+                self.assertEqual(4, len(summary))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Augment holds transforms applied to each batch of tunes as it is loaded, so a data set can be seen in
+many variations without storing any of them. Each transform is called with a batch of pitches and
+onsets, such as from Shards.ShardReader, and returns the transformed batch.
+"""
+
+import numpy as np
+
+# The vectorizer moves every tune to the same key, so 12 shifts give every key once
+MIN_SHIFT = -5
+MAX_SHIFT = 6
+# The padding of the Tensor and Shards arrays, which is never shifted
+PAD = 0
+
+
+class Transpose:
+    """
+    Shifts each tune in a batch by a random number of semitones from min_shift to max_shift. The ticks
+    holding PAD are left alone, so the padding stays 0.
+    :param min_shift: The lowest shift, in semitones
+    :param max_shift: The highest shift, in semitones
+    :param min_pitch: The lowest pitch a shifted note may have, the lowest the batch's dtype holds if None
+    :param max_pitch: The highest pitch a shifted note may have, the highest the batch's dtype holds if None.
+    A tune is only shifted as far as keeps its notes within min_pitch and max_pitch.
+    :param seed: The seed of the shifts
+    """
+
+    def __init__(self, min_shift=MIN_SHIFT, max_shift=MAX_SHIFT, min_pitch=None, max_pitch=None, seed=None):
+        if min_shift > max_shift: raise ValueError('min_shift {} is above max_shift {}'.format(min_shift, max_shift))
+        self.min_shift, self.max_shift = min_shift, max_shift
+        self.min_pitch, self.max_pitch = min_pitch, max_pitch
+        self.rng = np.random.RandomState(seed)
+
+    def shifts(self, pitch):
+        """
+        :param pitch: A batch of pitches, [tunes, bars, ticks]
+        :return: A random shift for each tune, from the ones which keep its notes within the bounds and don't
+        move any of them onto PAD, or 0 if there are none
+        """
+        pitch = np.asarray(pitch)
+        info = np.iinfo(pitch.dtype) if pitch.dtype.kind in 'iu' else None
+        min_pitch = self.min_pitch if self.min_pitch is not None else (info.min if info else -np.inf)
+        max_pitch = self.max_pitch if self.max_pitch is not None else (info.max if info else np.inf)
+
+        if not len(pitch): return np.zeros(0, dtype=np.int64)
+        flat = pitch.reshape(len(pitch), -1).astype(np.int64)
+        mask = flat != PAD
+        # A tune of only padding has no notes to keep in bounds
+        notes = mask.any(axis=1)
+        low = np.where(notes, np.where(mask, flat, np.iinfo(np.int64).max).min(axis=1), 0)
+        high = np.where(notes, np.where(mask, flat, np.iinfo(np.int64).min).max(axis=1), 0)
+
+        candidates = np.arange(self.min_shift, self.max_shift + 1)
+        allowed = (low[:, None] + candidates >= min_pitch) & (high[:, None] + candidates <= max_pitch)
+        for j, shift in enumerate(candidates):
+            # Data sets vectorized before the rests were kept at 0 hold them transposed,
+            # so a small shift could turn one into padding
+            if shift: allowed[:, j] &= ~((flat == -shift) & mask).any(axis=1)
+
+        scores = np.where(allowed, self.rng.random_sample(allowed.shape), -1)
+        return np.where(allowed.any(axis=1), candidates[scores.argmax(axis=1)], 0)
+
+    def __call__(self, pitch, onsets):
+        pitch = np.asarray(pitch)
+        shifts = self.shifts(pitch).reshape((-1,) + (1,) * (pitch.ndim - 1))
+        shifted = np.where(pitch != PAD, pitch.astype(np.int64) + shifts, PAD)
+        return shifted.astype(pitch.dtype), onsets
+
+
+def compose(*transforms):
+    """
+    :return: A transform which applies each of the transforms in turn
+    """
+    def transform(pitch, onsets):
+        for t in transforms: pitch, onsets = t(pitch, onsets)
+        return pitch, onsets
+    return transform
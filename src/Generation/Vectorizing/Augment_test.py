@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.Generation.Vectorizing import Augment, Shards, Tensor, Vectorizer
+
+
+class TestAugment(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.pitch = rng.randint(60, 80, size=(64, 4, 16)).astype(np.int8)
+        # Padded bars and ticks, as in the Tensor and Shards arrays
+        self.pitch[:, 3] = 0
+        self.pitch[:, :, 12:] = 0
+        self.onsets = rng.randint(0, 2, size=self.pitch.shape).astype(np.uint8)
+
+    def test_transpose(self):
+        pitch, onsets = Augment.Transpose(seed=0)(self.pitch, self.onsets)
+        self.assertIs(self.onsets, onsets)
+        self.assertEqual(np.int8, pitch.dtype)
+        # The padding stays 0, and every note in a tune moves by the same amount
+        np.testing.assert_array_equal(self.pitch == 0, pitch == 0)
+        shifts = (pitch.astype(int) - self.pitch)[:, 0, 0]
+        np.testing.assert_array_equal(pitch.astype(int)[:, :3, :12] - shifts[:, None, None], self.pitch[:, :3, :12])
+        self.assertEqual(set(range(-5, 7)), set(shifts))
+
+    def test_range(self):
+        self.assertEqual({2, 3}, set(Augment.Transpose(2, 3, seed=0).shifts(self.pitch)))
+        # Only as far as keeps the notes within the pitches
+        shifts = Augment.Transpose(-10, 10, min_pitch=58, max_pitch=81, seed=0).shifts(self.pitch)
+        notes = np.ma.masked_equal(self.pitch.reshape(64, -1), 0)
+        self.assertTrue((notes.min(axis=1) + shifts >= 58).all() and (notes.max(axis=1) + shifts <= 81).all())
+        # Nor onto the padding, nor past what the dtype holds
+        rests = np.array([[[3, 60, 0]], [[125, 0, 0]], [[0, 0, 0]]], dtype=np.int8)
+        transpose = Augment.Transpose(-3, 6, seed=0)
+        shifts = np.array([transpose.shifts(rests) for _ in range(50)])
+        self.assertEqual((-2, 6), (shifts[:, 0].min(), shifts[:, 0].max()))
+        self.assertEqual((-3, 2), (shifts[:, 1].min(), shifts[:, 1].max()))
+        pitch, _ = transpose(rests, None)
+        np.testing.assert_array_equal(rests == 0, pitch == 0)
+        self.assertEqual(0, len(transpose.shifts(np.zeros((0, 4, 16), np.int8))))
+        with self.assertRaises(ValueError):
+            Augment.Transpose(3, 2)
+
+    def test_reader(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with Shards.ShardWriter(folder, shard_size=16) as writer:
+                writer.write_many(list(self.pitch), list(self.onsets))
+            plain = Shards.ShardReader(folder, seed=1)
+            reader = Shards.ShardReader(folder, seed=1, transform=Augment.compose(Augment.Transpose(1, 1)))
+            pitch, onsets = reader.sample(8)
+            expected, expected_onsets = plain.sample(8)
+            np.testing.assert_array_equal(np.where(expected != 0, expected + 1, 0), pitch)
+            np.testing.assert_array_equal(expected_onsets, onsets)
+            self.assertEqual(4, len(list(reader.batches(16))))
+
+    def test_vectorized(self):
+        # Tunes from every key, with rests and bars short enough to be padded
+        df = pd.DataFrame({'mode': ['Gmajor', 'Dmajor', 'Amajor', 'Cmajor'],
+                           'abc': ['GABcz2d2|GABcd2|', 'A2FAz2dB|A2F2|', 'cBAz2Ace|z4ABc2|', 'CEGcz4|GEC2|']})
+        # vectorize_frame sets the module's subdivision, which is put back for the other tests
+        with mock.patch.multiple(Vectorizer, BAR_SUBDIVISION=Vectorizer.BAR_SUBDIVISION, NOTE_MULT=Vectorizer.NOTE_MULT,
+                                 PAD_BARS=Vectorizer.PAD_BARS):
+            df = Vectorizer.vectorize_frame(df, bar_subdivision=16)
+        with tempfile.TemporaryDirectory() as folder:
+            Tensor.save(folder + '/tunes', df['notes'], df['timing'])
+            original, onsets = Tensor.Reader(folder + '/tunes').take(range(4))
+        self.assertTrue((original == 0).any(axis=(1, 2)).all())
+
+        for seed in range(10):
+            pitch, _ = Augment.Transpose(seed=seed)(original, onsets)
+            # The rests and padding stay 0, and every note of a tune moves by the same amount
+            np.testing.assert_array_equal(original == 0, pitch == 0)
+            shifts = pitch.astype(int) - original
+            for tune, shift in zip(original, shifts):
+                self.assertEqual(1, len(set(shift[tune != 0])))
+
+
+if __name__ == '__main__':
+    unittest.main()
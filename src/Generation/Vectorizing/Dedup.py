@@ -0,0 +1,190 @@
+"""
+Dedup finds the settings which come out of the vectorizer as the same tune, or nearly the same one.
+Identical vectors are found by an exact hash. Near duplicates are found by a MinHash sketch of the
+overlapping runs of ticks in each tune, with the sketches split into bands so only tunes sharing a
+band are compared. Each cluster of duplicates is collapsed to its first tune.
+"""
+
+import hashlib
+import json
+from collections import Counter
+
+import numpy as np
+
+# The number of ticks in each run which is hashed, half a bar at 16 ticks to the bar. Longer runs make a
+# single changed note spoil more of them.
+SHINGLE = 8
+PERMUTATIONS = 64
+BANDS = 16
+# The estimated fraction of shared runs for two tunes to count as duplicates. On the major tunes, almost
+# every cluster this finds is settings of the same tune, or the same tune posted twice.
+THRESHOLD = 0.8
+SEED = 0
+
+
+# region HASHING
+def sequence(notes, timing=None):
+    """
+    Flattens a tune's note vector into one value per tick, folding in whether a note starts on the tick.
+    """
+    values = np.asarray(notes, dtype=np.int64).ravel()
+    if timing is not None: values = values * 2 + (np.asarray(timing, dtype=np.int64).ravel() > 0)
+    return values
+
+
+def exact_hash(notes, timing=None):
+    """
+    :return: A hash which is the same for two tunes only if their vectors are identical
+    """
+    values = sequence(notes, timing)
+    return hashlib.sha1(np.asarray(np.shape(notes), dtype=np.int64).tobytes() + values.tobytes()).hexdigest()
+
+
+class Sketcher:
+    """
+    Makes the MinHash sketches of tunes, with the same random hash functions for every tune.
+    """
+
+    def __init__(self, permutations=PERMUTATIONS, shingle=SHINGLE, seed=SEED):
+        rng = np.random.RandomState(seed)
+        self.shingle = shingle
+        # Odd multipliers keep every hash a permutation of the 64 bit values
+        self.weights = rng.randint(1, 2 ** 62, size=shingle, dtype=np.int64).astype(np.uint64) * 2 + 1
+        self.a = rng.randint(1, 2 ** 62, size=(permutations, 1), dtype=np.int64).astype(np.uint64) * 2 + 1
+        self.b = rng.randint(0, 2 ** 62, size=(permutations, 1), dtype=np.int64).astype(np.uint64)
+
+    def shingles(self, values):
+        """
+        :return: The distinct hashes of every run of shingle ticks, leaving out the runs of a single value
+        """
+        values = values.astype(np.uint64)
+        if len(values) < self.shingle:
+            values = np.concatenate([values, np.zeros(self.shingle - len(values), np.uint64)])
+        windows = np.lib.stride_tricks.sliding_window_view(values, self.shingle)
+        # A run of one value is the padding of a bar, or a held note. Nearly every tune shares them, which would
+        # put every tune in the same buckets.
+        windows = windows[(windows != windows[:, :1]).any(axis=1)]
+        return np.unique(windows @ self.weights)
+
+    def min_hash(self, shingles):
+        """
+        :return: The smallest value of each hash function over the shingles, the largest value if there are none
+        """
+        if not len(shingles): return np.full(len(self.a), np.iinfo(np.uint64).max, dtype=np.uint64)
+        hashes = self.a * shingles + self.b
+        hashes ^= hashes >> np.uint64(29)
+        return hashes.min(axis=1)
+
+    def sketch(self, notes, timing=None):
+        """
+        :return: The smallest value of each hash function over the tune's shingles
+        """
+        return self.min_hash(self.shingles(sequence(notes, timing)))
+
+
+def similarity(a, b):
+    """
+    :return: The fraction of equal entries of two sketches, an estimate of the overlap of their shingles
+    """
+    return float(np.mean(a == b))
+# endregion HASHING
+
+
+# region CLUSTERING
+def find(parents, x):
+    while parents[x] != x:
+        parents[x] = parents[parents[x]]
+        x = parents[x]
+    return x
+
+
+def union(parents, x, y):
+    # The earlier tune always becomes the representative
+    x, y = find(parents, x), find(parents, y)
+    if x != y: parents[max(x, y)] = min(x, y)
+
+
+def find_duplicates(notes, timing=None, near=True, threshold=THRESHOLD, bands=BANDS, sketcher=None):
+    """
+    Groups tunes whose vectors are identical, or with near set, nearly identical.
+    :param notes: A list of note vectors
+    :param timing: The matching list of timing vectors, or None to only compare the notes
+    :param near: Flag to also group tunes which are nearly identical
+    :param threshold: The estimated similarity for two tunes to be near duplicates
+    :param bands: The number of bands the sketches are split into, more finds more candidates to compare
+    :param sketcher: The Sketcher to use, one with the default parameters if None
+    :return: An array of the index of the first tune in each tune's cluster
+    """
+    timing = [None] * len(notes) if timing is None else timing
+    parents = list(range(len(notes)))
+
+    first = dict()
+    for x, (n, t) in enumerate(zip(notes, timing)):
+        key = exact_hash(n, t)
+        if key in first:
+            union(parents, first[key], x)
+        else:
+            first[key] = x
+
+    if near:
+        sketcher = sketcher or Sketcher()
+        # Exact duplicates already share a cluster, so only the first of each is sketched
+        unique = sorted(first.values())
+        sketches = dict()
+        for x in unique:
+            shingles = sketcher.shingles(sequence(notes[x], timing[x]))
+            # A tune of only padding and held notes can only be an exact duplicate
+            if len(shingles): sketches[x] = sketcher.min_hash(shingles)
+        buckets = dict()
+        for x in sketches:
+            for band, values in enumerate(np.array_split(sketches[x], bands)):
+                buckets.setdefault((band, values.tobytes()), []).append(x)
+        for members in buckets.values():
+            for i, x in enumerate(members):
+                for y in members[i + 1:]:
+                    if find(parents, x) != find(parents, y) and similarity(sketches[x], sketches[y]) >= threshold:
+                        union(parents, x, y)
+
+    return np.array([find(parents, x) for x in range(len(notes))], dtype=np.int64)
+
+
+def clusters(labels):
+    """
+    :return: A dictionary of each cluster's first tune to the indices of all of its tunes, for clusters of two or more
+    """
+    groups = dict()
+    for x, label in enumerate(labels): groups.setdefault(int(label), []).append(x)
+    return {label: members for label, members in groups.items() if len(members) > 1}
+# endregion CLUSTERING
+
+
+# region FRAMES
+def dedup_frame(df, near=True, threshold=THRESHOLD, key='setting'):
+    """
+    Collapses the duplicate tunes of a vectorized frame to the first of each.
+    :param df: A pandas dataframe with 'notes' and 'timing' columns, from Vectorizer.vectorize_frame
+    :param key: The column identifying each tune in the report
+    :return: The frame without the duplicates, and a report of the clusters
+    """
+    labels = find_duplicates(list(df['notes']), list(df['timing']), near, threshold)
+    ids = df[key].tolist() if key in df else list(range(len(df)))
+    found = clusters(labels)
+    report = {'tunes': len(df), 'kept': int(np.sum(labels == np.arange(len(df)))), 'near': near,
+              'threshold': threshold, 'cluster_sizes': dict(sorted(Counter(len(m) for m in found.values()).items())),
+              'clusters': sorted([[ids[x] for x in members] for members in found.values()], key=len, reverse=True)}
+    kept = df[labels == np.arange(len(df))].reset_index(drop=True)
+    return kept, report
+
+
+def print_report(report, largest=10):
+    print('{}/{} tunes kept after removing duplicates'.format(report['kept'], report['tunes']))
+    for size, count in report['cluster_sizes'].items():
+        print('{:>8} clusters of {} tunes'.format(count, size))
+    for cluster in report['clusters'][:largest]:
+        print('    ' + ', '.join(map(str, cluster)))
+
+
+def save_report(report, fname):
+    with open(fname, 'w') as f:
+        json.dump(report, f, indent=2)
+# endregion FRAMES
@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.Generation.Vectorizing import Dedup
+
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.base = rng.randint(60, 80, size=(32, 16))
+        self.timing = rng.randint(0, 2, size=(32, 16))
+        near = self.base.copy()
+        near[3, 5] += 2
+        self.notes = [self.base, rng.randint(60, 80, size=(32, 16)), self.base.copy(), near,
+                      rng.randint(60, 80, size=(16, 16)), near.copy()]
+
+    def test_exact(self):
+        self.assertEqual(Dedup.exact_hash(self.base, self.timing), Dedup.exact_hash(self.base.copy(), self.timing))
+        self.assertNotEqual(Dedup.exact_hash(self.base), Dedup.exact_hash(self.base, self.timing))
+        # The same notes split into bars differently aren't the same tune
+        self.assertNotEqual(Dedup.exact_hash(self.base), Dedup.exact_hash(self.base.reshape(64, 8)))
+        self.assertEqual([0, 1, 0, 3, 4, 3], Dedup.find_duplicates(self.notes, near=False).tolist())
+
+    def test_near(self):
+        sketcher = Dedup.Sketcher()
+        a, b = sketcher.sketch(self.base), sketcher.sketch(self.notes[3])
+        self.assertGreater(Dedup.similarity(a, b), 0.8)
+        self.assertLess(Dedup.similarity(a, sketcher.sketch(self.notes[1])), 0.2)
+        self.assertEqual([0, 1, 0, 0, 4, 0], Dedup.find_duplicates(self.notes).tolist())
+        self.assertEqual({0: [0, 2, 3, 5]}, Dedup.clusters(Dedup.find_duplicates(self.notes)))
+        self.assertEqual(1.0, Dedup.similarity(sketcher.sketch(np.zeros((0, 16))), sketcher.sketch(np.zeros((0, 16)))))
+
+    def test_padding(self):
+        sketcher = Dedup.Sketcher()
+        self.assertEqual(0, len(sketcher.shingles(np.zeros(64, dtype=np.int64))))
+        # The run of zeros hashes to 0, and is left out of a tune padded with it
+        shingles = sketcher.shingles(Dedup.sequence(np.where(np.arange(16) < 8, self.base, 0)))
+        self.assertTrue(len(shingles) and 0 not in shingles)
+        # Tunes of only padding don't all land in the same buckets as near duplicates
+        padding = [np.zeros((bars, 16), dtype=np.int64) for bars in range(1, 40)] + [np.zeros((1, 16))]
+        self.assertEqual(list(range(39)) + [0], Dedup.find_duplicates(padding).tolist())
+
+    def test_frame(self):
+        df = pd.DataFrame({'setting': ['10', '11', '12', '13', '14', '15'], 'notes': self.notes,
+                           'timing': [np.zeros_like(n) for n in self.notes]})
+        kept, report = Dedup.dedup_frame(df)
+        self.assertEqual(['10', '11', '14'], kept['setting'].tolist())
+        self.assertEqual((6, 3, {4: 1}, [['10', '12', '13', '15']]),
+                         (report['tunes'], report['kept'], report['cluster_sizes'], report['clusters']))
+        kept, report = Dedup.dedup_frame(df, near=False)
+        self.assertEqual(['10', '11', '13', '14'], kept['setting'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
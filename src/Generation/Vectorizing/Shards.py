@@ -0,0 +1,176 @@
+"""
+Shards splits a data set too large for memory into fixed size shards, each a Tensor of the same shape,
+with a manifest of the shards. The reader memory maps every shard and serves shuffled batches drawn from
+all of them, so only the tunes in each batch are read.
+
+    python -m src.Generation.Vectorizing.Shards ../../Data/Vectors/June_Fixes_Shards
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from src.Generation.Vectorizing import Tensor
+
+MANIFEST = 'manifest.json'
+SHARD_SIZE = 4096
+VERSION = 1
+# The pitches of every shard share a dtype, so a batch from several shards is a single array
+DTYPE = np.int8
+
+
+def shard_name(index):
+    return 'shard_{:05d}'.format(index)
+
+
+# region WRITING
+class ShardWriter:
+    """
+    Writes tunes into shards of shard_size tunes, each padded to the same number of bars and ticks. The
+    manifest is written when the writer is closed, so a data set without one is incomplete.
+    :param folder: The directory to write the shards and manifest to
+    :param bars: The number of bars of every tune, the first tune's if None
+    :param ticks: The number of ticks of every bar, the first tune's if None
+    :param shard_size: The number of tunes in each shard
+    :param bar_subdivision: The bar subdivision the tunes were vectorized with
+    """
+
+    def __init__(self, folder, bars=None, ticks=None, shard_size=SHARD_SIZE, bar_subdivision=None):
+        self.folder = folder
+        self.bars, self.ticks = bars, ticks
+        self.shard_size = shard_size
+        self.bar_subdivision = bar_subdivision
+        self.shards = []
+        self.notes, self.timing, self.ids = [], [], []
+        # A count of every pitch written, from which the percentiles of the whole set are exact, and of the ticks of
+        # padding each tune is filled out to bars and ticks with
+        self.histogram = np.zeros(256, dtype=np.int64)
+        self.padding = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, notes, timing, tune_id=None):
+        if self.bars is None: self.bars, self.ticks = np.shape(notes)
+        self.notes.append(notes)
+        self.timing.append(timing)
+        self.ids.append(len(self) if tune_id is None else tune_id)
+        if len(self.notes) == self.shard_size: self.flush()
+
+    def write_many(self, notes, timing, ids=None):
+        for x, (n, t) in enumerate(zip(notes, timing)):
+            self.write(n, t, None if ids is None else ids[x])
+
+    def __len__(self):
+        return sum([shard['count'] for shard in self.shards]) + len(self.notes)
+
+    def flush(self):
+        if not self.notes: return
+        name = shard_name(len(self.shards))
+        meta = Tensor.save(os.path.join(self.folder, name), self.notes, self.timing, self.ids, self.bar_subdivision,
+                           shape=(self.bars, self.ticks), dtype=DTYPE)
+        for n in self.notes:
+            values, counts = np.unique(np.asarray(n, dtype=np.int64), return_counts=True)
+            self.histogram[values - np.iinfo(DTYPE).min] += counts
+            self.padding += self.bars * self.ticks - np.size(n)
+        self.shards.append({'name': name, 'count': meta['shape'][0]})
+        self.notes, self.timing, self.ids = [], [], []
+
+    def close(self):
+        self.flush()
+        manifest = {'version': VERSION, 'count': len(self), 'shard_size': self.shard_size, 'bars': self.bars,
+                    'ticks': self.ticks, 'dtype': np.dtype(DTYPE).name, 'bar_subdivision': self.bar_subdivision,
+                    'shards': self.shards, 'pitch_histogram': self.histogram.tolist(), 'padding': self.padding}
+        fname = os.path.join(self.folder, MANIFEST)
+        with open(fname + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(fname + '.tmp', fname)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is None: self.close()
+
+
+def save_frame(folder, df, bar_subdivision=None, shard_size=SHARD_SIZE, key='setting'):
+    """
+    Shards the 'notes' and 'timing' columns of a frame from Vectorizer.vectorize_frame, padded to its longest tune.
+    :return: The manifest
+    """
+    bars = max([np.shape(n)[0] for n in df['notes']], default=0)
+    ticks = max([np.shape(n)[1] for n in df['notes']], default=0)
+    writer = ShardWriter(folder, bars, ticks, shard_size, bar_subdivision)
+    writer.write_many(df['notes'].tolist(), df['timing'].tolist(), df[key].tolist() if key in df else None)
+    return writer.close()
+# endregion WRITING
+
+
+# region READING
+class ShardReader(Tensor.Reader):
+    """
+    A sharded data set opened for reading. Tunes are numbered across the shards in the order they were written.
+    Batches are drawn as from a Tensor.Reader.
+    :param folder: The directory holding the manifest and shards
+    :param seed: The seed of the random batches
+    :param transform: A function applied to every batch served by sample and batches, such as an Augment.Transpose
+    """
+
+    def __init__(self, folder, seed=None, mmap_mode='r', transform=None):
+        self.folder = folder
+        self.transform = transform
+        with open(os.path.join(folder, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.shards = [Tensor.load(os.path.join(folder, shard['name']), mmap_mode) for shard in self.manifest['shards']]
+        # The index of the first tune of each shard, followed by the number of tunes
+        self.starts = np.cumsum([0] + [shard['count'] for shard in self.manifest['shards']])
+        self.ticks = self.manifest['ticks']
+        self.rng = np.random.RandomState(seed)
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    @property
+    def shape(self):
+        return len(self), self.manifest['bars'], self.manifest['ticks']
+
+    def take(self, indices):
+        """
+        Reads the tunes in indices, a shard at a time and in order within each, so each shard is read sequentially.
+        :param indices: The numbers of the tunes to read
+        :return: The pitches [len(indices), bars, ticks] and onsets of the same shape, in the order of indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError('Tune indices must be from 0 to {}'.format(len(self) - 1))
+        pitch = np.empty((len(indices),) + self.shape[1:], dtype=self.manifest['dtype'])
+        onsets = np.empty((len(indices),) + self.shape[1:], dtype=np.uint8)
+        shards = np.searchsorted(self.starts, indices, side='right') - 1
+        for shard in np.unique(shards):
+            rows = np.flatnonzero(shards == shard)
+            local = indices[rows] - self.starts[shard]
+            order = np.argsort(local, kind='stable')
+            rows, local = rows[order], local[order]
+            pitch[rows] = self.shards[shard].pitch[local]
+            onsets[rows] = Tensor.unpack_onsets(self.shards[shard].onsets[local], self.ticks)
+        return pitch, onsets
+
+    def percentile(self, q, padding=True):
+        """
+        :param padding: Flag to count the 0s each tune is padded to the shape of the data set with, as np.percentile
+        over the whole array of pitches does. Otherwise only the ticks of each tune are counted.
+        :return: The q-th percentile of every pitch in the data set, as np.percentile would find it
+        """
+        histogram = np.array(self.manifest['pitch_histogram'])
+        low = np.iinfo(self.manifest['dtype']).min
+        if padding: histogram[-low] += self.manifest.get('padding', 0)
+        return Tensor.histogram_percentile(histogram, low, q)
+# endregion READING
+
+
+if __name__ == '__main__':
+    for folder in sys.argv[1:]:
+        reader = ShardReader(folder)
+        print('{}: {} tunes of {} bars of {} ticks in {} shards'.format(folder, *reader.shape,
+                                                                        len(reader.shards)))
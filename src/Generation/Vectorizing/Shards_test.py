@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from src.Generation.Vectorizing import Shards
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        rng = np.random.RandomState(0)
+        self.notes = [rng.randint(-5, 90, size=(4, 16)) for _ in range(10)] + [rng.randint(60, 70, size=(2, 16))]
+        self.timing = [rng.randint(0, 2, size=n.shape) for n in self.notes]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self):
+        with Shards.ShardWriter(self.folder.name, shard_size=4, bar_subdivision=16) as writer:
+            writer.write_many(self.notes, self.timing, ids=['t{}'.format(x) for x in range(11)])
+        return Shards.ShardReader(self.folder.name, seed=0)
+
+    def test_manifest(self):
+        reader = self.write()
+        self.assertEqual((11, 4, 16), reader.shape)
+        self.assertEqual([4, 4, 3], [shard['count'] for shard in reader.manifest['shards']])
+        self.assertEqual(['t8', 't9', 't10'], reader.shards[2].meta['ids'])
+        self.assertEqual(sorted(['manifest.json'] + ['shard_0000{}{}'.format(x, e) for x in range(3)
+                                                     for e in ['.json', '_Onsets.npy', '_Pitch.npy']]),
+                         sorted(os.listdir(self.folder.name)))
+
+    def test_take(self):
+        reader = self.write()
+        # Across the shard boundaries, in the order asked for, with repeats
+        indices = [10, 3, 4, 0, 3]
+        pitch, onsets = reader.take(indices)
+        for row, x in enumerate(indices):
+            bars = self.notes[x].shape[0]
+            np.testing.assert_array_equal(self.notes[x], pitch[row, :bars])
+            np.testing.assert_array_equal(self.timing[x], onsets[row, :bars])
+        self.assertEqual(0, np.abs(pitch[0, 2:]).sum())
+        with self.assertRaises(IndexError):
+            reader.take([11])
+
+    def test_batches(self):
+        reader = self.write()
+        batches = list(reader.batches(4))
+        self.assertEqual([4, 4, 3], [len(p) for p, _ in batches])
+        seen = np.concatenate([p for p, _ in batches])
+        # Every tune exactly once, shuffled
+        self.assertEqual(sorted(n[:2].tobytes() for n in np.asarray([x[:2] for x in self.notes], dtype=np.int8)),
+                         sorted(p[:2].tobytes() for p in seen))
+        self.assertEqual(2, len(list(reader.batches(4, drop_last=True))))
+        self.assertEqual((6, 4, 16), reader.sample(6)[0].shape)
+
+    def test_percentile(self):
+        reader = self.write()
+        values = np.concatenate([n.ravel() for n in self.notes])
+        padded = reader.take(range(len(reader)))[0].ravel()
+        self.assertGreater(len(padded), len(values))
+        for q in [0, 5, 50, 95, 100]:
+            self.assertAlmostEqual(np.percentile(padded, q), reader.percentile(q))
+            self.assertAlmostEqual(np.percentile(values, q), reader.percentile(q, padding=False))
+
+    def test_frame(self):
+        df = pd.DataFrame({'setting': range(11), 'notes': self.notes, 'timing': self.timing})
+        manifest = Shards.save_frame(self.folder.name, df, 16, shard_size=8)
+        self.assertEqual((11, [8, 3]), (manifest['count'], [s['count'] for s in manifest['shards']]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+"""
+Tensor saves vectorized tunes as fixed shape arrays rather than object arrays of each tune's vectors.
+The pitches are one [tunes, bars, ticks] array of int8 or uint8, and the onsets are the same shape
+with every 8 ticks packed into a byte. A JSON sidecar holds the shapes, the bar subdivision and the
+ids of the tunes. Neither array needs pickling, so both load with np.load(..., mmap_mode='r'), and a Reader
+draws batches of tunes from the mapped arrays without reading the rest.
+
+    python -m src.Generation.Vectorizing.Tensor ../../Data/Vectors/June_Fixes
+"""
+
+import json
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+PITCH = '_Pitch.npy'
+ONSETS = '_Onsets.npy'
+SIDECAR = '.json'
+VERSION = 1
+# The number of tunes counted at a time when finding the percentiles of a tensor's pitches
+HISTOGRAM_TUNES = 4096
+
+Tensor = namedtuple('Tensor', ['pitch', 'onsets', 'meta'])
+
+
+def paths(fname):
+    """
+    :param fname: The path the files are named after, without an extension, such as '../../Data/Vectors/June_Fixes'
+    :return: The paths of the pitch array, the onset array and the sidecar
+    """
+    return fname + PITCH, fname + ONSETS, fname + SIDECAR
+
+
+def pitch_dtype(low, high):
+    """
+    :return: The smallest dtype holding every pitch from low to high. Data sets vectorized before the rests were
+    kept at 0 hold them transposed along with the notes, so they can be negative.
+    """
+    for dtype in (np.int8, np.uint8):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max: return np.dtype(dtype)
+    raise ValueError('Pitches from {} to {} do not fit in a byte'.format(low, high))
+
+
+# region WRITING
+def save(fname, notes, timing, ids=None, bar_subdivision=None, shape=None, dtype=None):
+    """
+    Writes the tunes into the arrays a tune at a time, so no int64 copy of the whole set is made. Tunes
+    with fewer bars or ticks than the longest are padded with zeros, and their own bar counts are kept in
+    the sidecar. The sidecar is written last, so a set without one is incomplete.
+    :param fname: The path to name the files after, without an extension
+    :param notes: A list of each tune's [bars, ticks] note vector, as from Vectorizer.vectorize_frame
+    :param timing: The matching list of timing vectors, non-zero where a note starts
+    :param ids: The id of each tune, such as its setting
+    :param bar_subdivision: The bar subdivision the tunes were vectorized with
+    :param shape: The (bars, ticks) to pad every tune to, rather than the longest tune's
+    :param dtype: The dtype of the pitches, rather than the smallest which holds them
+    :return: The sidecar's contents
+    """
+    notes, timing = list(notes), list(timing)
+    if len(notes) != len(timing):
+        raise ValueError('{} note vectors but {} timing vectors'.format(len(notes), len(timing)))
+    for n, t in zip(notes, timing):
+        if np.ndim(n) != 2 or np.shape(n) != np.shape(t):
+            raise ValueError('Tunes must be [bars, ticks] arrays with timing of the same shape')
+    bars = [int(np.shape(n)[0]) for n in notes]
+    ticks = max([int(np.shape(n)[1]) for n in notes], default=0)
+    low = min([int(np.min(n)) for n in notes if np.size(n)], default=0)
+    high = max([int(np.max(n)) for n in notes if np.size(n)], default=0)
+    dtype = np.dtype(dtype) if dtype else pitch_dtype(low, high)
+    if not (np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max):
+        raise ValueError('Pitches from {} to {} do not fit in {}'.format(low, high, dtype.name))
+    if shape:
+        if max(bars, default=0) > shape[0] or ticks > shape[1]:
+            raise ValueError('Tunes of up to {} bars of {} ticks do not fit in {}'.format(max(bars), ticks, shape))
+        ticks = shape[1]
+    shape = (len(notes), shape[0] if shape else max(bars, default=0), ticks)
+    packed = shape[:2] + ((ticks + 7) // 8,)
+
+    pitch_file, onset_file, sidecar = paths(fname)
+    temps = [pitch_file + '.tmp', onset_file + '.tmp']
+    try:
+        pitch = np.lib.format.open_memmap(temps[0], mode='w+', dtype=dtype, shape=shape)
+        onsets = np.lib.format.open_memmap(temps[1], mode='w+', dtype=np.uint8, shape=packed)
+        # A new file reads as zeros, so only each tune's own bars and ticks are written
+        for x, (n, t) in enumerate(zip(notes, timing)):
+            b, k = np.shape(n)
+            pitch[x, :b, :k] = n
+            starts = np.zeros((b, ticks), dtype=bool)
+            starts[:, :k] = np.asarray(t) > 0
+            onsets[x, :b] = np.packbits(starts, axis=-1)
+        pitch.flush()
+        onsets.flush()
+        del pitch, onsets
+        os.replace(temps[0], pitch_file)
+        os.replace(temps[1], onset_file)
+    finally:
+        for temp in temps:
+            if os.path.exists(temp): os.remove(temp)
+
+    meta = {'version': VERSION, 'shape': list(shape), 'onset_shape': list(packed), 'dtype': dtype.name,
+            'bar_subdivision': bar_subdivision, 'ticks': ticks, 'bars': bars,
+            'ids': [str(i) for i in (range(len(notes)) if ids is None else ids)],
+            'pitch': os.path.basename(pitch_file), 'onsets': os.path.basename(onset_file)}
+    with open(sidecar + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(sidecar + '.tmp', sidecar)
+    return meta
+
+
+def save_frame(fname, df, bar_subdivision=None, key='setting'):
+    """
+    Saves the 'notes' and 'timing' columns of a frame from Vectorizer.vectorize_frame.
+    """
+    ids = df[key].tolist() if key in df else None
+    return save(fname, df['notes'].tolist(), df['timing'].tolist(), ids, bar_subdivision)
+# endregion WRITING
+
+
+# region READING
+def load_meta(fname):
+    with open(paths(fname)[2]) as f:
+        return json.load(f)
+
+
+def load(fname, mmap_mode='r'):
+    """
+    :param fname: The path the files are named after, without an extension
+    :param mmap_mode: Passed to np.load, None reads the arrays into memory
+    :return: A Tensor of the pitch array, the packed onset array and the sidecar
+    """
+    pitch_file, onset_file, _ = paths(fname)
+    meta = load_meta(fname)
+    return Tensor(np.load(pitch_file, mmap_mode=mmap_mode), np.load(onset_file, mmap_mode=mmap_mode), meta)
+
+
+def unpack_onsets(packed, ticks):
+    """
+    :param packed: Any slice of the onset array, such as a batch of tunes
+    :param ticks: The number of ticks in a bar, from the sidecar
+    :return: The onsets as a uint8 array of 0s and 1s, one entry per tick
+    """
+    return np.unpackbits(np.asarray(packed), axis=-1, count=ticks)
+
+
+def tune(tensor, x):
+    """
+    :return: The note and timing vectors of a single tune, without its padding
+    """
+    bars = tensor.meta['bars'][x]
+    ticks = tensor.meta['ticks']
+    return (np.asarray(tensor.pitch[x, :bars], dtype=np.int64),
+            unpack_onsets(tensor.onsets[x, :bars], ticks).astype(np.int64))
+
+
+def histogram_percentile(histogram, low, q):
+    """
+    :param histogram: The count of each pitch, starting from low
+    :param low: The pitch the histogram starts at
+    :return: The q-th percentile of the counted pitches, as np.percentile would find it
+    """
+    values = np.arange(len(histogram)) + low
+    cumulative = np.cumsum(histogram)
+    if not cumulative[-1]: return 0.0
+    # The linear interpolation between the two values around the rank, as np.percentile does
+    rank = q / 100 * (cumulative[-1] - 1)
+    below = values[np.searchsorted(cumulative, np.floor(rank), side='right')]
+    above = values[np.searchsorted(cumulative, np.ceil(rank), side='right')]
+    return float(below + (above - below) * (rank - np.floor(rank)))
+
+
+class Reader:
+    """
+    A tensor opened for reading in batches. The arrays stay mapped, and each batch only reads its own tunes.
+    :param fname: The path the files are named after, without an extension
+    :param seed: The seed of the random batches
+    :param transform: A function applied to every batch served by sample and batches, such as an Augment.Transpose
+    """
+
+    def __init__(self, fname, seed=None, mmap_mode='r', transform=None):
+        self.tensor = load(fname, mmap_mode)
+        self.ticks = self.tensor.meta['ticks']
+        self.transform = transform
+        self.rng = np.random.RandomState(seed)
+        self.histogram = None
+
+    def __len__(self):
+        return self.tensor.pitch.shape[0]
+
+    @property
+    def shape(self):
+        return tuple(self.tensor.pitch.shape)
+
+    def take(self, indices):
+        """
+        Reads the tunes in indices, in order through the file so it is read sequentially.
+        :param indices: The numbers of the tunes to read
+        :return: The pitches [len(indices), bars, ticks] and onsets of the same shape, in the order of indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError('Tune indices must be from 0 to {}'.format(len(self) - 1))
+        order = np.argsort(indices, kind='stable')
+        pitch = np.empty((len(indices),) + self.shape[1:], dtype=self.tensor.pitch.dtype)
+        onsets = np.empty((len(indices),) + self.shape[1:], dtype=np.uint8)
+        pitch[order] = self.tensor.pitch[indices[order]]
+        onsets[order] = unpack_onsets(self.tensor.onsets[indices[order]], self.ticks)
+        return pitch, onsets
+
+    def serve(self, indices):
+        batch = self.take(indices)
+        return self.transform(*batch) if self.transform else batch
+
+    def sample(self, batch_size):
+        """
+        :return: A batch of random tunes, drawn with replacement as np.random.randint would
+        """
+        return self.serve(self.rng.randint(0, len(self), batch_size))
+
+    def batches(self, batch_size, shuffle=True, drop_last=False):
+        """
+        Yields every tune once, in batches.
+        :param shuffle: Flag to shuffle the tunes, otherwise they are in the order they were written
+        :param drop_last: Flag to leave out the last batch if it is smaller than batch_size
+        :return: A generator of (pitch, onsets) batches
+        """
+        order = self.rng.permutation(len(self)) if shuffle else np.arange(len(self))
+        for start in range(0, len(self), batch_size):
+            indices = order[start:start + batch_size]
+            if drop_last and len(indices) < batch_size: return
+            yield self.serve(indices)
+
+    def percentile(self, q):
+        """
+        Counts the pitches HISTOGRAM_TUNES tunes at a time the first time it is called.
+        :return: The q-th percentile of every pitch in the tensor, along with its 0 padding,
+        as np.percentile would find it
+        """
+        low = np.iinfo(self.tensor.pitch.dtype).min
+        if self.histogram is None:
+            self.histogram = np.zeros(256, dtype=np.int64)
+            for start in range(0, len(self), HISTOGRAM_TUNES):
+                block = np.asarray(self.tensor.pitch[start:start + HISTOGRAM_TUNES], dtype=np.int64)
+                self.histogram += np.bincount((block - low).ravel(), minlength=256)
+        return histogram_percentile(self.histogram, low, q)
+# endregion READING
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:]:
+        tensor = load(name)
+        print('{}: {} pitches, {}, {} bytes of onsets'.format(name, tensor.pitch.shape, tensor.pitch.dtype,
+                                                              tensor.onsets.nbytes))
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.Generation.Vectorizing import Tensor
+
+
+class TestTensor(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.folder.name, 'tunes')
+        rng = np.random.RandomState(0)
+        self.notes = [rng.randint(-5, 90, size=(4, 16)), rng.randint(60, 80, size=(2, 16)), np.zeros((3, 12), int)]
+        self.timing = [rng.randint(0, 2, size=n.shape) for n in self.notes]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_round_trip(self):
+        meta = Tensor.save(self.fname, self.notes, self.timing, ids=['7', '8', '9'], bar_subdivision=16)
+        self.assertEqual(([3, 4, 16], [3, 4, 2], 'int8', [4, 2, 3]),
+                         (meta['shape'], meta['onset_shape'], meta['dtype'], meta['bars']))
+        tensor = Tensor.load(self.fname)
+        self.assertIsInstance(tensor.pitch, np.memmap)
+        self.assertEqual((np.int8, ['7', '8', '9'], 16), (tensor.pitch.dtype, tensor.meta['ids'],
+                                                          tensor.meta['bar_subdivision']))
+        for x, (n, t) in enumerate(zip(self.notes, self.timing)):
+            notes, timing = Tensor.tune(tensor, x)
+            np.testing.assert_array_equal(n, notes[:, :n.shape[1]])
+            np.testing.assert_array_equal(t, timing[:, :n.shape[1]])
+        # The padding is zeros
+        self.assertEqual(0, np.abs(tensor.pitch[1, 2:]).sum() + tensor.pitch[2, :, 12:].sum())
+        self.assertEqual(0, Tensor.unpack_onsets(tensor.onsets[1:], 16)[0, 2:].sum())
+
+    def test_reader(self):
+        Tensor.save(self.fname, self.notes, self.timing)
+        reader = Tensor.Reader(self.fname, seed=0)
+        self.assertIsInstance(reader.tensor.pitch, np.memmap)
+        self.assertEqual((3, 4, 16), reader.shape)
+
+        # In the order asked for, with repeats
+        indices = [2, 0, 2, 1]
+        pitch, onsets = reader.take(indices)
+        for row, x in enumerate(indices):
+            bars, ticks = self.notes[x].shape
+            np.testing.assert_array_equal(self.notes[x], pitch[row, :bars, :ticks])
+            np.testing.assert_array_equal(self.timing[x], onsets[row, :bars, :ticks])
+        with self.assertRaises(IndexError):
+            reader.take([3])
+
+        self.assertEqual((5, 4, 16), reader.sample(5)[0].shape)
+        self.assertEqual([2, 1], [len(p) for p, _ in reader.batches(2)])
+        # The transform is applied to every batch served
+        shifted = Tensor.Reader(self.fname, seed=1, transform=lambda p, o: (p + 1, o))
+        np.testing.assert_array_equal(Tensor.Reader(self.fname, seed=1).sample(4)[0] + 1, shifted.sample(4)[0])
+
+        whole = np.load(self.fname + Tensor.PITCH)
+        with mock.patch.object(Tensor, 'HISTOGRAM_TUNES', 2):
+            for q in [0, 5, 50, 95, 100]:
+                self.assertAlmostEqual(np.percentile(whole, q), Tensor.Reader(self.fname).percentile(q))
+
+    def test_dtype(self):
+        self.assertEqual(np.uint8, Tensor.pitch_dtype(0, 200))
+        with self.assertRaises(ValueError):
+            Tensor.pitch_dtype(-1, 200)
+        with self.assertRaises(ValueError):
+            Tensor.save(self.fname, self.notes[:1], [np.zeros((4, 8))])
+
+    def test_frame(self):
+        df = pd.DataFrame({'setting': [3, 4], 'notes': self.notes[:2], 'timing': self.timing[:2]})
+        Tensor.save_frame(self.fname, df, 16)
+        self.assertEqual(['3', '4'], Tensor.load_meta(self.fname)['ids'])
+        self.assertEqual(['tunes.json', 'tunes_Onsets.npy', 'tunes_Pitch.npy'], sorted(os.listdir(self.folder.name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
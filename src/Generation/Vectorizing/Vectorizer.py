@@ -6,6 +6,8 @@ import numpy as np
 import pandas as pd
 import re
 
+from src.Generation.Cleaning import NoteArray
+
 # Constants
 BAR_SUBDIVISION = 48
 NOTE_MULT = BAR_SUBDIVISION // 8  # value to multiply an 8th note by
@@ -67,15 +69,17 @@ def vectorize_frame(df, bar_subdivision=48, reindex=True, pad_bars=True):
     """
     Takes a pandas dataframe and returns it with 2 new columns appended for notes and timing
     bar_subdivision controls how many 'ticks' a bar is split into
-    :param df: pandas dataframe with an 'abc' column
+    :param df: pandas dataframe with an 'abc' column, or a 'note_array' column of the NoteArrays from
+    Cleaner.clean_notes, which are used instead of parsing the abc strings again
     """
     global BAR_SUBDIVISION, NOTE_MULT, PAD_BARS
     BAR_SUBDIVISION = bar_subdivision
     NOTE_MULT = bar_subdivision // 8
     PAD_BARS = pad_bars
     df['notes'], df['timing'] = zip(*df.apply(vectorize_abc, axis=1))
-    # TODO - Multiply the spots with 0's by 0, and everything else by 1
-    df['notes'] = (df['notes'] - df['mode'].map(transpose_tune) + TRANSPOSE_OFFSET)
+    # The rests and padding are 0, and stay 0 whatever key the tune is moved from
+    df['notes'] = pd.Series([transpose_notes(notes, TRANSPOSE_OFFSET - transpose_tune(mode))
+                             for notes, mode in zip(df['notes'], df['mode'])], index=df.index, dtype=object)
     if reindex: df.reset_index(drop=True, inplace=True)
     return df
 
@@ -85,15 +89,81 @@ def vectorize_abc(df):
     takes an abc string and returns the note vector and timing vector, split by bars
     """
 
-    abc_string = df['abc']
     accs, mod = get_sharps_or_flats(df['mode'])
+    if isinstance(df.get('note_array'), NoteArray.NoteArray): return vectorize_note_array(df['note_array'], accs, mod)
+
+    abc_string = df['abc']
     note_out = []
     time_out = []
     for bar in split_by_bar(abc_string):
         note, time = vectorize_bar(bar, accs, mod)
         note_out.append(note)
         time_out.append(time)
-    return np.array(note_out), np.array(time_out)
+    return stack_bars(note_out), stack_bars(time_out)
+
+
+def vectorize_note_array(notes, accs, mod):
+    """
+    Takes a NoteArray and returns the note vector and timing vector, split by bars, just as vectorize_abc does
+    """
+    explicit = notes.accidental != NoteArray.NO_ACCIDENTAL
+    in_key = np.isin(notes.pitch % 12, [chars_as_num[c] % 12 for c in accs]) & ~explicit & \
+        (notes.pitch != NoteArray.REST)
+    values = notes.pitch.astype(np.int64) + np.where(explicit, notes.accidental, 0) + in_key * mod
+    reps, remainder = np.divmod(NOTE_MULT * notes.num.astype(np.int64), notes.den)
+
+    note_out = []
+    time_out = []
+    starts = notes.bar_starts()
+    for start, end in zip(starts[:-1], starts[1:]):
+        note, time = vectorize_bar_array(values[start:end], reps[start:end], remainder[start:end])
+        note_out.append(note)
+        time_out.append(time)
+    return stack_bars(note_out), stack_bars(time_out)
+
+
+def transpose_notes(notes, shift):
+    """
+    Shifts the pitches of a tune's note vector by a number of semitones, leaving the rests and padding at 0
+    """
+    if notes.dtype == object: return stack_bars([transpose_notes(bar, shift) for bar in notes])
+    return np.where(notes != 0, notes + shift, 0)
+
+
+def stack_bars(bars):
+    """
+    Stacks the vectors of a tune's bars into a 2D array. When a bar was cut short and they differ in length,
+    they are kept as a 1D array of objects instead, which later stages drop as unshaped.
+    """
+    if len(set(map(len, bars))) <= 1: return np.array(bars)
+    stacked = np.empty(len(bars), dtype=object)
+    for x, bar in enumerate(bars): stacked[x] = bar
+    return stacked
+
+
+def vectorize_bar_array(values, reps, remainder, pad_bars=True):
+    """
+    Takes the pitches of a bar's notes and the number of ticks each one lasts, and returns the same
+    bar as vectorize_bar does
+    """
+    # A note which doesn't fall on a tick cuts the bar short
+    uneven = np.flatnonzero(remainder)
+    if len(uneven):
+        values, reps = values[:uneven[0]], reps[:uneven[0]]
+    note_out = np.repeat(values, reps)
+    time_out = np.zeros(len(note_out), dtype=np.int64)
+    time_out[np.cumsum(reps) - reps] = 1
+    if len(uneven): return note_out, time_out
+
+    # zero padding
+    pad_num = BAR_SUBDIVISION - len(note_out)
+    if pad_bars and pad_num > 0:
+        pad = np.zeros(pad_num, dtype=np.int64)
+        if len(values) < 4:
+            note_out, time_out = np.concatenate([note_out, pad]), np.concatenate([time_out, pad])
+        else:
+            note_out, time_out = np.concatenate([pad, note_out]), np.concatenate([pad, time_out])
+    return note_out, time_out
 
 
 def split_by_bar(abc_string):
@@ -193,7 +263,8 @@ def note_to_number(abc_note, accs, mod):
 
 
 if __name__ == '__main__':
-    from Data.Clean.Common_Time import tunes as tunes_raw
+    from src.Generation.Cleaning import TuneStore
+    tunes_raw = TuneStore.read_dict('Data/Clean/Common_Time' + TuneStore.EXTENSION)
     print('Creating dataframe...')
     tunes = pd.DataFrame.from_dict(tunes_raw, orient='index')
     tunes['abc_raw'] = tunes.abc # preserve the original abc strings
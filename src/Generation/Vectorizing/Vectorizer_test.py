@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.Generation.Cleaning import NoteArray
+from src.Generation.Vectorizing import Vectorizer
+
+
+class TestVectorizer(unittest.TestCase):
+
+    def test_ragged_bars(self):
+        # The F/4 doesn't fall on a tick, so the second bar is cut short and left unpadded
+        tune = {'mode': 'Dmajor', 'abc': 'A2FAA2dB|A2FAF/4E|defdedBd||'}
+        accs, mod = Vectorizer.get_sharps_or_flats(tune['mode'])
+        for notes, timing in [Vectorizer.vectorize_abc(tune),
+                              Vectorizer.vectorize_note_array(NoteArray.from_abc(tune['abc']), accs, mod)]:
+            self.assertEqual(((3,), object), (notes.shape, notes.dtype))
+            self.assertEqual([48, 24, 48], [len(bar) for bar in notes])
+            self.assertEqual([48, 24, 48], [len(bar) for bar in timing])
+
+        notes, timing = Vectorizer.vectorize_abc(dict(tune, abc='A2FAA2dB|defdedBd||'))
+        self.assertEqual((2, 48), notes.shape)
+
+    def vectorize_frame(self, df, bar_subdivision):
+        # vectorize_frame sets the module's subdivision for the rest of the run, which the other tests don't expect
+        with mock.patch.multiple(Vectorizer, BAR_SUBDIVISION=Vectorizer.BAR_SUBDIVISION, NOTE_MULT=Vectorizer.NOTE_MULT,
+                                 PAD_BARS=Vectorizer.PAD_BARS):
+            return Vectorizer.vectorize_frame(df, bar_subdivision=bar_subdivision)
+
+    def test_rests(self):
+        # G major is moved up 7 semitones to D, but its rests and padding stay 0
+        df = pd.DataFrame({'mode': ['Gmajor', 'Dmajor'], 'abc': ['GABcz2d2|GABcd2|', 'GABcz2d2|GABcd2|']})
+        g, d = self.vectorize_frame(df, 16)['notes']
+        self.assertEqual([74, 76, 78, 79, 0, 0, 81, 81], g[0, ::2].tolist())
+        self.assertEqual([0, 0, 74, 76, 78, 79, 81, 81], g[1, ::2].tolist())
+        np.testing.assert_array_equal(d == 0, g == 0)
+        np.testing.assert_array_equal(g[g != 0], d[d != 0] + 7)
+
+        # Bars cut short are shifted the same way
+        df = pd.DataFrame({'mode': ['Gmajor'], 'abc': ['GABcz2d2|GAF/4E|']})
+        notes = self.vectorize_frame(df, 16)['notes'][0]
+        self.assertEqual([[74, 76, 78, 79, 0, 0, 81, 81], [74, 76]], [bar[::2].tolist() for bar in notes])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,14 @@
-from Data.Raw import The_Session_Raw as raw
-from src.Generation.Cleaning import Stats, Generate_Files
-from src.Generation.Vectorizing import Vectorizer
+from src.Generation.Cleaning import Stats, Generate_Files, Cache, Catalog, Cleaner, Profiler, Ingest, TuneStore
+from src.Generation.Cleaning import Duration, Lexer, NoteArray
+from src.Generation.Vectorizing import Vectorizer, Dedup, Shards, Tensor
+from src.Generation import Pipeline
+import argparse
 import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
 
-# Flag for whether to update the Tunes_raw.py file from the session's github.
+# Flag for whether to update the raw tune store from the session's github.
 # If true, the Raw Data will update, if false, the Data won't update.
 UPDATE_RAW = False
 
@@ -16,15 +17,47 @@ FOLDER_NAME = '../../Data'
 ABC_OUT = '/Clean/'
 STATS_OUT = '/Statistics/'
 NPY_OUT = '/Vectors/'
+CACHE_OUT = '/Cache/'
 FILE_NAME = 'June_Fixes'
 
 
 TYPES = []
+# The cleaner handles any meter, add '6/8', '9/8' and '2/4' to take in jigs, slip jigs and polkas.
 METER = ['4/4']
 MODES = ['Dmajor', 'Gmajor', 'Amajor', 'Cmajor', 'Emajor', 'Fmajor']
+# The scales to take tunes in any key of, such as ['major'] for every major key.
+SCALES = []
 
 BAR_SUBDIVISION = 16
 
+# How to save the vectors: 'dense' writes one [tunes, bars, ticks] array of byte pitches and one of packed onsets,
+# which load with np.load(..., mmap_mode='r'), 'shards' splits them into SHARD_SIZE tunes per file for data sets
+# too large for memory, and 'object' writes the object arrays of each tune's int64 vectors.
+OUTPUT = 'dense'
+SHARD_SIZE = Shards.SHARD_SIZE
+
+# How to collapse settings which vectorize to the same tune: None keeps every tune, 'exact' removes identical
+# vectors, and 'near' also removes ones which share at least DEDUP_THRESHOLD of their runs of notes, which
+# takes longer and can merge different settings of a tune.
+DEDUP = 'exact'
+DEDUP_THRESHOLD = Dedup.THRESHOLD
+
+# The number of processes to clean the tunes with. None uses every core.
+WORKERS = None
+
+# Flag for whether to keep cleaned tunes between runs, so only new or changed tunes are cleaned.
+USE_CACHE = True
+
+# Flag for whether to index the raw tunes, so each subset is found with a query and known rejections are skipped.
+USE_CATALOG = True
+
+# The stages of the pipeline, in order. Each is skipped when its inputs and settings are unchanged since it last ran,
+# so changing BAR_SUBDIVISION only reruns vectorize and stats. Rerun part of the chain with --from and --to.
+STAGES = ['fetch', 'clean', 'vectorize', 'stats']
+
+# Flag for whether to time each cleaning stage, the totals are printed and saved to the statistics folder.
+PROFILE = False
+
 
 def make_folder(f_name):
     if f_name not in os.listdir(os.getcwd()):
@@ -35,7 +68,8 @@ def make_folder(f_name):
             print('Folder "{}" already exists. Skipping creation...'.format(f_name))
 
 
-def raw_to_dict(types=None, meters=None, modes=None, update=False):
+def raw_to_dict(types=None, meters=None, modes=None, scales=None, update=False, workers=1, cache=None, profile=None,
+                catalog=None, fname=None):
     """
     :param types: A list of strings which is checked against the appropriate dict key.
     Skips parsing the tune if it doesn't fit the parameters.
@@ -43,54 +77,160 @@ def raw_to_dict(types=None, meters=None, modes=None, update=False):
     Skips parsing the tune if it doesn't fit the parameters.
     :param modes: A list of strings which is checked against the appropriate dict key.
     Skips parsing the tune if it doesn't fit the parameters.
+    :param scales: A list of scales, such as 'major', to take tunes in any key of. Only used with a catalog.
     :param update: Flag to update the Raw Data from the Session's Github page.
-    :return:
+    :param workers: The number of processes to clean the tunes with. None uses every core.
+    :param cache: An optional Cache.TuneCache holding the results of earlier runs.
+    :param profile: An optional Profiler.StageProfile to record the time spent in each cleaning stage.
+    :param catalog: An optional Catalog.TuneCatalog to find the tunes with, leaving out ones rejected by earlier runs.
+    :param fname: The store to write the cleaned tunes to, clean_file() by default. The NoteArrays of the
+    tunes are written into the same store.
+    :return: The number of tunes cleaned.
     """
 
     # If the update flag is set, retrieve the new Data from the Session.
     if update: Generate_Files.update_tunes()
 
-    # Sort the tunes and hand it to the cleaning function.
-    clean = Generate_Files.create_dict_list(raw.tunes, types=types, meters=meters, modes=modes)
+    # Read only the tunes which fit the parameters out of the store a batch at a time, and hand them to the cleaning
+    # function.
+    if catalog is not None:
+        catalog.update(Ingest.RAW_STORE)
+        rows = catalog.select(types=types, meters=meters, modes=modes, scales=scales, skip_rejected=True)
+        raw = TuneStore.stream(Ingest.RAW_STORE, TuneStore.TUNE_COLUMNS, rows)
+    else:
+        raw = TuneStore.stream(Ingest.RAW_STORE, TuneStore.TUNE_COLUMNS, type=types, meter=meters, mode=modes)
+    clean = Generate_Files.clean_dicts(raw, types=types, meters=meters, modes=modes,
+                                        workers=workers, cache=cache, profile=profile, catalog=catalog, notes=True)
+
+    # Write each batch of cleaned tunes to the store as soon as it is cleaned.
+    fname = fname or clean_file()
+    return Generate_Files.dicts_to_file(clean, fname, notes=True)
+
 
-    # Generate the stats of the cleaned tunes and save them. Has a small check to prevent a file-out error.
-    Generate_Files.dicts_to_file(clean, FOLDER_NAME + ABC_OUT + FILE_NAME + '.py')
+def clean_file():
+    return FOLDER_NAME + ABC_OUT + FILE_NAME + TuneStore.EXTENSION
 
-    tunes = dict()
-    for x in clean: tunes[x['setting']] = x
+
+def read_clean(fname=None, **filters):
+    """
+    Reads the cleaned tunes which pass the filters, as TuneStore.read_dict does, each with its NoteArray under
+    'note_array' so the vectorizer doesn't parse the abc again. Tunes without one are vectorized from the abc.
+    :param fname: The store of cleaned tunes, clean_file() by default
+    """
+    with TuneStore.TuneStore(fname or clean_file()) as store:
+        rows = store.select(**filters) if filters else None
+        tunes = store.to_dict(rows=rows)
+        # Stores written by older runs don't hold the NoteArrays
+        if not set(NoteArray.STORE_ARRAYS).issubset(store.arrays): return tunes
+        for setting, array in zip(store.column('setting', rows), NoteArray.from_store(store, rows)):
+            if array is not None: tunes[setting]['note_array'] = array
     return tunes
 
 
-def raw_abc_to_npy_file(update=False):
-    make_folder(FOLDER_NAME)
-    make_folder(FOLDER_NAME + ABC_OUT)
-    make_folder(FOLDER_NAME + STATS_OUT)
-    make_folder(FOLDER_NAME + NPY_OUT)
+def vector_files(fname=None, output=None):
+    """
+    :param fname: The path to name the vector files after, the vectors folder and FILE_NAME by default
+    :param output: The OUTPUT mode, OUTPUT by default
+    :return: The paths of the files save_vectors writes
+    """
+    fname, output = fname or FOLDER_NAME + NPY_OUT + FILE_NAME, output or OUTPUT
+    if output == 'dense': return list(Tensor.paths(fname))
+    if output == 'shards': return [os.path.join(fname + '_Shards', Shards.MANIFEST)]
+    return [fname + '_Notes.npy', fname + '_Time.npy']
+
+
+def duplicates_file():
+    return FOLDER_NAME + STATS_OUT + FILE_NAME + '_Duplicates.json'
 
-    print('Starting abc cleaning...')
-    # TODO - Using the dictionary provided by the raw_to_dict function causes the numpy array to throw an error.
-    tunes = raw_to_dict(update=update, types=TYPES, meters=METER, modes=MODES)
 
+def clean(types=None, meters=None, modes=None, scales=None, fname=None, name=None):
+    """
+    Cleans the tunes which fit the parameters, each TYPES, METER, MODES and SCALES by default, into a store.
+    :param fname: The store to write to, clean_file() by default
+    :param name: The name the profile is saved under, FILE_NAME by default
+    """
+    print('Starting abc cleaning...')
+    cache = Cache.TuneCache(FOLDER_NAME + CACHE_OUT + 'Cleaned_Tunes.sqlite') if USE_CACHE else None
+    profile = Profiler.StageProfile() if PROFILE else None
+    catalog = Catalog.TuneCatalog(FOLDER_NAME + CACHE_OUT + 'Catalog.sqlite') if USE_CATALOG else None
+    raw_to_dict(types=TYPES if types is None else types, meters=METER if meters is None else meters,
+                modes=MODES if modes is None else modes, scales=SCALES if scales is None else scales,
+                workers=WORKERS, cache=cache, profile=profile, catalog=catalog, fname=fname)
+    if profile:
+        profile.print_table()
+        profile.to_json(FOLDER_NAME + STATS_OUT + (name or FILE_NAME) + '_Profile.json')
+    if cache:
+        Cache.print_stats(cache.stats())
+        cache.close()
+    if catalog is not None: catalog.close()
     print('Finished abc cleaning.')
-    print('Starting vectorization process.')
-    from Data.Clean.Major_Tunes import tunes as tunes_raw
+
+
+def tunes_frame(tunes_raw):
     print('Creating dataframe...')
     tunes = pd.DataFrame.from_dict(tunes_raw, orient='index')
+    # Kept as objects, so pandas doesn't split the NoteArrays into their fields
+    if 'note_array' in tunes: tunes['note_array'] = pd.Series([t.get('note_array') for t in tunes_raw.values()],
+                                                               index=tunes.index, dtype=object)
     tunes['abc_raw'] = tunes.abc # preserve the original abc strings
-    tunes = tunes[tunes['abc_raw'].str.count('|') != 17]
+    return tunes[tunes['abc_raw'].str.count('|') != 17]
 
-    tunesList = list(tunes['abc_raw'])
-
-    with open('./abcTunes.txt', 'w') as f:
-        for item in tunesList:
-            f.write("%s\n" % item)
 
-    tunes = Vectorizer.vectorize_frame(tunes, pad_bars=True, bar_subdivision=BAR_SUBDIVISION)
+def vectorize_tunes(tunes, bar_subdivision=None, dedup=None, threshold=None, report_file=None):
+    """
+    Vectorizes a frame of cleaned tunes and removes the ones which don't come out as [bars, ticks] arrays.
+    :param tunes: A frame from tunes_frame
+    :param bar_subdivision: BAR_SUBDIVISION by default
+    :param dedup: The DEDUP mode, DEDUP by default
+    :param threshold: DEDUP_THRESHOLD by default
+    :param report_file: The file to save the report of the duplicates to, duplicates_file() by default
+    :return: The vectorized frame, and the frame of the tunes which are kept
+    """
+    bar_subdivision = bar_subdivision or BAR_SUBDIVISION
+    dedup = DEDUP if dedup is None else dedup
+    tunes = Vectorizer.vectorize_frame(tunes, pad_bars=True, bar_subdivision=bar_subdivision)
 
     print("Size of Initial Frame: {}".format(len(tunes.index)))
     tunes_shaped = tunes[[len(tune.shape)==2 for tune in tunes.notes]].copy()
     print("Size of Cleaned Frame: {}".format(len(tunes_shaped.index)))
     tunes_shaped.reset_index(drop=True, inplace=True)
+    if dedup:
+        tunes_shaped, report = Dedup.dedup_frame(tunes_shaped, near=dedup == 'near',
+                                                 threshold=DEDUP_THRESHOLD if threshold is None else threshold)
+        Dedup.print_report(report)
+        Dedup.save_report(report, report_file or duplicates_file())
+        print("Size of Deduplicated Frame: {}".format(len(tunes_shaped.index)))
+    return tunes, tunes_shaped
+
+
+def save_vectors(tunes_shaped, fname=None, output=None, bar_subdivision=None, shard_size=None):
+    """
+    Saves the vectors of a frame to the files from vector_files, with the same defaults.
+    """
+    files = vector_files(fname, output)
+    output, bar_subdivision = output or OUTPUT, bar_subdivision or BAR_SUBDIVISION
+    if output == 'dense':
+        Tensor.save_frame(files[0][:-len(Tensor.PITCH)], tunes_shaped, bar_subdivision)
+    elif output == 'shards':
+        Shards.save_frame(os.path.dirname(files[0]), tunes_shaped, bar_subdivision, shard_size or SHARD_SIZE)
+    else:
+        np.save(files[0], tunes_shaped.notes.values)
+        np.save(files[1], tunes_shaped.timing.values)
+
+
+def vectorize():
+    # Only needed for the sample plot, so the sweep's workers don't need it
+    import matplotlib.pyplot as plt
+    print('Starting vectorization process.')
+    tunes = tunes_frame(read_clean())
+
+    tunesList = list(tunes['abc_raw'])
+
+    with open('./abcTunes.txt', 'w') as f:
+        for item in tunesList:
+            f.write("%s\n" % item)
+
+    tunes, tunes_shaped = vectorize_tunes(tunes)
     print('\n - - - - - - - Table Data - - - - - - - \n')
     print(tunes_shaped.head()['notes'])
     print(" ")
@@ -99,14 +239,76 @@ def raw_abc_to_npy_file(update=False):
     plt.show()
     print(" ")
 
-    np.save(FOLDER_NAME + NPY_OUT + FILE_NAME + '_Notes.npy', tunes_shaped.notes.values)
-    np.save(FOLDER_NAME + NPY_OUT + FILE_NAME + '_Time.npy', tunes_shaped.timing.values)
+    save_vectors(tunes_shaped)
+
 
+def stats():
     print("Generating statistical model of tunes...")
-    stats = Stats.StatsHandler(FILE_NAME)
-    stats.save_stats_to_file()
+    handler = Stats.StatsHandler(FILE_NAME)
+    handler.save_stats_to_file()
+
+
+def clean_sources():
+    """
+    :return: The source files of the code the clean stage runs, whose changes make it run again
+    """
+    return [module.__file__ for module in [Cleaner, Lexer, Duration, NoteArray, Generate_Files, TuneStore, Catalog]] + \
+        [__file__]
+
+
+def vectorize_sources():
+    """
+    :return: The source files of the code the vectorize stage runs, whose changes make it run again
+    """
+    return [module.__file__ for module in [Vectorizer, Dedup, Tensor, Shards]] + [__file__]
+
+
+def stages(update=False):
+    """
+    :param update: Flag to fetch the raw tunes from the Session's Github page first
+    :return: The list of Pipeline.Stages which turn the raw tunes into vectors and statistics
+    """
+    # The fetch asks the Session whether the tunes changed, so it runs every time and only rewrites the store if so
+    fetch = Pipeline.Stage('fetch', Generate_Files.update_tunes, outputs=[Ingest.RAW_STORE], always=True)
+    return ([fetch] if update else []) + [
+        Pipeline.Stage('clean', clean,
+                       inputs=[Ingest.RAW_STORE] + clean_sources(),
+                       outputs=[clean_file()],
+                       params={'types': TYPES, 'meters': METER, 'modes': MODES, 'scales': SCALES}),
+        Pipeline.Stage('vectorize', vectorize,
+                       inputs=[clean_file()] + vectorize_sources(),
+                       outputs=vector_files() + ([duplicates_file()] if DEDUP else []),
+                       params={'bar_subdivision': BAR_SUBDIVISION, 'dedup': DEDUP, 'dedup_threshold': DEDUP_THRESHOLD,
+                               'output': OUTPUT, 'shard_size': SHARD_SIZE if OUTPUT == 'shards' else None}),
+        Pipeline.Stage('stats', stats,
+                       inputs=[clean_file(), vector_files()[0], Stats.__file__],
+                       outputs=[FOLDER_NAME + STATS_OUT + FILE_NAME + '.txt'])]
+
+
+def raw_abc_to_npy_file(update=False, start=None, stop=None, force=False):
+    """
+    Runs the stages from the raw tunes to the vectors, skipping the ones whose inputs and settings haven't changed.
+    :param update: Flag to fetch the raw tunes from the Session's Github page first
+    :param start: The name of the stage to rerun from, the earlier stages are left as they are
+    :param stop: The name of the last stage to run
+    :param force: Flag to rerun every stage
+    """
+    make_folder(FOLDER_NAME)
+    make_folder(FOLDER_NAME + ABC_OUT)
+    make_folder(FOLDER_NAME + STATS_OUT)
+    make_folder(FOLDER_NAME + NPY_OUT)
+    make_folder(FOLDER_NAME + CACHE_OUT)
+
+    Pipeline.run(stages(update), FOLDER_NAME + CACHE_OUT + FILE_NAME + '_Pipeline.json', start, stop, force)
     print("Process finished.")
 
 
 if __name__ == '__main__':
-    raw_abc_to_npy_file()
+    parser = argparse.ArgumentParser(description='Cleans, vectorizes and summarizes the raw tunes.')
+    parser.add_argument('--from', dest='start', choices=STAGES, help='The stage to rerun from')
+    parser.add_argument('--to', dest='stop', choices=STAGES, help='The last stage to run')
+    parser.add_argument('--force', action='store_true', help='Rerun every stage, even if up to date')
+    parser.add_argument('--update', action='store_true', default=UPDATE_RAW,
+                        help='Fetch the raw tunes from the Session first')
+    args = parser.parse_args()
+    raw_abc_to_npy_file(args.update, args.start, args.stop, args.force)
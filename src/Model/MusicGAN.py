@@ -4,11 +4,39 @@ from keras import models
 from keras.layers.advanced_activations import LeakyReLU
 import numpy as np
 import matplotlib.pyplot as plt
+from src.Generation.Vectorizing import Tensor
+
+
+def pad(data):
+    return np.pad(data, [[0, 0], [0, 1], [4, 4], [0, 0]], mode='wrap')  # pad bottom once, and 4 notes each side
+
+
+def normalize(arr, minVal, maxVal):
+    return -1 + 2 * (arr - minVal) / (maxVal - minVal)  # Mapped to [-1,1]
+
+
+def load_data(fname, seed=None, transform=None):
+    """
+    Opens the tunes saved by Tensor.save for training. The arrays stay mapped, and only the tunes of each batch
+    are read, then padded and normalized by the GAN, so the whole data set is never copied into memory.
+    :param fname: The path the tensor's files are named after, such as '../../Data/Vectors/June_Fixes'
+    :param seed: The seed of the random batches
+    :param transform: A function applied to every batch, such as an Augment.Transpose
+    :return: A Tensor.Reader, to pass to the GAN as its dataset
+    """
+    return Tensor.Reader(fname, seed=seed, transform=transform)
 
 
 class GAN():
-    def __init__(self, paddedData, data, presentation=False):
+    def __init__(self, paddedData=None, data=None, presentation=False, dataset=None):
+        """
+        :param paddedData: The padded training data, as a [tunes, bars, ticks, 2] array held in memory
+        :param data: The training data without padding
+        :param dataset: A Tensor.Reader, as from load_data, or a Shards.ShardReader to draw the batches from instead,
+        for data sets larger than memory. Its transform, such as an Augment.Transpose, is applied to every batch.
+        """
         self.paddedData = paddedData
+        self.dataset = dataset
         self.img_dim = [4 + 1, 64 + (4 * 2)]  # RHS of sum is padding
         self.channels = 1
         self.img_shape = [*self.img_dim, self.channels]
@@ -40,19 +68,34 @@ class GAN():
         self.combined = models.Model(inputs=noise, outputs=valid)
         self.combined.compile(loss='binary_crossentropy', optimizer=optimizer)
 
-        self.normalizedData = self.normalizeData(self.paddedData)
+        if dataset is None:
+            self.normalizedData = self.normalizeData(self.paddedData)
+        else:
+            # The bounds normalizeData finds, from the counts of every pitch in the data set along with its 0 padding.
+            # normalizeData also counts the columns pad wraps around, which these leave out.
+            self.minNote, self.maxNote = dataset.percentile(5), dataset.percentile(95)
 
     def normalizeData(self, data):
-        def normalize(arr, minVal, maxVal):
-            return -1 + 2 * (arr - minVal) / (maxVal - minVal)  # Mapped to [-1,1]
-
         maxNote = np.percentile(data[:, :, :, 0], 95)
         minNote = np.percentile(data[:, :, :, 0], 5)
 
-        normalizedData = np.array(data)
+        # An integer copy would truncate the normalized pitches to -1, 0 and 1
+        normalizedData = np.array(data, dtype=np.float32)
         normalizedData[:,:,:,0] = normalize(normalizedData[:,:,:,0], minNote, maxNote)
         return normalizedData
 
+    def prepare_batch(self, pitch, onsets):
+        """
+        Pads and normalizes a batch from the dataset, as the whole data set is without one.
+        """
+        batch = pad(np.stack([pitch, onsets], axis=-1).astype(np.float32))
+        batch[:, :, :, 0] = normalize(batch[:, :, :, 0], self.minNote, self.maxNote)
+        return batch
+
+    def real_batch(self, X_real, size):
+        if isinstance(X_real, Tensor.Reader): return self.prepare_batch(*X_real.sample(size))
+        return X_real[np.random.randint(0, X_real.shape[0], size)]
+
     def build_generator(self, momentum=0.8, alpha_leak=0.2):
         if(self.presentation):
             print("Building Generator...")
@@ -116,7 +159,7 @@ class GAN():
         if (self.presentation):
             print("Starting GAN Training ...")
 
-        X_train = self.normalizedData
+        X_train = self.normalizedData if self.dataset is None else self.dataset
 
         for iteration in range(iterations + 1):
             for _ in range(1):  # train discriminator more times
@@ -142,8 +185,7 @@ class GAN():
     def train_discriminator(self, X_real, batch_size):
         half_batch = batch_size // 2
 
-        discriminator_indices = np.random.randint(0, X_real.shape[0], half_batch)
-        discriminator_train_imgs = X_real[discriminator_indices]
+        discriminator_train_imgs = self.real_batch(X_real, half_batch)
 
         noise = np.random.normal(0, 1, [half_batch, 100])
         generated_imgs = self.generator.predict(noise)
@@ -178,8 +220,7 @@ class GAN():
         generated_imgs = self.generator.predict(noise)  # [:, :-1, horizontalPad:-horizontalPad,:]
         generated_imgs = 0.5 * generated_imgs + 0.5
 
-        random_real_indices = np.random.randint(0, self.data.shape[0], rows * columns)
-        real_imgs = self.normalizedData[random_real_indices]  # [random_real_indices,:-1, horizontalPad:-horizontalPad, :]
+        real_imgs = self.real_batch(self.normalizedData if self.dataset is None else self.dataset, rows * columns)
         real_imgs = 0.5 * real_imgs + 0.5
 
         def prepare_images(images):